@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+# benchmarks/bench_balance_series.py
+
+""" Daily balance of the fixtures Portfolio: one date at a time vs series
+
+    Usage: python3 -m benchmarks.bench_balance_series [currency] [days]
+"""
+
+import sys
+import time
+from datetime import date, timedelta
+
+from src import rates
+from src.rates import RateCache, RateEngine
+from src.readwrite import read_portfolio_from_file
+from src.utils import Portfolio
+from benchmarks.bench_rate_cache import synthetic_recording
+
+
+def main(currency='USD', days=1826):
+    """ Report time of both ways of getting a daily balance curve """
+
+    portfolio = read_portfolio_from_file('./tests/fixtures.json')
+    portfolio.currency = currency
+    start = date(2017, 1, 1)
+    end = start + timedelta(days=days - 1)
+    rate_engine = rates.set_rate_engine(RateEngine(
+        currencies=Portfolio.CURRENCIES, crypto=Portfolio.CRYPTO,
+        rate_cache=RateCache(path=':memory:'),
+        provider=synthetic_recording(start - timedelta(days=7), days + 7)))
+    portfolio.prefetch_rates(start, end)  # same rates for both runs
+
+    tic = time.perf_counter()
+    balances = [portfolio.get_portfolio_balance(start + timedelta(days=i))
+                for i in range(days)]
+    loop = time.perf_counter() - tic
+
+    tic = time.perf_counter()
+    _, series = portfolio.get_portfolio_balance_series(start, end)
+    vectorized = time.perf_counter() - tic
+
+    error = max(abs(a - b) for a, b in zip(balances, series))
+    print(f"{days} daily balances in {currency}: {loop:.3f}s one date at a"
+          f" time, {vectorized:.4f}s as a series (max difference {error:.2g})")
+    rate_engine.rate_cache.close()
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2], *[int(arg) for arg in sys.argv[2:3]])
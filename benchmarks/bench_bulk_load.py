@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+# benchmarks/bench_bulk_load.py
+
+""" Time to build Item history replaying purchase() or loading in bulk
+
+    Usage: python3 -m benchmarks.bench_bulk_load [transactions ...]
+"""
+
+import sys
+import time
+
+from src.utils import Portfolio
+from tests.test_readwrite import large_portfolio_dict
+
+SIZES = (10000, 100000, 1000000)
+
+# replaying more transactions than this takes too long to measure
+MAX_REPLAY = 100000
+
+
+def new_stock(columnar: bool = False):
+    """ Empty stock Item """
+
+    portfolio = Portfolio(name='Bench', description='Bench', currency='EUR',
+                          columnar=columnar)
+    return portfolio.add_item(category='asset', subcategory='stock',
+                              currency='EUR', name='Stock',
+                              description='Stock')
+
+
+def main(sizes=SIZES):
+    """ Report seconds of each way of loading a ledger """
+
+    for size in sizes:
+        ledger = large_portfolio_dict(size)['item_list'][0]['ledger']
+        timings = []
+        if size <= MAX_REPLAY:
+            item = new_stock()
+            tic = time.perf_counter()
+            for _, data in ledger:
+                item.purchase(**data)
+            timings.append(f"replay {time.perf_counter() - tic:.2f}s")
+        for columnar in (False, True):
+            item = new_stock(columnar)
+            tic = time.perf_counter()
+            item.load_ledger(ledger)
+            name = 'columnar' if columnar else 'bulk'
+            timings.append(f"{name} {time.perf_counter() - tic:.2f}s")
+        print(f"{size:>8} transactions: {', '.join(timings)}")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+# benchmarks/bench_history_lookup.py
+
+""" Time HistoryPoint lookups and back-dated inserts as the history grows
+
+    Both history backends are measured, with the memory used per point.
+
+    Usage: python3 -m benchmarks.bench_history_lookup [lookups]
+"""
+
+import sys
+import time
+import random
+import tracemalloc
+from datetime import date, timedelta
+
+from src.utils import Portfolio
+
+SIZES = (100, 1000, 10000, 100000)
+
+
+def build_item(size: int, columnar: bool = False):
+    """ Item with a HistoryPoint every day starting on 1/1/1800 """
+
+    portfolio = Portfolio(name='Bench', description='Bench', currency='EUR',
+                          columnar=columnar)
+    item = portfolio.add_item(category='asset', subcategory='fund',
+                              currency='EUR', name='Fund',
+                              description='Fund')
+    start = date(1800, 1, 1)
+    for i in range(size):
+        item.update_history(when=start + timedelta(days=i), units_owned=1,
+                            cost_of_purchase=float(i), value_of_asset=float(i))
+    return item
+
+
+def main(lookups=10000):
+    """ Report microseconds per lookup and insert for each history size """
+
+    for columnar in (False, True):
+        print("columnar history:" if columnar else "HistoryPoint history:")
+        rand = random.Random(0)
+        for size in SIZES:
+            tracemalloc.start()
+            item = build_item(size, columnar)
+            memory = tracemalloc.get_traced_memory()[0] / size
+            tracemalloc.stop()
+
+            start = date(1800, 1, 1)
+            dates = [start + timedelta(days=rand.randrange(size))
+                     for _ in range(lookups)]
+            tic = time.perf_counter()
+            for given_date in dates:
+                item.get_hist_pt_by_date(given_date)
+            lookup = (time.perf_counter() - tic) / lookups
+
+            inserts = min(lookups, 1000)
+            tic = time.perf_counter()
+            for given_date in dates[:inserts]:
+                item.insert_history_point(when=given_date, delta_units=0,
+                                          delta_cost=1.0, delta_value=1.0)
+            insert = (time.perf_counter() - tic) / inserts
+
+            print(f"{size:>7} points: {memory:.0f} bytes/point, "
+                  f"{1e6 * lookup:.2f} us/lookup, "
+                  f"{1e6 * insert:.2f} us/back-dated insert")
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
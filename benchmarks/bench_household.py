@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+# benchmarks/bench_household.py
+
+""" Scaling of the household aggregator with the number of processes
+
+    Values the same set of Portfolio files with 1, 2, 4... workers up to
+    the number of CPUs and reports the speedup over a single process.
+
+    Usage: python3 -m benchmarks.bench_household [files] [transactions]
+"""
+
+import os
+import sys
+import time
+import tempfile
+from datetime import date
+
+from src.batch import aggregate_portfolio_files
+from src.readwrite import portfolio_from_dict, save_portfolio_to_file
+from tests.test_readwrite import large_portfolio_dict
+
+
+def main(files=8, transactions=50000):
+    """ Report time and speedup of each number of workers """
+
+    cpus = os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        portfolio = portfolio_from_dict(large_portfolio_dict(transactions))
+        paths = []
+        for i in range(files):
+            paths.append(os.path.join(tmp_dir, f"portfolio{i}.json"))
+            save_portfolio_to_file(portfolio, paths[-1])
+
+        workers = 1
+        single = None
+        while True:
+            tic = time.perf_counter()
+            aggregate_portfolio_files(paths, date(2021, 1, 1),
+                                      date(2021, 12, 31), 'W',
+                                      workers=workers)
+            elapsed = time.perf_counter() - tic
+            single = single or elapsed
+            print(f"{files} files of {transactions} transactions,"
+                  f" {workers:>2} workers: {elapsed:.2f}s,"
+                  f" speedup {single / elapsed:.1f}x")
+            if workers >= cpus:
+                break
+            workers = min(2 * workers, cpus)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+# benchmarks/bench_import_time.py
+
+""" Cold import time of the library, from python3 -X importtime
+
+    Each import runs in a fresh interpreter. Reports the median cumulative
+    time of each module and its slowest imports, and fails if a module
+    that should be deferred is imported.
+
+    Usage: python3 -m benchmarks.bench_import_time [runs]
+"""
+
+import sys
+import statistics
+import subprocess
+
+from tests.test_imports import DEFERRED_MODULES, LIBRARY_MODULES
+
+RUNS = 5
+
+
+def import_times(module: str):
+    """
+    Cumulative microseconds of importing a module, and of each module it
+    imports directly, as {name: microseconds}
+    """
+
+    stderr = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+        check=True, capture_output=True, text=True).stderr
+    entries = []  # (nesting level, name, cumulative), children first
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        level = (len(name) - len(name.lstrip())) // 2
+        entries.append((level, name.strip(), int(cumulative)))
+    names = [name for _, name, _ in entries]
+    index = names.index(module)
+    level, _, total = entries[index]
+    times = {module: total}
+    for child_level, name, cumulative in reversed(entries[:index]):
+        if child_level <= level:
+            break
+        if child_level == level + 1:
+            times[name] = cumulative
+    return times, set(names)
+
+
+def main(runs=RUNS):
+    """ Report each module of the library """
+
+    deferred_loaded = False
+    for module in LIBRARY_MODULES:
+        samples = [import_times(module) for _ in range(runs)]
+        total = statistics.median(times[module] for times, _ in samples)
+        times, imported = samples[-1]
+        slowest = sorted(((name, micros) for name, micros in times.items()
+                          if name != module), key=lambda pair: -pair[1])[:3]
+        print(f"{module:>15}: {total / 1000:6.1f} ms, slowest imports: " +
+              ", ".join(f"{name} {micros / 1000:.1f} ms"
+                        for name, micros in slowest))
+        loaded = [name for name in DEFERRED_MODULES if name in imported]
+        if loaded:
+            deferred_loaded = True
+            print(f"{module:>15}: imports {', '.join(loaded)}, which should"
+                  " be deferred")
+    return 1 if deferred_loaded else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*[int(arg) for arg in sys.argv[1:]]))
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+# benchmarks/bench_lazy_open.py
+
+""" Time to open a Portfolio file, loading every ledger or lazily
+
+    Usage: python3 -m benchmarks.bench_lazy_open [transactions ...]
+"""
+
+import os
+import sys
+import time
+import tempfile
+from datetime import date
+
+from src.readwrite import portfolio_from_dict, read_portfolio_from_file, \
+    save_portfolio_to_file
+from tests.test_readwrite import large_portfolio_dict
+
+SIZES = (10000, 100000, 1000000)
+
+
+def measure(path: str, lazy: bool):
+    """ Seconds to open a file, and to value its Item afterwards """
+
+    tic = time.perf_counter()
+    portfolio = read_portfolio_from_file(path, lazy=lazy)
+    opened = time.perf_counter() - tic
+    portfolio.item_list[0].get_hist_pt_by_date(date(2021, 5, 3))
+    return opened, time.perf_counter() - tic - opened
+
+
+def main(sizes=SIZES):
+    """ Report eager and lazy opening of JSON and .npz files """
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in sizes:
+            portfolio = portfolio_from_dict(large_portfolio_dict(size))
+            for extension in ('.json', '.npz'):
+                path = os.path.join(tmp_dir, f"portfolio{size}{extension}")
+                save_portfolio_to_file(portfolio, path)
+                for lazy in (False, True):
+                    opened, first_use = measure(path, lazy)
+                    print(f"{size:>8} transactions {extension:>5},"
+                          f" {'lazy' if lazy else 'eager':>5}: opened in"
+                          f" {opened:.3f}s, first use {first_use:.3f}s")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+
+# benchmarks/bench_logging.py
+
+""" Loading and valuation cost vs. the cost of rendering an Item
+
+    With lazy logging, load time per transaction and time per valuation
+    stay flat while the time to render the Item with display() grows
+    with its history.
+
+    Usage: python3 -m benchmarks.bench_logging
+"""
+
+import time
+import logging
+from datetime import date, timedelta
+
+from src.readwrite import portfolio_from_dict
+
+SIZES = (100, 1000, 10000)
+
+
+def portfolio_dict_with_ledger(size: int):
+    """ Portfolio dict with one stock Item bought every day since 1/1/1900 """
+
+    start = date(1900, 1, 1)
+    ledger = [('purchase', {'when': start + timedelta(days=i),
+                            'units_purchased': 1, 'unit_price': 10.0,
+                            'fees': 0.0})
+              for i in range(size)]
+    return {'name': 'Bench', 'description': 'Bench', 'currency': 'EUR',
+            'item_list': [{'category': 'asset', 'subcategory': 'stock',
+                           'currency': 'EUR', 'name': 'Stock',
+                           'description': 'Stock', 'ledger': ledger}]}
+
+
+def main():
+    """ Report load, valuation and rendering times for each ledger size """
+
+    logging.getLogger().setLevel(logging.ERROR)
+    for size in SIZES:
+        portfolio_dict = portfolio_dict_with_ledger(size)
+
+        tic = time.perf_counter()
+        portfolio = portfolio_from_dict(portfolio_dict)
+        load = (time.perf_counter() - tic) / size
+
+        tic = time.perf_counter()
+        for i in range(1000):
+            portfolio.get_portfolio_balance(date(1900, 1, 1) +
+                                            timedelta(days=i % size))
+        valuation = (time.perf_counter() - tic) / 1000
+
+        tic = time.perf_counter()
+        portfolio.item_list[0].display()
+        render = time.perf_counter() - tic
+
+        print(f"{size:>6} transactions: load {1e6 * load:.1f} us/transaction,"
+              f" valuation {1e6 * valuation:.1f} us,"
+              f" display() {1e3 * render:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+# benchmarks/bench_rate_cache.py
+
+""" Cold, warm and prefetched valuation of the fixtures Portfolio
+
+    Rates are served by the local stand-in rate server, so the benchmark
+    runs offline and each upstream call is a real HTTP round-trip.
+
+    Usage: python3 -m benchmarks.bench_rate_cache [currency] [days]
+"""
+
+import os
+import sys
+import time
+import tempfile
+from datetime import date, timedelta
+
+from src import rates
+from src.rates import RateCache, RateEngine
+from src.providers import RecordedRateProvider, HttpRateProvider, serve_rates
+from src.readwrite import read_portfolio_from_file
+from src.utils import Portfolio
+
+
+def synthetic_recording(start: date, days: int):
+    """ Recorded provider with made up daily rates """
+
+    recording = RecordedRateProvider(base='EUR')
+    for offset in range(days):
+        drift = 1 + offset / 1000
+        recording.record(start + timedelta(days=offset),
+                         {'USD': 1.18 * drift, 'GBP': 0.86 * drift,
+                          'PLN': 4.55 * drift, 'BTC': 1 / (30000 * drift)})
+    return recording
+
+
+def value_daily(portfolio, start: date, days: int):
+    """ Value the Portfolio once per day, returns elapsed seconds """
+
+    tic = time.perf_counter()
+    for offset in range(days):
+        portfolio.get_portfolio_balance(start + timedelta(days=offset))
+    return time.perf_counter() - tic
+
+
+def main(currency='USD', days=365):
+    """ Report time and upstream calls of each run """
+
+    portfolio = read_portfolio_from_file('./tests/fixtures.json')
+    portfolio.currency = currency
+    start = date(2021, 1, 1)
+    server = serve_rates(synthetic_recording(start - timedelta(days=7),
+                                             days + 7))
+    provider = HttpRateProvider(f"http://127.0.0.1:{server.server_port}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        rate_cache = RateCache(path=os.path.join(tmp_dir, 'rates.sqlite3'))
+        rate_engine = rates.set_rate_engine(RateEngine(
+            currencies=Portfolio.CURRENCIES, crypto=Portfolio.CRYPTO,
+            rate_cache=rate_cache, provider=provider))
+        for run in ('cold', 'warm'):
+            requests = provider.requests
+            elapsed = value_daily(portfolio, start, days)
+            print(f"{run}: {days} valuations in {currency} took "
+                  f"{elapsed:.3f}s with {provider.requests - requests}"
+                  " upstream calls")
+
+        rate_cache.clear()
+        requests = provider.requests
+        tic = time.perf_counter()
+        portfolio.prefetch_rates(start, start + timedelta(days=days - 1))
+        elapsed = time.perf_counter() - tic
+        elapsed += value_daily(portfolio, start, days)
+        print(f"prefetched: {days} valuations in {currency} took "
+              f"{elapsed:.3f}s with {provider.requests - requests}"
+              " upstream calls")
+        rate_cache.close()
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main(*sys.argv[1:2], *[int(arg) for arg in sys.argv[2:3]])
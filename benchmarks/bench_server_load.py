@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+# benchmarks/bench_server_load.py
+
+""" Load test of the valuation server
+
+    Serves the fixtures Portfolio valued in USD from a server process,
+    with rates from the local stand-in rate server, and reports the
+    requests per second and latency of concurrent clients over
+    keep-alive connections: first over cold rate and valuation caches,
+    then warm.
+
+    Usage: python3 -m benchmarks.bench_server_load [clients] [requests]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import subprocess
+from datetime import date, timedelta
+
+from src.providers import serve_rates
+from src.readwrite import read_portfolio_from_file, save_portfolio_to_file
+from benchmarks.bench_rate_cache import synthetic_recording
+
+START = date(2021, 6, 1)
+DAYS = 365
+
+
+async def client(port: int, targets: list, latencies: list):
+    """ Send the targets one after the other over one connection """
+
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    for target in targets:
+        tic = time.perf_counter()
+        writer.write(f"GET {target} HTTP/1.1\r\nHost: bench\r\n\r\n"
+                     .encode())
+        head = await reader.readuntil(b'\r\n\r\n')
+        if not head.startswith(b'HTTP/1.1 200'):
+            raise RuntimeError(head.decode('latin-1'))
+        length = int(head.lower().split(b'content-length:')[1]
+                     .split(b'\r\n')[0])
+        await reader.readexactly(length)
+        latencies.append(time.perf_counter() - tic)
+    writer.close()
+
+
+async def load(port: int, clients: int, requests: int):
+    """ Run concurrent clients, returns (elapsed seconds, latencies) """
+
+    latencies = []
+    tic = time.perf_counter()
+    await asyncio.gather(*[
+        client(port, [target(i * requests + j) for j in range(requests)],
+               latencies)
+        for i in range(clients)])
+    return time.perf_counter() - tic, sorted(latencies)
+
+
+def target(n: int):
+    """ n-th query: mostly balances, some piecharts and monthly series """
+
+    day = START + timedelta(days=n % DAYS)
+    if n % 10 == 0:
+        return f"/portfolios/portfolio/piechart?date={day}"
+    if n % 50 == 1:
+        return (f"/portfolios/portfolio/series?start={START}"
+                f"&end={day}&freq=M&by=subcategory")
+    return f"/portfolios/portfolio/balance?date={day}"
+
+
+def main(clients=16, requests=200):
+    """ Report throughput and latency of a cold and a warm run """
+
+    rate_server = serve_rates(synthetic_recording(START - timedelta(days=7),
+                                                  DAYS + 7))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        portfolio = read_portfolio_from_file('./tests/fixtures.json')
+        portfolio.currency = 'USD'
+        path = os.path.join(tmp_dir, 'portfolio.json')
+        save_portfolio_to_file(portfolio, path)
+
+        env = dict(os.environ,
+                   NETWORTH_RATES=f"http://127.0.0.1:"
+                   f"{rate_server.server_port}",
+                   NETWORTH_RATE_CACHE=os.path.join(tmp_dir, 'rates.sqlite3'),
+                   NETWORTH_SNAPSHOT_CACHE='')
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'src.server', path, '--port', '0',
+             '--log-level', 'ERROR'],
+            env=env, stdout=subprocess.PIPE, text=True)
+        try:
+            port = int(server.stdout.readline().rsplit(':', 1)[1])
+            for run in ('cold', 'warm'):
+                elapsed, latencies = asyncio.run(load(port, clients,
+                                                      requests))
+                print(f"{run}: {len(latencies)} requests from {clients}"
+                      f" clients in {elapsed:.3f}s,"
+                      f" {len(latencies) / elapsed:.0f} requests/s, latency"
+                      f" p50 {1000 * latencies[len(latencies) // 2]:.1f}ms"
+                      f" p99 {1000 * latencies[len(latencies) * 99 // 100]:.1f}"
+                      "ms")
+        finally:
+            server.terminate()
+            server.wait()
+    rate_server.shutdown()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+# benchmarks/bench_snapshot_reopen.py
+
+""" Time to reopen an unchanged Portfolio file, replayed or from a snapshot
+
+    Usage: python3 -m benchmarks.bench_snapshot_reopen [transactions ...]
+"""
+
+import os
+import sys
+import time
+import tempfile
+
+from src.readwrite import portfolio_from_dict, read_portfolio_from_file, \
+    save_portfolio_to_file
+from src.snapshots import SnapshotCache, set_snapshot_cache
+from tests.test_readwrite import large_portfolio_dict
+
+SIZES = (10000, 100000)
+
+
+def measure(path: str, snapshots: bool):
+    """ Seconds to open a file """
+
+    tic = time.perf_counter()
+    read_portfolio_from_file(path, snapshots=snapshots)
+    return time.perf_counter() - tic
+
+
+def main(sizes=SIZES):
+    """ Report opening a file with and without its snapshot """
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        set_snapshot_cache(SnapshotCache(os.path.join(tmp_dir, 'snapshots')))
+        for size in sizes:
+            portfolio = portfolio_from_dict(large_portfolio_dict(size))
+            for extension in ('.json', '.npz'):
+                path = os.path.join(tmp_dir, f"portfolio{size}{extension}")
+                save_portfolio_to_file(portfolio, path)
+                replayed = measure(path, snapshots=False)
+                measure(path, snapshots=True)  # saves the snapshot
+                reopened = measure(path, snapshots=True)
+                print(f"{size:>8} transactions {extension:>5}: replayed in"
+                      f" {replayed:.3f}s, from snapshot in {reopened:.3f}s")
+        set_snapshot_cache(None)
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
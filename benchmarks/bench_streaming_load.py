@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+# benchmarks/bench_streaming_load.py
+
+""" Memory needed to parse Portfolio files, loaded whole or as a stream
+
+    Reports the peak memory above what the loaded Portfolio keeps, which
+    is what parsing costs.
+
+    Usage: python3 -m benchmarks.bench_streaming_load [transactions ...]
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import tracemalloc
+
+from src.readwrite import portfolio_from_dict, portfolio_from_stream, \
+    deserialize_date, serialize_date
+from tests.test_readwrite import large_portfolio_dict
+
+SIZES = (10000, 100000)
+
+
+def load_whole(path: str):
+    """ Load with json.load before replaying """
+
+    with open(path) as json_file:
+        return portfolio_from_dict(
+            json.load(json_file, object_hook=deserialize_date))
+
+
+def load_stream(path: str):
+    """ Load replaying each transaction as it is parsed """
+
+    with open(path) as json_file:
+        return portfolio_from_stream(json_file)
+
+
+def measure(loader, path: str):
+    """ Seconds and MB of parsing overhead of a loader """
+
+    tracemalloc.start()
+    tic = time.perf_counter()
+    portfolio = loader(path)
+    elapsed = time.perf_counter() - tic
+    kept, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del portfolio
+    return elapsed, (peak - kept) / 1e6
+
+
+def main(sizes=SIZES):
+    """ Report both loaders for each file size """
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for size in sizes:
+            path = os.path.join(tmp_dir, f"portfolio{size}.json")
+            with open(path, 'w') as json_file:
+                json.dump(large_portfolio_dict(size), json_file,
+                          default=serialize_date)
+            for name, loader in (('whole', load_whole),
+                                 ('stream', load_stream)):
+                elapsed, overhead = measure(loader, path)
+                print(f"{size:>8} transactions, {name:>6}: {elapsed:.2f}s,"
+                      f" {overhead:.1f} MB parsing overhead")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
@@ -8,6 +8,13 @@ import unittest
 import tests.test_utils as test_utils
 import tests.test_exchange as test_exchange
 import tests.test_ui as test_ui
+import tests.test_rates as test_rates
+import tests.test_history as test_history
+import tests.test_readwrite as test_readwrite
+import tests.test_imports as test_imports
+import tests.test_batch as test_batch
+import tests.test_server as test_server
+import tests.test_rwlock as test_rwlock
 # import tests.test_others as test_others
 
 
@@ -21,6 +28,13 @@ loader.sortTestMethodsUsing = None
 # add tests to the test suite
 suite.addTests(loader.loadTestsFromModule(test_utils))
 suite.addTests(loader.loadTestsFromModule(test_exchange))
+suite.addTests(loader.loadTestsFromModule(test_rates))
+suite.addTests(loader.loadTestsFromModule(test_history))
+suite.addTests(loader.loadTestsFromModule(test_readwrite))
+suite.addTests(loader.loadTestsFromModule(test_imports))
+suite.addTests(loader.loadTestsFromModule(test_batch))
+suite.addTests(loader.loadTestsFromModule(test_server))
+suite.addTests(loader.loadTestsFromModule(test_rwlock))
 
 # UI testing fails when called from the suite (conflict with prompt?).
 # Call manually instead using python3 -m tests.test_ui
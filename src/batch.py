@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+
+""" Headless valuation of Portfolio files, for scheduled jobs
+
+    Values each file on a date or over a range of dates, with the
+    balance broken down by an indexed field of the Items, and writes a
+    JSON or CSV report. Files are valued in parallel, one per process.
+    With --household the files are added up into one net worth in a
+    reporting currency instead.
+
+    Usage: python3 -m src.batch portfolio.json [...] [--date YYYY-MM-DD]
+           [--start YYYY-MM-DD --end YYYY-MM-DD [--freq D|W|M]]
+           [--by subcategory] [--household CURRENCY]
+           [--format json|csv] [--output report] [--workers N]
+"""
+
+import os
+import sys
+import csv
+import json
+import logging
+import argparse
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from src.utils import Portfolio, get_series_dates, prefetch_rates, \
+    convert_value_series
+from src.rates import RateNotAvailableError
+from src.readwrite import read_portfolio_from_file
+
+# cfr. argparse https://docs.python.org/3/library/argparse.html
+
+FORMATS = ('json', 'csv')
+
+
+def value_portfolio_file(path: str, start: date, end: date,
+                         freq: str = 'D', by: str = 'subcategory'):
+    """
+    Value a Portfolio file between two dates, in a worker process.
+    Returns a report dict of plain values, with an 'error' instead of
+    balances if the file could not be valued
+    """
+
+    try:
+        portfolio = read_portfolio_from_file(path)
+        dates, groups = portfolio.get_portfolio_balance_series(
+            start, end, freq, by=by)
+    except Exception as error_msg:
+        logging.warning("Portfolio file %s not valued: %s", path, error_msg)
+        return {'file': path, 'error': str(error_msg)}
+    balances = sum(groups.values(), np.zeros(len(dates)))
+    return {
+        'file': path,
+        'portfolio': portfolio.name,
+        'currency': portfolio.currency,
+        'dates': [str(day) for day in dates],
+        'balances': balances.tolist(),
+        'breakdown': {str(group): values.tolist()
+                      for group, values in groups.items()},
+    }
+
+
+def value_portfolio_files(paths: list, start: date, end: date,
+                          freq: str = 'D', by: str = 'subcategory',
+                          workers: int = None):
+    """
+    Value several Portfolio files, in parallel across processes unless
+    workers=1. Returns their reports in the order of paths
+    """
+
+    return map_files(value_portfolio_file, paths, (start, end, freq, by),
+                     workers)
+
+
+def map_files(function, paths: list, arguments: tuple, workers: int = None):
+    """
+    Call function(path, *arguments) for each path, in a pool of processes
+    unless workers=1. Returns the results in the order of paths
+    """
+
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(paths) == 1:
+        return [function(path, *arguments) for path in paths]
+    with ProcessPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+        return list(pool.map(function, paths,
+                             *[[argument] * len(paths)
+                               for argument in arguments]))
+
+
+def value_series_of_file(path: str, ordinals, by: str = 'subcategory'):
+    """
+    Values of a Portfolio file on day ordinals in the currency of each
+    Item, see Portfolio.get_value_series, in a worker process. Needs no
+    exchange rates, the caller converts them all at once
+    """
+
+    try:
+        portfolio = read_portfolio_from_file(path)
+        values = portfolio.get_value_series(ordinals, by)
+    except Exception as error_msg:
+        logging.warning("Portfolio file %s not valued: %s", path, error_msg)
+        return {'file': path, 'error': str(error_msg)}
+    return {'file': path, 'portfolio': portfolio.name, 'values': values}
+
+
+def aggregate_portfolio_files(paths: list, start: date, end: date,
+                              freq: str = 'D', currency: str = 'EUR',
+                              by: str = 'subcategory', workers: int = None):
+    """
+    Net worth of several Portfolio files together in a reporting currency,
+    between two dates, with its breakdown by an indexed field of the Items.
+    Files are loaded and valued in a pool of processes in the currency of
+    each Item. The exchange rates of every currency found are then
+    prefetched once, through the shared rate cache, to convert them all
+    """
+
+    end = min(end, date.today())
+    days = get_series_dates(start, end, freq)
+    ordinals = np.array([day.toordinal() for day in days], dtype=np.int64)
+    reports = map_files(value_series_of_file, paths, (ordinals, by), workers)
+
+    currencies = {currency}
+    currencies.update(item_currency for report in reports
+                      for _, item_currency in report.get('values', {}))
+    table = None
+    if len(currencies) > 1:
+        table = prefetch_rates(start, end, currencies)
+
+    household = {}
+    portfolios = []
+    for report in reports:
+        if 'error' in report:
+            portfolios.append(report)
+            continue
+        for key, (values, owned) in report['values'].items():
+            if key in household:
+                household[key] = (household[key][0] + values,
+                                  household[key][1] | owned)
+            else:
+                household[key] = (values, owned)
+        groups = convert_value_series(report['values'], currency, ordinals,
+                                      table)
+        portfolios.append({
+            'file': report['file'], 'portfolio': report['portfolio'],
+            'net_worth': sum(groups.values(),
+                             np.zeros(len(days))).tolist()})
+
+    groups = convert_value_series(household, currency, ordinals, table)
+    return {
+        'currency': currency,
+        'dates': [day.isoformat() for day in days],
+        'net_worth': sum(groups.values(), np.zeros(len(days))).tolist(),
+        'breakdown': {str(group): values.tolist()
+                      for group, values in groups.items()},
+        'portfolios': portfolios,
+    }
+
+
+def write_json(reports: list, output):
+    """ Write the reports as a JSON list """
+
+    json.dump(reports, output, ensure_ascii=False, indent=2)
+    output.write('\n')
+
+
+def write_csv(reports: list, output, by: str = 'subcategory'):
+    """
+    Write one row per file and date, with a column per value of the
+    breakdown field found in any file
+    """
+
+    groups = sorted({group for report in reports
+                     for group in report.get('breakdown', {})})
+    writer = csv.writer(output)
+    writer.writerow(['file', 'portfolio', 'currency', 'date', 'balance'] +
+                    [f"{by}:{group}" for group in groups])
+    for report in reports:
+        if 'error' in report:
+            continue
+        breakdown = report['breakdown']
+        for i, day in enumerate(report['dates']):
+            writer.writerow(
+                [report['file'], report['portfolio'], report['currency'],
+                 day, report['balances'][i]] +
+                [breakdown[group][i] if group in breakdown else 0.0
+                 for group in groups])
+
+
+def write_household_csv(household: dict, output, by: str = 'subcategory'):
+    """
+    Write one row per date with the net worth, a column per value of the
+    breakdown field and a column per Portfolio file
+    """
+
+    groups = sorted(household['breakdown'])
+    portfolios = [report for report in household['portfolios']
+                  if 'error' not in report]
+    writer = csv.writer(output)
+    writer.writerow(['date', f"net_worth ({household['currency']})"] +
+                    [f"{by}:{group}" for group in groups] +
+                    [report['file'] for report in portfolios])
+    for i, day in enumerate(household['dates']):
+        writer.writerow([day, household['net_worth'][i]] +
+                        [household['breakdown'][group][i]
+                         for group in groups] +
+                        [report['net_worth'][i] for report in portfolios])
+
+
+def parse_args(argv=None):
+    """ Command line arguments """
+
+    parser = argparse.ArgumentParser(
+        prog='python3 -m src.batch',
+        description="Value Portfolio files without any prompt.")
+    parser.add_argument('paths', nargs='+', metavar='PATH',
+                        help="Portfolio files, JSON or .npz")
+    parser.add_argument('--date', type=date.fromisoformat,
+                        help="date to value on, today by default")
+    parser.add_argument('--start', type=date.fromisoformat,
+                        help="first date of a range")
+    parser.add_argument('--end', type=date.fromisoformat,
+                        help="last date of a range, today by default")
+    parser.add_argument('--freq', choices=('D', 'W', 'M'), default='D',
+                        help="dates of a range: daily, weekly or month ends")
+    parser.add_argument('--by', choices=Portfolio.INDEXES,
+                        default='subcategory',
+                        help="field of the Items to break balances down by")
+    parser.add_argument('--household',
+                        choices=Portfolio.CURRENCIES + Portfolio.CRYPTO,
+                        metavar='CURRENCY',
+                        help="add up every file into one net worth in a"
+                        " reporting currency")
+    parser.add_argument('--format', choices=FORMATS, default='json')
+    parser.add_argument('--output', default='-',
+                        help="report file, standard output by default")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="processes, one per CPU by default")
+    args = parser.parse_args(argv)
+    if args.date and (args.start or args.end):
+        parser.error("--date cannot be combined with --start or --end")
+    if args.end and not args.start:
+        parser.error("--end needs --start")
+    return args
+
+
+def main(argv=None):
+    """ Value the files and write the report. Returns the exit status """
+
+    args = parse_args(argv)
+    if args.start:
+        start, end = args.start, args.end or date.today()
+    else:
+        start = end = args.date or date.today()
+
+    if args.household:
+        try:
+            household = aggregate_portfolio_files(
+                args.paths, start, end, args.freq, args.household, args.by,
+                args.workers)
+        except RateNotAvailableError as error_msg:
+            print(f"Net worth not valued: {error_msg}", file=sys.stderr)
+            return 1
+        reports = household['portfolios']
+    else:
+        reports = value_portfolio_files(args.paths, start, end, args.freq,
+                                        args.by, args.workers)
+
+    output = sys.stdout if args.output == '-' else \
+        open(args.output, 'w', encoding='utf-8', newline='')
+    try:
+        if args.format == 'csv' and args.household:
+            write_household_csv(household, output, args.by)
+        elif args.format == 'csv':
+            write_csv(reports, output, args.by)
+        else:
+            write_json(household if args.household else reports, output)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    failed = [report for report in reports if 'error' in report]
+    for report in failed:
+        print(f"{report['file']}: {report['error']}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+
+""" Data structures to keep the history of an Item """
+
+import bisect
+from datetime import date
+import numpy as np
+
+# cfr. Fenwick tree https://en.wikipedia.org/wiki/Fenwick_tree
+
+
+class PrefixSums:
+    """ Running totals of (units, cost, value) by date
+
+        Fenwick tree over day ordinals storing the changes of each
+        purchase. Adding a change on any date and reading the totals up
+        to any date both take O(log(days)), so a back-dated purchase
+        updates every later total without replaying the history.
+    """
+
+    # covers every ordinal up to date.max.toordinal()
+    SIZE = 1 << 22
+
+    def __init__(self):
+        """ PrefixSums constructor """
+
+        self._tree = {}  # sparse tree: {index: [units, cost, value]}
+
+    def add(self, when: date, units: float, cost: float, value: float):
+        """ Add changes of units, cost and value on a given date """
+
+        index = when.toordinal()
+        while index < PrefixSums.SIZE:
+            node = self._tree.get(index)
+            if node is None:
+                self._tree[index] = [units, cost, value]
+            else:
+                node[0] += units
+                node[1] += cost
+                node[2] += value
+            index += index & -index
+
+    def add_bulk(self, ordinals, units, cost, value):
+        """
+        Add changes on sorted day ordinals in one pass. The tree is linear,
+        so the nodes of the batch alone are computed from its running
+        totals and added to the nodes already there
+        """
+
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        if len(ordinals) == 0:
+            return
+        running = np.cumsum(np.column_stack((units, cost, value)), axis=0)
+
+        # every node on the update path of some ordinal
+        paths = [ordinals]
+        nodes = np.unique(ordinals)
+        while nodes.size:
+            nodes = nodes + (nodes & -nodes)
+            nodes = np.unique(nodes[nodes < PrefixSums.SIZE])
+            paths.append(nodes)
+        nodes = np.unique(np.concatenate(paths))
+
+        def running_at(indexes):
+            """ Running totals of the batch up to each index, inclusive """
+            last = np.searchsorted(ordinals, indexes, side='right') - 1
+            return np.where((last >= 0)[:, None], running[last], 0.0)
+
+        # node i holds the changes on ordinals (i - lowbit(i), i]
+        node_values = running_at(nodes) - running_at(nodes - (nodes & -nodes))
+        for index, (d_units, d_cost, d_value) in zip(nodes.tolist(),
+                                                     node_values.tolist()):
+            node = self._tree.get(index)
+            if node is None:
+                self._tree[index] = [d_units, d_cost, d_value]
+            else:
+                node[0] += d_units
+                node[1] += d_cost
+                node[2] += d_value
+
+    def totals(self, when: date):
+        """ Get (units, cost, value) added up to a given date, inclusive """
+
+        units = cost = value = 0
+        index = when.toordinal()
+        while index > 0:
+            node = self._tree.get(index)
+            if node is not None:
+                units += node[0]
+                cost += node[1]
+                value += node[2]
+            index -= index & -index
+        return units, cost, value
+
+
+def _slice_columns(columns: tuple, start: date, end: date):
+    """ Slice (ordinals, units, cost, value) columns to a date range """
+
+    ordinals = columns[0]
+    ordinal = ordinals.dtype.type
+    low = np.searchsorted(ordinals, ordinal(start.toordinal()), side='left')
+    high = np.searchsorted(ordinals, ordinal(end.toordinal()), side='right')
+    return tuple(column[low:high] for column in columns)
+
+
+class PointHistory:
+    """ History as a sorted list of HistoryPoint objects
+
+        make_point(when) builds the HistoryPoint stored for a new date.
+        Running totals are kept in PrefixSums.
+    """
+
+    def __init__(self, make_point):
+        """ PointHistory constructor """
+
+        self.points = []
+        self.dates = []  # dates of self.points, kept sorted
+        self.sums = PrefixSums()
+        self._make_point = make_point
+        self._columns = None
+
+    def __len__(self):
+        return len(self.points)
+
+    def __iter__(self):
+        return iter(self.points)
+
+    def __getitem__(self, index):
+        return self.points[index]
+
+    @property
+    def first_date(self):
+        """ Date of the earliest HistoryPoint, None if empty """
+
+        return self.dates[0] if self.dates else None
+
+    def insert(self, when: date, delta_units: float, delta_cost: float,
+               delta_value: float):
+        """ Insert a HistoryPoint after any other of the same date """
+
+        self.sums.add(when, delta_units, delta_cost, delta_value)
+        index = bisect.bisect_right(self.dates, when)
+        self.points.insert(index, self._make_point(when))
+        self.dates.insert(index, when)
+        self._columns = None
+        return index
+
+    def extend(self, ordinals, delta_units, delta_cost, delta_value):
+        """
+        Insert points for changes on sorted day ordinals in one pass, after
+        any other point of the same date
+        """
+
+        self.sums.add_bulk(ordinals, delta_units, delta_cost, delta_value)
+        dates = [date.fromordinal(ordinal) for ordinal in
+                 np.asarray(ordinals).tolist()]
+        points = [self._make_point(when) for when in dates]
+        if self.dates and dates and dates[0] < self.dates[-1]:
+            # stable sort keeps earlier points first on the same date
+            merged = sorted(zip(self.dates + dates, self.points + points),
+                            key=lambda pair: pair[0])
+            self.dates = [when for when, _ in merged]
+            self.points = [hist_pt for _, hist_pt in merged]
+        else:
+            self.dates.extend(dates)
+            self.points.extend(points)
+        self._columns = None
+
+    def index_at(self, given_date: date):
+        """ Index of the last HistoryPoint on or before a date, or -1 """
+
+        return bisect.bisect_right(self.dates, given_date) - 1
+
+    def totals(self, given_date: date):
+        """ Running (units, cost, value) on a given date """
+
+        return self.sums.totals(given_date)
+
+    def columns(self):
+        """ NumPy arrays (ordinals, units, cost, value) of every point """
+
+        if self._columns is None:
+            ordinals = np.array([when.toordinal() for when in self.dates],
+                                dtype=np.int64)
+            figures = np.array([self.sums.totals(when) for when in self.dates],
+                               dtype=float).reshape(-1, 3)
+            self._columns = (ordinals, figures[:, 0], figures[:, 1],
+                             figures[:, 2])
+        return self._columns
+
+    def range(self, start: date, end: date):
+        """ Columns of the points between two dates, inclusive """
+
+        return _slice_columns(self.columns(), start, end)
+
+    def __getstate__(self):
+        """ Pickled without its points, rebuilt from their dates """
+
+        state = self.__dict__.copy()
+        state['points'] = None
+        state['_columns'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.points = [self._make_point(when) for when in self.dates]
+
+
+class ColumnarHistory:
+    """ History as parallel NumPy arrays of day ordinals and running totals
+
+        About 28 bytes per point instead of a HistoryPoint object each.
+        make_view(when) builds the HistoryPoint-like view returned when the
+        history is iterated or indexed.
+    """
+
+    INITIAL_CAPACITY = 16
+
+    def __init__(self, make_view):
+        """ ColumnarHistory constructor """
+
+        self._make_view = make_view
+        self._size = 0
+        self._ordinals = np.empty(ColumnarHistory.INITIAL_CAPACITY,
+                                  dtype=np.int32)
+        # running (units, cost, value) of each point
+        self._figures = np.empty((ColumnarHistory.INITIAL_CAPACITY, 3))
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for ordinal in self._ordinals[:self._size].tolist():
+            yield self._make_view(date.fromordinal(ordinal))
+
+    def __getitem__(self, index):
+        ordinal = self._ordinals[:self._size][index]
+        return self._make_view(date.fromordinal(int(ordinal)))
+
+    @property
+    def dates(self):
+        """ Dates of every point """
+
+        return [date.fromordinal(ordinal)
+                for ordinal in self._ordinals[:self._size].tolist()]
+
+    @property
+    def first_date(self):
+        """ Date of the earliest point, None if empty """
+
+        if self._size == 0:
+            return None
+        return date.fromordinal(int(self._ordinals[0]))
+
+    @property
+    def nbytes(self):
+        """ Bytes used by the arrays """
+
+        return self._ordinals.nbytes + self._figures.nbytes
+
+    def _grow(self):
+        """ Double the capacity of the arrays """
+
+        capacity = 2 * len(self._ordinals)
+        ordinals = np.empty(capacity, dtype=np.int32)
+        ordinals[:self._size] = self._ordinals[:self._size]
+        figures = np.empty((capacity, 3))
+        figures[:self._size] = self._figures[:self._size]
+        self._ordinals, self._figures = ordinals, figures
+
+    def insert(self, when: date, delta_units: float, delta_cost: float,
+               delta_value: float):
+        """ Insert a point after any other of the same date
+
+            Later running totals are updated with one vectorized addition.
+        """
+
+        size = self._size
+        if size == len(self._ordinals):
+            self._grow()
+        ordinal = np.int32(when.toordinal())
+        index = int(np.searchsorted(self._ordinals[:size], ordinal,
+                                    side='right'))
+        delta = (delta_units, delta_cost, delta_value)
+        if index < size:
+            self._ordinals[index + 1:size + 1] = self._ordinals[index:size]
+            self._figures[index + 1:size + 1] = self._figures[index:size]
+            self._figures[index + 1:size + 1] += delta
+        self._ordinals[index] = ordinal
+        if index > 0:
+            self._figures[index] = self._figures[index - 1] + delta
+        else:
+            self._figures[index] = delta
+        self._size = size + 1
+        return index
+
+    def extend(self, ordinals, delta_units, delta_cost, delta_value):
+        """
+        Insert points for changes on sorted day ordinals in one pass, after
+        any other point of the same date
+        """
+
+        size = self._size
+        ordinals = np.concatenate((self._ordinals[:size],
+                                   np.asarray(ordinals, dtype=np.int32)))
+        deltas = np.column_stack((delta_units, delta_cost, delta_value))
+        if size:
+            # changes of the points already there, from their running totals
+            figures = self._figures[:size]
+            deltas = np.concatenate(
+                (np.diff(figures, axis=0, prepend=np.zeros((1, 3))), deltas))
+            order = np.argsort(ordinals, kind='stable')
+            ordinals, deltas = ordinals[order], deltas[order]
+        capacity = max(ColumnarHistory.INITIAL_CAPACITY, len(self._ordinals))
+        while capacity < len(ordinals):
+            capacity *= 2
+        self._ordinals = np.empty(capacity, dtype=np.int32)
+        self._figures = np.empty((capacity, 3))
+        self._size = len(ordinals)
+        self._ordinals[:self._size] = ordinals
+        np.cumsum(deltas, axis=0, out=self._figures[:self._size])
+
+    def index_at(self, given_date: date):
+        """ Index of the last point on or before a date, or -1 """
+
+        # an int32 needle avoids converting the whole array to search it
+        return int(np.searchsorted(self._ordinals[:self._size],
+                                   np.int32(given_date.toordinal()),
+                                   side='right')) - 1
+
+    def totals(self, given_date: date):
+        """ Running (units, cost, value) on a given date """
+
+        index = self.index_at(given_date)
+        if index < 0:
+            return 0, 0, 0
+        units, cost, value = self._figures[index].tolist()
+        return units, cost, value
+
+    def columns(self):
+        """ NumPy arrays (ordinals, units, cost, value) of every point """
+
+        ordinals = self._ordinals[:self._size]
+        # like HistoryPoints, points of the same date show the day totals
+        last_of_day = np.searchsorted(ordinals, ordinals, side='right') - 1
+        figures = self._figures[last_of_day]
+        return ordinals, figures[:, 0], figures[:, 1], figures[:, 2]
+
+    def range(self, start: date, end: date):
+        """ Columns of the points between two dates, inclusive """
+
+        return _slice_columns(self.columns(), start, end)
+
+
+class PriceSeries:
+    """ Closing prices of an Item as parallel NumPy arrays
+
+        Day ordinals and closes, sorted by date, 12 bytes per close.
+        A date without a close takes the last close before it.
+    """
+
+    def __init__(self):
+        """ PriceSeries constructor """
+
+        self._ordinals = np.empty(0, dtype=np.int32)
+        self._closes = np.empty(0)
+
+    def __len__(self):
+        return len(self._ordinals)
+
+    @property
+    def dates(self):
+        """ Dates of every close """
+
+        return [date.fromordinal(ordinal)
+                for ordinal in self._ordinals.tolist()]
+
+    def feed(self, dates, closes):
+        """ Add closes in bulk, replacing any already stored for a date """
+
+        ordinals = np.fromiter((when.toordinal() for when in dates),
+                               dtype=np.int32)
+        closes = np.asarray(closes, dtype=float)
+        if len(ordinals) != len(closes):
+            raise ValueError(f"{len(ordinals)} dates for {len(closes)}"
+                             " closes")
+        if not len(ordinals):
+            return
+        ordinals = np.concatenate((self._ordinals, ordinals))
+        closes = np.concatenate((self._closes, closes))
+        # stable sort keeps the closes fed last at the end of each date
+        order = np.argsort(ordinals, kind='stable')
+        ordinals, closes = ordinals[order], closes[order]
+        last_of_day = np.append(ordinals[1:] != ordinals[:-1], True)
+        self._ordinals = ordinals[last_of_day]
+        self._closes = closes[last_of_day]
+
+    def price(self, given_date: date):
+        """ Close on a given date, None before the first close """
+
+        index = int(np.searchsorted(self._ordinals,
+                                    np.int32(given_date.toordinal()),
+                                    side='right')) - 1
+        if index < 0:
+            return None
+        return float(self._closes[index])
+
+    def prices(self, ordinals):
+        """ Closes on an array of day ordinals, NaN before the first close """
+
+        index = np.searchsorted(self._ordinals, ordinals, side='right') - 1
+        if len(self._closes) == 0:
+            return np.full(len(index), np.nan)
+        return np.where(index >= 0, self._closes[index], np.nan)
+
+    def columns(self):
+        """ NumPy arrays (ordinals, closes) """
+
+        return self._ordinals, self._closes
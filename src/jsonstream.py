@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+
+""" Incremental JSON parser to read large files as a stream """
+
+import json
+
+import numpy as np
+
+# cfr. JSONDecoder.raw_decode https://docs.python.org/3/library/json.html
+
+WHITESPACE = ' \t\n\r'
+
+OPENING_CHARS, CLOSING_CHARS = '[{', ']}'
+
+# change of depth caused by each ASCII character
+DEPTH_STEPS = np.zeros(128, dtype=np.int8)
+DEPTH_STEPS[[ord(char) for char in OPENING_CHARS]] = 1
+DEPTH_STEPS[[ord(char) for char in CLOSING_CHARS]] = -1
+
+
+class JsonStream:
+    """ Pull parser over a text file
+
+        Objects and arrays can be walked one member at a time with
+        object_items() and array_items(), so only the value being read is
+        in memory. Any other value is decoded whole with value(). A caller
+        walking a container must read or walk each member before asking
+        for the next one.
+
+        Values can also be skipped without decoding them with skip().
+        offset() gives the position in bytes of the next value, which is
+        only exact for files opened with encoding='utf-8' and newline=''.
+    """
+
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, text_file, object_hook=None,
+                 chunk_size: int = CHUNK_SIZE):
+        """ JsonStream constructor """
+
+        self._file = text_file
+        self._decoder = json.JSONDecoder(object_hook=object_hook)
+        self._chunk_size = chunk_size
+        self._buffer = ''
+        self._pos = 0
+        self._eof = False
+        self._offset = 0  # bytes of the file before the buffer
+
+    def _fill(self, size: int = None):
+        """ Read more of the file, dropping what was already parsed """
+
+        chunk = self._file.read(size or self._chunk_size)
+        if not chunk:
+            self._eof = True
+        self._offset += self._bytes(self._buffer[:self._pos])
+        self._buffer = self._buffer[self._pos:] + chunk
+        self._pos = 0
+
+    def _peek(self):
+        """ Next character that is not whitespace, '' at the end """
+
+        while True:
+            while self._pos < len(self._buffer) and \
+                    self._buffer[self._pos] in WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buffer) or self._eof:
+                return self._buffer[self._pos:self._pos + 1]
+            self._fill()
+
+    @staticmethod
+    def _bytes(text: str):
+        """ Length of a text in UTF-8 """
+
+        return len(text) if text.isascii() else len(text.encode('utf-8'))
+
+    def offset(self):
+        """ Position in bytes of the next value """
+
+        self._peek()
+        return self._offset + self._bytes(self._buffer[:self._pos])
+
+    def _expect(self, chars: str):
+        """ Consume the next character, which must be one of chars """
+
+        char = self._peek()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(f"Expecting one of '{chars}'",
+                                       self._buffer, self._pos)
+        self._pos += 1
+        return char
+
+    def value(self):
+        """ Decode the next value whole """
+
+        self._peek()
+        size = self._chunk_size
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if self._eof:
+                    raise
+                end = None
+            # a value that reaches the end of the buffer may go on
+            if end is not None and (end < len(self._buffer) or self._eof):
+                self._pos = end
+                return value
+            self._fill(size)
+            size *= 2
+
+    def skip(self):
+        """
+        Skip the next value without decoding it. Brackets are matched a
+        chunk at a time with NumPy, outside of strings
+        """
+
+        if self._peek() not in OPENING_CHARS:
+            self.value()
+            return
+        depth = 0
+        while True:
+            text = self._buffer[self._pos:]
+            if not text.isascii() or '\\' in text:
+                # escaped quotes and multibyte characters are rare, so they
+                # are left to the slower scan one token at a time
+                depth = self._skip_tokens(depth)
+                if depth == 0:
+                    return
+                continue
+            chars = np.frombuffer(text.encode('ascii'), dtype=np.uint8)
+            quotes = np.flatnonzero(chars == ord('"'))
+            end = len(chars)
+            if len(quotes) % 2:
+                # stop before a string that goes on in the next chunk
+                end = int(quotes[-1])
+            steps = DEPTH_STEPS[chars[:end]]
+            brackets = np.flatnonzero(steps)
+            # brackets after an odd number of quotes are inside a string
+            brackets = brackets[np.searchsorted(quotes, brackets) % 2 == 0]
+            depths = np.cumsum(steps[brackets], dtype=np.int64)
+            depths += depth
+            closed = np.flatnonzero(depths == 0)
+            if len(closed):
+                self._pos += int(brackets[closed[0]]) + 1
+                return
+            if self._eof:
+                raise json.JSONDecodeError("Unterminated value",
+                                           self._buffer, self._pos)
+            if len(depths):
+                depth = int(depths[-1])
+            self._pos += end
+            self._fill(None if end else 2 * len(text) + 1)
+
+    def _skip_tokens(self, depth: int):
+        """
+        Skip brackets and strings one at a time until depth reaches 0 or
+        the buffer is exhausted. Returns the depth reached
+        """
+
+        while self._pos < len(self._buffer):
+            char = self._buffer[self._pos]
+            if char == '"':
+                try:
+                    _, end = self._decoder.parse_string(self._buffer,
+                                                        self._pos + 1)
+                except json.JSONDecodeError:
+                    break  # the string goes on in the next chunk
+                self._pos = end
+                continue
+            self._pos += 1
+            if char in OPENING_CHARS:
+                depth += 1
+            elif char in CLOSING_CHARS:
+                depth -= 1
+                if depth == 0:
+                    return depth
+        if self._eof:
+            raise json.JSONDecodeError("Unterminated value",
+                                       self._buffer, self._pos)
+        self._fill()
+        return depth
+
+    def object_items(self):
+        """ Walk an object, yields its keys one at a time """
+
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self.value()
+            self._expect(':')
+            yield key
+            if self._expect(',}') == '}':
+                return
+
+    def array_items(self):
+        """ Walk an array, yields the index of each element """
+
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        index = 0
+        while True:
+            yield index
+            index += 1
+            if self._expect(',]') == ']':
+                return
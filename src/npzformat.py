@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+
+""" Compact columnar Portfolio files in NumPy .npz format
+
+    Items, ledgers and closing prices are stored as typed columns. The
+    ledger and prices of every Item are stored one after the other, and
+    item_ledger_start / item_prices_start give where each Item starts.
+"""
+
+import uuid
+import logging
+from datetime import date
+from functools import partial
+
+import numpy as np
+
+from src.utils import Portfolio
+
+# cfr. NumPy files https://numpy.org/doc/stable/reference/routines.io.html
+
+# 2 adds item_unique_id and journal_seq
+SCHEMA_VERSION = 2
+
+# .npz files are zip archives
+MAGIC = b'PK\x03\x04'
+
+ITEM_COLUMNS = ('category', 'subcategory', 'currency', 'name', 'description')
+TRANSACTION_TYPES = ('purchase',)
+
+
+def is_npz_file(path: str):
+    """ Check the magic bytes of a file """
+
+    with open(path, 'rb') as binary_file:
+        return binary_file.read(len(MAGIC)) == MAGIC
+
+
+def columns_from_portfolio(portfolio):
+    """ Get a dict of NumPy columns of a Portfolio """
+
+    items = portfolio.item_list
+    ledgers = [item.ledger for item in items]
+    transactions = [data for ledger in ledgers for _, data in ledger]
+    prices = [item.prices.columns() for item in items]
+
+    columns = {
+        'schema': np.array(SCHEMA_VERSION),
+        'portfolio': np.array([portfolio.name, portfolio.description,
+                               portfolio.currency]),
+        'journal_seq': np.array(portfolio.journal_seq),
+        'item_unique_id': np.array([str(item.unique_id) for item in items],
+                                   dtype=str),
+        'item_ledger_start': np.cumsum([0] + [len(ledger)
+                                              for ledger in ledgers]),
+        'item_prices_start': np.cumsum([0] + [len(ordinals)
+                                              for ordinals, _ in prices]),
+        'ledger_type': np.array(
+            [TRANSACTION_TYPES.index(transaction_type)
+             for ledger in ledgers for transaction_type, _ in ledger],
+            dtype=np.uint8),
+        'ledger_when': np.array([data['when'].toordinal()
+                                 for data in transactions], dtype=np.int32),
+        'ledger_units': np.array([data['units_purchased']
+                                  for data in transactions], dtype=float),
+        # stock units are int and real_state units float
+        'ledger_units_int': np.array(
+            [isinstance(data['units_purchased'], int)
+             for data in transactions], dtype=bool),
+        'ledger_unit_price': np.array([data['unit_price']
+                                       for data in transactions],
+                                      dtype=float),
+        'ledger_fees': np.array([data['fees'] for data in transactions],
+                                dtype=float),
+        'price_when': np.concatenate(
+            [np.empty(0, dtype=np.int32)] +
+            [ordinals for ordinals, _ in prices]).astype(np.int32),
+        'price_close': np.concatenate(
+            [np.empty(0)] + [closes for _, closes in prices]),
+    }
+    for column in ITEM_COLUMNS:
+        columns['item_' + column] = np.array(
+            [getattr(item, column) for item in items], dtype=str)
+    return columns
+
+
+def save_portfolio_npz(portfolio, npz_file):
+    """ Save a Portfolio to a compressed .npz file or file object """
+
+    np.savez_compressed(npz_file, **columns_from_portfolio(portfolio))
+
+
+def ledger_from_columns(columns: dict, start: int, end: int):
+    """ Get the transactions in rows start to end of the ledger columns """
+
+    ledger_type = columns['ledger_type'][start:end].tolist()
+    ledger_when = columns['ledger_when'][start:end].tolist()
+    ledger_units = columns['ledger_units'][start:end].tolist()
+    ledger_units_int = columns['ledger_units_int'][start:end].tolist()
+    ledger_unit_price = columns['ledger_unit_price'][start:end].tolist()
+    ledger_fees = columns['ledger_fees'][start:end].tolist()
+    return [(TRANSACTION_TYPES[ledger_type[j]],
+             {'when': date.fromordinal(ledger_when[j]),
+              'units_purchased': int(ledger_units[j])
+              if ledger_units_int[j] else ledger_units[j],
+              'unit_price': ledger_unit_price[j],
+              'fees': ledger_fees[j]})
+            for j in range(end - start)]
+
+
+def portfolio_from_npz(npz_file, lazy=False):
+    """
+    Generate a Portfolio from a .npz file or file object.
+    lazy flag = True leaves stub Items that only build their history when
+    first used, from ledger columns kept in memory
+    """
+
+    with np.load(npz_file, allow_pickle=False) as columns:
+        schema = int(columns['schema'])
+        if schema > SCHEMA_VERSION:
+            raise ValueError(f"Portfolio file schema {schema} is newer than"
+                             f" the supported {SCHEMA_VERSION}")
+        name, description, currency = columns['portfolio'].tolist()
+        portfolio = Portfolio(name=name, description=description,
+                              currency=currency)
+        if schema >= 2:
+            portfolio.journal_seq = int(columns['journal_seq'])
+            unique_ids = columns['item_unique_id'].tolist()
+
+        ledger_start = columns['item_ledger_start'].tolist()
+        prices_start = columns['item_prices_start']
+        ledger_columns = {column: columns[column] for column in
+                          ('ledger_type', 'ledger_when', 'ledger_units',
+                           'ledger_units_int', 'ledger_unit_price',
+                           'ledger_fees')}
+        price_when = columns['price_when']
+        price_close = columns['price_close']
+        item_columns = {column: columns['item_' + column].tolist()
+                        for column in ITEM_COLUMNS}
+
+        for i in range(len(ledger_start) - 1):
+            sample = {column: values[i]
+                      for column, values in item_columns.items()}
+            if schema >= 2:
+                sample['unique_id'] = uuid.UUID(unique_ids[i])
+            item = portfolio.add_item(**sample)
+            if item is None:
+                logging.warning("Item %s of the file not added", i)
+                continue
+            loader = partial(ledger_from_columns, ledger_columns,
+                             ledger_start[i], ledger_start[i + 1])
+            if lazy:
+                item.defer_ledger(loader)
+            else:
+                item.load_ledger(loader())
+            start, end = prices_start[i], prices_start[i + 1]
+            if end > start:
+                item.feed_prices(
+                    [date.fromordinal(ordinal)
+                     for ordinal in price_when[start:end].tolist()],
+                    price_close[start:end])
+    return portfolio
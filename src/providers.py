@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+
+""" Exchange rate providers
+
+    A provider returns base vectors: the rates from a pivot currency to
+    other currencies on a given date, as a dict {currency: rate}.
+
+    Modules only needed to reach a rate service are imported on the first
+    request, so that loading and valuing with cached rates starts fast.
+"""
+
+import json
+import logging
+from datetime import date
+from urllib.parse import urlencode, urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+
+# seconds to wait for a remote rate service
+DEFAULT_TIMEOUT = 10
+
+# threads making concurrent requests to the forex-python services
+MAX_WORKERS = 4
+
+_executor = None
+
+
+def _submit(function, *args):
+    """ Run function in a worker thread of a bounded pool, returns a Future """
+
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS,
+                                       thread_name_prefix='rate-provider')
+    return _executor.submit(function, *args)
+
+
+def _rebase(vector: dict, base: str, pivot: str):
+    """ Express a base vector relative to another pivot currency """
+
+    if base == pivot:
+        return dict(vector)
+    vector = dict(vector)
+    vector[base] = 1.0
+    if pivot not in vector:
+        return {}
+    pivot_rate = vector[pivot]
+    return {curr: rate / pivot_rate for curr, rate in vector.items()}
+
+
+class RateProvider:
+    """ Source of base vectors. Subclasses implement fetch() """
+
+    # True if fetch_range() gets several dates in a single request
+    supports_range = False
+
+    def __init__(self, timeout: float = DEFAULT_TIMEOUT):
+        """ RateProvider constructor """
+
+        self.timeout = timeout
+        self.requests = 0  # number of upstream requests
+
+    @property
+    def name(self):
+        """ Name of the provider for logging """
+
+        return type(self).__name__
+
+    def fetch(self, given_date: date, pivot: str, wanted: tuple):
+        """ Fetch rates from pivot to wanted currencies on a given date """
+
+        raise NotImplementedError
+
+    def fetch_range(self, days: list, pivot: str, wanted: tuple):
+        """ Fetch base vectors for several dates, returns {date: vector} """
+
+        return {day: self.fetch(day, pivot, wanted) for day in days}
+
+
+class ForexPythonProvider(RateProvider):
+    """ Rates from the forex-python services (theratesapi and coindesk)
+
+        forex-python has no timeout, so the requests it would make are
+        made here, with the timeout of the provider, and a service that
+        hangs cannot hold a worker thread longer than that. forex-python
+        is imported on the first fetch, so that reading recorded rates or
+        serving them does not pay for it.
+    """
+
+    CRYPTO = ('BTC',)
+
+    # coindesk services of forex-python's BtcConverter
+    BTC_LATEST_URL = 'https://api.coindesk.com/v1/bpi/currentprice/{}.json'
+    BTC_HISTORY_URL = 'https://api.coindesk.com/v1/bpi/historical/close.json'
+
+    def _get(self, url: str, params: dict = None):
+        """ GET a service of forex-python, waiting at most the timeout """
+
+        import requests
+
+        return requests.get(url, params=params, timeout=self.timeout)
+
+    def get_forex_rates(self, pivot: str, when: date = None):
+        """ Every forex rate from pivot on a date, the latest if None """
+
+        from forex_python.converter import CurrencyRates, \
+            RatesNotAvailableError
+
+        converter = CurrencyRates()
+        response = self._get(
+            converter._source_url() + converter._get_date_string(when),
+            {'base': pivot, 'rtype': 'fpy'})
+        if response.status_code != 200:
+            raise RatesNotAvailableError("Currency Rates Source Not Ready")
+        return converter._decode_rates(response)
+
+    def get_btc_prices(self, pivot: str, start: date = None,
+                       end: date = None):
+        """
+        BTC prices in the pivot currency between two dates, as given by
+        coindesk {'YYYY-MM-DD': price}, the latest price without dates
+        """
+
+        if start is None:
+            response = self._get(ForexPythonProvider.BTC_LATEST_URL
+                                 .format(pivot))
+            if response.status_code != 200:
+                return {}
+            price = response.json().get('bpi', {}).get(pivot, {}) \
+                .get('rate_float')
+            return {date.today().isoformat(): price}
+        response = self._get(ForexPythonProvider.BTC_HISTORY_URL, {
+            'start': start.isoformat(), 'end': end.isoformat(),
+            'currency': pivot})
+        if response.status_code != 200:
+            return {}
+        return response.json().get('bpi', {})
+
+    def fetch(self, given_date: date, pivot: str, wanted: tuple):
+        """ Fetch forex rates and BTC price with two concurrent requests """
+
+        when = None if given_date == date.today() else given_date
+        forex_rates = {}
+        prices = {}
+        requests = []
+        if any(curr not in ForexPythonProvider.CRYPTO for curr in wanted):
+            # one request returns every forex rate
+            requests.append(_submit(self.get_forex_rates, pivot, when))
+        if 'BTC' in wanted:
+            # BTC is quoted as a price in the pivot currency
+            requests.append(_submit(self.get_btc_prices, pivot, when, when))
+        self.requests += len(requests)
+
+        replies = [request.result() for request in requests]
+        if 'BTC' in wanted:
+            prices = replies.pop()
+        if replies:
+            forex_rates = replies.pop()
+
+        vector = {curr: rate for curr, rate in forex_rates.items()
+                  if curr in wanted}
+        price = prices.get(given_date.isoformat())
+        if price:
+            vector['BTC'] = 1 / price
+        return vector
+
+    def fetch_range(self, days: list, pivot: str, wanted: tuple):
+        """
+        Fetch forex rates day by day and BTC prices in bulk. forex-python
+        has no time series of forex rates, so this makes one request per
+        day, and a prefetch from it is not a single bulk request
+        """
+
+        forex_wanted = tuple(curr for curr in wanted
+                             if curr not in ForexPythonProvider.CRYPTO)
+        vectors = {}
+        for day in days:
+            vectors[day] = self.fetch(day, pivot, forex_wanted)
+        if 'BTC' in wanted and days:
+            # a single request returns the whole BTC price history
+            self.requests += 1
+            prices = self.get_btc_prices(pivot, min(days), max(days))
+            for day, price in prices.items():
+                if price:
+                    vectors.setdefault(date.fromisoformat(day), {})[
+                        'BTC'] = 1 / price
+        return vectors
+
+
+class RecordedRateProvider(RateProvider):
+    """ Rates served from a recorded JSON file, with no network access
+
+        The file holds {"base": "EUR", "rates": {"2021-08-26": {...}}}.
+        An optional "latest" entry is served for today's date.
+    """
+
+    supports_range = True
+
+    def __init__(self, path: str = None, base: str = 'EUR',
+                 rates: dict = None):
+        """ RecordedRateProvider constructor, from a file or a dict """
+
+        super().__init__(timeout=None)
+        self.path = path
+        self.base = base
+        self.rates = {}
+        if path is not None:
+            with open(path, encoding='utf-8') as json_file:
+                recording = json.load(json_file)
+            self.base = recording.get('base', base)
+            rates = recording['rates']
+        if rates is not None:
+            for key, vector in rates.items():
+                self.record(key, vector)
+
+    def record(self, key, vector: dict):
+        """ Add the base vector of a date (or 'latest') to the recording """
+
+        if isinstance(key, date):
+            key = key.isoformat()
+        self.rates[key] = dict(vector)
+
+    def save(self, path: str = None):
+        """ Save the recording to a JSON file """
+
+        with open(path or self.path, 'w', encoding='utf-8') as json_file:
+            json.dump({'base': self.base, 'rates': self.rates}, json_file,
+                      indent=4, sort_keys=True)
+
+    def fetch(self, given_date: date, pivot: str, wanted: tuple):
+        """ Look up the recorded base vector of a date """
+
+        self.requests += 1
+        vector = self.rates.get(given_date.isoformat())
+        if vector is None and given_date == date.today():
+            vector = self.rates.get('latest')
+        if vector is None:
+            return {}
+        vector = _rebase(vector, self.base, pivot)
+        return {curr: rate for curr, rate in vector.items() if curr in wanted}
+
+    def fetch_range(self, days: list, pivot: str, wanted: tuple):
+        """ Look up the recorded base vectors of several dates """
+
+        return {day: self.fetch(day, pivot, wanted) for day in days}
+
+
+class HttpRateProvider(RateProvider):
+    """ Rates from an HTTP service with the API of the stand-in server
+
+        GET <url>/<YYYY-MM-DD|latest>?base=EUR&symbols=USD,BTC
+        GET <url>/timeseries?base=EUR&symbols=USD&start_date=...&end_date=...
+    """
+
+    supports_range = True
+
+    def __init__(self, url: str, timeout: float = DEFAULT_TIMEOUT):
+        """ HttpRateProvider constructor """
+
+        super().__init__(timeout=timeout)
+        self.url = url.rstrip('/')
+
+    def _get_json(self, path: str, params: dict):
+        """ GET a JSON document from the service """
+
+        import urllib.error
+        import urllib.request
+
+        self.requests += 1
+        url = f"{self.url}/{path}?{urlencode(params)}"
+        try:
+            with urllib.request.urlopen(url, timeout=self.timeout) as reply:
+                return json.load(reply)
+        except urllib.error.HTTPError as error:
+            if error.code == 404:
+                return {}
+            raise
+
+    def fetch(self, given_date: date, pivot: str, wanted: tuple):
+        """ GET the base vector of a date """
+
+        path = 'latest' if given_date == date.today() \
+            else given_date.isoformat()
+        reply = self._get_json(path, {'base': pivot,
+                                      'symbols': ','.join(wanted)})
+        return {curr: rate for curr, rate in reply.get('rates', {}).items()
+                if curr in wanted}
+
+    def fetch_range(self, days: list, pivot: str, wanted: tuple):
+        """ GET the base vectors of several dates in one request """
+
+        if not days:
+            return {}
+        reply = self._get_json('timeseries', {
+            'base': pivot, 'symbols': ','.join(wanted),
+            'start_date': min(days).isoformat(),
+            'end_date': max(days).isoformat()})
+        days = set(days)
+        vectors = {}
+        for day, vector in reply.get('rates', {}).items():
+            day = date.fromisoformat(day)
+            if day in days:
+                vectors[day] = {curr: rate for curr, rate in vector.items()
+                                if curr in wanted}
+        return vectors
+
+
+class FallbackProvider(RateProvider):
+    """ Ordered chain of providers
+
+        Each provider is asked only for the currencies the previous ones
+        could not deliver. Failing providers are logged and skipped.
+    """
+
+    def __init__(self, providers: list):
+        """ FallbackProvider constructor """
+
+        super().__init__(timeout=None)
+        self.providers = list(providers)
+
+    @property
+    def supports_range(self):
+        return any(provider.supports_range for provider in self.providers)
+
+    def fetch(self, given_date: date, pivot: str, wanted: tuple):
+        """ Fetch from each provider in turn until nothing is missing """
+
+        vector = {}
+        for provider in self.providers:
+            missing = tuple(curr for curr in wanted if curr not in vector)
+            if not missing:
+                break
+            try:
+                vector.update(provider.fetch(given_date, pivot, missing))
+            except Exception as error:
+                logging.warning("Rate provider %s failed on %s: %r",
+                                provider.name, given_date, error)
+        return vector
+
+    def fetch_range(self, days: list, pivot: str, wanted: tuple):
+        """ Fetch from each provider in turn the dates still incomplete """
+
+        vectors = {}
+        for provider in self.providers:
+            missing = [day for day in days
+                       if any(curr not in vectors.get(day, {})
+                              for curr in wanted)]
+            if not missing:
+                break
+            try:
+                fetched = provider.fetch_range(missing, pivot, wanted)
+            except Exception as error:
+                logging.warning("Rate provider %s failed on %s days: %r",
+                                provider.name, len(missing), error)
+                continue
+            for day, vector in fetched.items():
+                vectors.setdefault(day, {}).update(vector)
+        return vectors
+
+
+def provider_from_config(config: str, timeout: float = DEFAULT_TIMEOUT):
+    """ Build a provider from a comma separated list of sources
+
+        Each source is 'forex', an http(s) URL of a rate service or the
+        path of a recorded JSON file. Several sources make a fallback chain.
+    """
+
+    providers = []
+    for source in config.split(','):
+        source = source.strip()
+        if source == 'forex':
+            providers.append(ForexPythonProvider(timeout=timeout))
+        elif urlparse(source).scheme in ('http', 'https'):
+            providers.append(HttpRateProvider(source, timeout=timeout))
+        elif source:
+            providers.append(RecordedRateProvider(source))
+    if len(providers) == 1:
+        return providers[0]
+    return FallbackProvider(providers)
+
+
+def serve_rates(provider: RateProvider, host: str = '127.0.0.1',
+                port: int = 0, symbols: tuple = None):
+    """ Start the stand-in rate server of src.rateserver """
+
+    from src.rateserver import serve_rates as start_server
+    return start_server(provider, host, port, symbols)
+
+
+if __name__ == '__main__':
+    from src.rateserver import main
+    main()
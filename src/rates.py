@@ -0,0 +1,793 @@
+#!/usr/bin/env python3
+
+""" Persistent exchange rate cache and cross-rate engine """
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, timedelta
+import numpy as np
+
+from src.providers import RateProvider, provider_from_config, DEFAULT_TIMEOUT
+
+# cfr. sqlite3 https://docs.python.org/3/library/sqlite3.html
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.expanduser('~'), '.networth', 'rates.sqlite3')
+
+# seconds a rate fetched for the current day is trusted before refreshing
+TODAY_TTL = 3600
+
+# days fetched before a prefetched range to forward-fill its first days
+LOOKBACK_DAYS = 7
+
+# threads fetching base vectors of distinct dates concurrently
+MAX_WORKERS = 8
+
+# prefetched RateTables kept by a RateEngine, the oldest go first
+MAX_TABLES = 8
+
+# consecutive failures that open the circuit, and seconds it stays open
+FAILURE_THRESHOLD = 3
+RESET_TIMEOUT = 30
+
+
+class RateNotAvailableError(LookupError):
+    """ An exchange rate needed for a valuation could not be obtained """
+
+
+class RateCache:
+    """ Store of exchange rates keyed by (date, from_currency, to_currency)
+
+        Rates fetched after the day they refer to are final and cached
+        forever. Rates fetched on the day they refer to are provisional
+        and are only served for today_ttl seconds. Rates the service has
+        none of, e.g. on holidays, are kept as such with the same rules.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS rates (
+            given_date TEXT NOT NULL,
+            from_currency TEXT NOT NULL,
+            to_currency TEXT NOT NULL,
+            rate REAL NOT NULL,
+            fetched_at REAL NOT NULL,
+            PRIMARY KEY (given_date, from_currency, to_currency)
+        )"""
+
+    NO_RATES_SCHEMA = """
+        CREATE TABLE IF NOT EXISTS no_rates (
+            given_date TEXT NOT NULL,
+            from_currency TEXT NOT NULL,
+            to_currency TEXT NOT NULL,
+            checked_at REAL NOT NULL,
+            PRIMARY KEY (given_date, from_currency, to_currency)
+        )"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH,
+                 today_ttl: float = TODAY_TTL):
+        """ RateCache constructor. Use path=':memory:' for a volatile cache """
+
+        self.path = path
+        self.today_ttl = today_ttl
+        self.hits = 0
+        self.misses = 0
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """ Open the database on first use """
+
+        if self._connection is None:
+            if self.path != ':memory:':
+                directory = os.path.dirname(os.path.abspath(self.path))
+                os.makedirs(directory, exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.path, check_same_thread=False)
+            self._connection.execute(RateCache.SCHEMA)
+            self._connection.execute(RateCache.NO_RATES_SCHEMA)
+            self._connection.commit()
+        return self._connection
+
+    def is_fresh(self, given_date: date, fetched_at: float, now=None):
+        """ Check whether a stored rate can still be served """
+
+        if now is None:
+            now = time.time()
+        if given_date < date.fromtimestamp(fetched_at):
+            return True  # final rate, fetched after the day was over
+        return now - fetched_at <= self.today_ttl
+
+    def get(self, given_date: date, from_currency: str, to_currency: str):
+        """ Get a cached rate, returns None on a miss """
+
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT rate, fetched_at FROM rates WHERE given_date = ?"
+                " AND from_currency = ? AND to_currency = ?",
+                (given_date.isoformat(), from_currency, to_currency)
+            ).fetchone()
+            if row is not None and self.is_fresh(given_date, row[1]):
+                self.hits += 1
+                return row[0]
+            self.misses += 1
+        return None
+
+    def put(self, given_date: date, from_currency: str, to_currency: str,
+            rate: float, fetched_at=None):
+        """ Store a rate fetched from the exchange rate service """
+
+        if fetched_at is None:
+            fetched_at = time.time()
+        with self._lock:
+            connection = self._connect()
+            connection.execute(
+                "INSERT OR REPLACE INTO rates VALUES (?, ?, ?, ?, ?)",
+                (given_date.isoformat(), from_currency, to_currency,
+                 float(rate), fetched_at))
+            connection.commit()
+
+    def get_vector(self, given_date: date, from_currency: str,
+                   stale: bool = False):
+        """
+        Get every cached rate from a currency on a given date
+        stale flag = True also returns rates older than the TTL
+        """
+
+        vector = {}
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT to_currency, rate, fetched_at FROM rates"
+                " WHERE given_date = ? AND from_currency = ?",
+                (given_date.isoformat(), from_currency)).fetchall()
+        for to_currency, rate, fetched_at in rows:
+            if stale or self.is_fresh(given_date, fetched_at):
+                vector[to_currency] = rate
+        return vector
+
+    def put_vector(self, given_date: date, from_currency: str, vector: dict,
+                   fetched_at=None):
+        """ Store rates from a currency to several currencies at once """
+
+        if fetched_at is None:
+            fetched_at = time.time()
+        with self._lock:
+            connection = self._connect()
+            connection.executemany(
+                "INSERT OR REPLACE INTO rates VALUES (?, ?, ?, ?, ?)",
+                [(given_date.isoformat(), from_currency, to_currency,
+                  float(rate), fetched_at)
+                 for to_currency, rate in vector.items()])
+            connection.commit()
+
+    def get_range(self, start: date, end: date, from_currency: str):
+        """ Get every cached rate from a currency between two dates """
+
+        vectors = {}
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT given_date, to_currency, rate, fetched_at FROM rates"
+                " WHERE given_date BETWEEN ? AND ? AND from_currency = ?",
+                (start.isoformat(), end.isoformat(), from_currency)
+            ).fetchall()
+        for given_date, to_currency, rate, fetched_at in rows:
+            given_date = date.fromisoformat(given_date)
+            if self.is_fresh(given_date, fetched_at):
+                vectors.setdefault(given_date, {})[to_currency] = rate
+        return vectors
+
+    def put_range(self, from_currency: str, vectors: dict, fetched_at=None):
+        """ Store base vectors for several dates at once """
+
+        if fetched_at is None:
+            fetched_at = time.time()
+        with self._lock:
+            connection = self._connect()
+            connection.executemany(
+                "INSERT OR REPLACE INTO rates VALUES (?, ?, ?, ?, ?)",
+                [(given_date.isoformat(), from_currency, to_currency,
+                  float(rate), fetched_at)
+                 for given_date, vector in vectors.items()
+                 for to_currency, rate in vector.items()])
+            connection.commit()
+
+    def get_no_rates(self, start: date, end: date, from_currency: str):
+        """
+        Get the currencies the service had no rate for from a currency
+        between two dates, {date: set of currencies}
+        """
+
+        missing = {}
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT given_date, to_currency, checked_at FROM no_rates"
+                " WHERE given_date BETWEEN ? AND ? AND from_currency = ?",
+                (start.isoformat(), end.isoformat(), from_currency)
+            ).fetchall()
+        for given_date, to_currency, checked_at in rows:
+            given_date = date.fromisoformat(given_date)
+            if self.is_fresh(given_date, checked_at):
+                missing.setdefault(given_date, set()).add(to_currency)
+        return missing
+
+    def put_no_rates(self, from_currency: str, missing: dict,
+                     checked_at=None):
+        """ Store the currencies the service had no rate for on some dates,
+            given as {date: currencies} """
+
+        if checked_at is None:
+            checked_at = time.time()
+        with self._lock:
+            connection = self._connect()
+            connection.executemany(
+                "INSERT OR REPLACE INTO no_rates VALUES (?, ?, ?, ?)",
+                [(given_date.isoformat(), from_currency, to_currency,
+                  checked_at)
+                 for given_date, currencies in missing.items()
+                 for to_currency in currencies])
+            connection.commit()
+
+    def clear(self):
+        """ Remove every cached rate """
+
+        with self._lock:
+            connection = self._connect()
+            connection.execute("DELETE FROM rates")
+            connection.execute("DELETE FROM no_rates")
+            connection.commit()
+
+    def reset_stats(self):
+        """ Reset hit and miss counters """
+
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        """ Close the database """
+
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+
+_rate_cache = None
+
+
+def get_rate_cache():
+    """ Get the RateCache used by get_exchange_rate
+
+        Location and TTL can be configured with the NETWORTH_RATE_CACHE
+        and NETWORTH_RATE_TTL environment variables.
+    """
+
+    global _rate_cache
+    if _rate_cache is None:
+        path = os.environ.get('NETWORTH_RATE_CACHE', DEFAULT_CACHE_PATH)
+        today_ttl = float(os.environ.get('NETWORTH_RATE_TTL', TODAY_TTL))
+        logging.debug("Opening rate cache %s", path)
+        _rate_cache = RateCache(path=path, today_ttl=today_ttl)
+    return _rate_cache
+
+
+def set_rate_cache(rate_cache: RateCache):
+    """ Replace the RateCache used by get_exchange_rate """
+
+    global _rate_cache
+    _rate_cache = rate_cache
+    return _rate_cache
+
+
+class RateTable:
+    """ Dense table of base vectors indexed by day offset from start
+
+        Lookups are O(1). Days without rates (weekends, holidays) are
+        forward-filled from the last day with rates. A table with today's
+        provisional rates expires at expires_at, a time.monotonic() value.
+    """
+
+    def __init__(self, start: date, end: date, currencies: tuple,
+                 vectors: dict, expires_at: float = None):
+        """ RateTable constructor from a dict {date: base vector} """
+
+        self.start = start
+        self.end = end
+        self.expires_at = expires_at
+        self.currencies = tuple(currencies)
+        self.columns = {curr: j for j, curr in enumerate(self.currencies)}
+        if end < start:
+            # empty range, e.g. starting after today
+            self.vectors = np.empty((0, len(self.currencies)))
+            return
+
+        first = min([start] + list(vectors))
+        offset = (start - first).days
+        days = (end - first).days + 1
+        table = np.full((days, len(self.currencies)), np.nan)
+        for given_date, vector in vectors.items():
+            i = (given_date - first).days
+            if 0 <= i < days:
+                for curr, rate in vector.items():
+                    if curr in self.columns:
+                        table[i, self.columns[curr]] = rate
+
+        # forward-fill each column with the last row that has a rate
+        rows = np.arange(days)[:, None]
+        last_valid = np.where(np.isnan(table), 0, rows)
+        np.maximum.accumulate(last_valid, axis=0, out=last_valid)
+        table = np.take_along_axis(table, last_valid, axis=0)
+        self.vectors = table[offset:]
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def expired(self):
+        """ Check whether the provisional rates of today are outdated """
+
+        return self.expires_at is not None and \
+            self.expires_at <= time.monotonic()
+
+    def covers(self, given_date: date):
+        """ Check whether a date is inside the table """
+
+        return self.start <= given_date <= self.end
+
+    def contains(self, other):
+        """ Check whether the table holds every rate of another table """
+
+        return self.start <= other.start and other.end <= self.end and \
+            all(curr in self.columns for curr in other.currencies)
+
+    def rate(self, given_date: date, from_currency: str, to_currency: str):
+        """ Get exchange rate on a given date, None if not available """
+
+        if not self.covers(given_date) or \
+                from_currency not in self.columns or \
+                to_currency not in self.columns:
+            return None
+        row = self.vectors[(given_date - self.start).days]
+        rate = row[self.columns[to_currency]] / row[self.columns[from_currency]]
+        if np.isnan(rate):
+            return None
+        return float(rate)
+
+    def complete(self, start: date, end: date, currencies: tuple):
+        """ Check whether the table has every rate of some currencies
+            between two dates """
+
+        if not (self.covers(start) and self.covers(end)) or \
+                any(curr not in self.columns for curr in currencies):
+            return False
+        rows = self.vectors[(start - self.start).days:
+                            (end - self.start).days + 1]
+        return not np.isnan(
+            rows[:, [self.columns[curr] for curr in currencies]]).any()
+
+    def rates(self, from_currency: str, to_currency: str):
+        """ Get array of daily exchange rates over the whole table """
+
+        return (self.vectors[:, self.columns[to_currency]] /
+                self.vectors[:, self.columns[from_currency]])
+
+
+class CircuitBreaker:
+    """ Stop calling a failing rate service for a while
+
+        After failure_threshold consecutive failures the circuit opens and
+        calls are refused without waiting for the service. After
+        reset_timeout seconds one trial call is let through: success
+        closes the circuit, failure keeps it open for another period.
+    """
+
+    def __init__(self, failure_threshold: int = FAILURE_THRESHOLD,
+                 reset_timeout: float = RESET_TIMEOUT):
+        """ CircuitBreaker constructor """
+
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        """ 'closed', 'open' or 'half-open' """
+
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return 'open'
+        return 'half-open'
+
+    def allow(self):
+        """ Check whether a call to the service may go ahead """
+
+        with self._lock:
+            state = self.state
+            if state == 'half-open':
+                # let this caller try, keep the others out meanwhile
+                self.opened_at = time.monotonic()
+            return state != 'open'
+
+    def record_success(self):
+        """ Close the circuit """
+
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        """ Count a failure, opening the circuit at the threshold """
+
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold or \
+                    self.opened_at is not None:
+                if self.opened_at is None:
+                    logging.warning("Rate service failed %s times, pausing"
+                                    " requests for %ss", self.failures,
+                                    self.reset_timeout)
+                self.opened_at = time.monotonic()
+
+
+class RateEngine:
+    """ Exchange rates derived from one base vector per date
+
+        The base vector holds the rate from the pivot currency to every
+        supported currency, so any pair is vector[to] / vector[from] and
+        N currencies need one lookup per date instead of N² pairs.
+    """
+
+    def __init__(self, currencies: tuple, crypto: tuple, pivot: str = 'EUR',
+                 rate_cache: RateCache = None, provider: RateProvider = None,
+                 stale_while_revalidate: bool = False,
+                 breaker: CircuitBreaker = None):
+        """
+        RateEngine constructor. By default rates are fetched from the
+        sources listed in the NETWORTH_RATES environment variable
+        (see providers.provider_from_config), or from forex-python.
+        stale_while_revalidate flag = True serves expired cached rates
+        at once and refreshes them in the background.
+        """
+
+        self.currencies = tuple(currencies)
+        self.crypto = tuple(crypto)
+        self.pivot = pivot
+        self._rate_cache = rate_cache
+        self._provider = provider
+        self.fetches = 0  # number of requests to the provider
+        self.tables = []  # prefetched RateTables, newest first, see prefetch
+        self.stale_while_revalidate = stale_while_revalidate
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self._executor = None
+        # {(provider, pivot, date): (Future, wanted)} of fetches in progress
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    @property
+    def rate_cache(self):
+        """ RateCache storing the base vectors """
+
+        if self._rate_cache is None:
+            return get_rate_cache()
+        return self._rate_cache
+
+    @property
+    def provider(self):
+        """ RateProvider used to fetch base vectors """
+
+        if self._provider is None:
+            self._provider = provider_from_config(
+                os.environ.get('NETWORTH_RATES', 'forex'),
+                timeout=float(os.environ.get('NETWORTH_RATE_TIMEOUT',
+                                             DEFAULT_TIMEOUT)))
+        return self._provider
+
+    @provider.setter
+    def provider(self, provider: RateProvider):
+        self._provider = provider
+
+    def fetch_base_vector(self, given_date: date, wanted: tuple):
+        """ Fetch rates from the pivot currency on a given date """
+
+        self.fetches += 1
+        return self.provider.fetch(given_date, self.pivot, wanted)
+
+    def fetch_base_vectors(self, days: list, wanted: tuple):
+        """ Fetch base vectors for several dates, returns {date: vector} """
+
+        self.fetches += 1 if self.provider.supports_range else len(days)
+        return self.provider.fetch_range(days, self.pivot, wanted)
+
+    def prefetch(self, start: date, end: date, wanted: tuple = None):
+        """ Load all rates between two dates into a RateTable
+
+            Cached rates are read in one query and only the rates still
+            missing are fetched, forex rates on business days and crypto
+            rates every day: in one request from providers that support
+            ranges (the stand-in rate server, recorded rates), and one
+            request per day from forex-python, whose service has no time
+            series of forex rates. Rates the service has none of are
+            cached as such. The table is used by get_rate from then on,
+            instead of the older tables it contains, and only the
+            MAX_TABLES newest tables are kept. A table ending today
+            expires with today's rates, after the rate cache TTL.
+        """
+
+        if wanted is None:
+            wanted = self.currencies + self.crypto
+        wanted = tuple(curr for curr in wanted if curr != self.pivot)
+        end = min(end, date.today())
+        if end < start:
+            # no rates after today: nothing to fetch nor to keep
+            return RateTable(start, end, (self.pivot,) + wanted, {})
+        first = start - timedelta(days=LOOKBACK_DAYS)
+
+        vectors = self.rate_cache.get_range(first, end, self.pivot)
+        no_rates = self.rate_cache.get_no_rates(first, end, self.pivot)
+        crypto = tuple(curr for curr in wanted if curr in self.crypto)
+        missing = {}  # {currencies to fetch: days}
+        for i in range((end - first).days + 1):
+            day = first + timedelta(days=i)
+            # forex markets close on weekends, crypto markets do not
+            due = wanted if day.weekday() < 5 else crypto
+            known = vectors.get(day, {}).keys() | no_rates.get(day, set())
+            if any(curr not in known for curr in due):
+                missing.setdefault(due, []).append(day)
+        for due, days in missing.items():
+            fetched = self._fetch_range_guarded(days, due)
+            if fetched is None:
+                continue  # failed: fetched again by the next prefetch
+            for vector in fetched.values():
+                vector.pop(self.pivot, None)
+            self.rate_cache.put_range(self.pivot, fetched)
+            self.rate_cache.put_no_rates(self.pivot, {
+                day: [curr for curr in due if curr not in fetched.get(day, {})]
+                for day in days})
+            for day, vector in fetched.items():
+                vectors.setdefault(day, {}).update(vector)
+
+        for vector in vectors.values():
+            vector[self.pivot] = 1.0
+        expires_at = time.monotonic() + self.rate_cache.today_ttl \
+            if end >= date.today() else None
+        table = RateTable(start, end, (self.pivot,) + wanted, vectors,
+                          expires_at)
+        with self._lock:
+            # replaced, not copied in place, as get_rate may be reading it
+            self.tables = ([table] + [
+                older for older in self.tables
+                if not table.contains(older) and not older.expired()
+            ])[:MAX_TABLES]
+        return table
+
+    def _fetch_range_guarded(self, days: list, wanted: tuple):
+        """ Fetch base vectors of several dates unless the circuit is open
+
+            Failures are logged and return None.
+        """
+
+        if not self.breaker.allow():
+            return None
+        logging.debug("Fetching rates for %s days between %s and %s",
+                      len(days), days[0], days[-1])
+        try:
+            fetched = self.fetch_base_vectors(days, wanted)
+        except Exception as error:
+            self.breaker.record_failure()
+            logging.warning("Fetching rates between %s and %s failed: %r",
+                            days[0], days[-1], error)
+            return None
+        self.breaker.record_success()
+        return fetched
+
+    def find_table(self, start: date, end: date, wanted: tuple = None):
+        """
+        Get a prefetched RateTable with every rate between two dates,
+        None if prefetch is needed
+        """
+
+        if wanted is None:
+            wanted = self.currencies + self.crypto
+        end = min(end, date.today())
+        if end < start:
+            return None
+        for table in self.tables:
+            if not table.expired() and \
+                    table.complete(start, end, (self.pivot,) + tuple(wanted)):
+                return table
+        return None
+
+    def clear_tables(self):
+        """ Forget every prefetched RateTable """
+
+        self.tables = []
+
+    def _get_executor(self):
+        """ Thread pool for concurrent and background fetches """
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=MAX_WORKERS, thread_name_prefix='rates')
+        return self._executor
+
+    def _fetch_guarded(self, given_date: date, wanted: tuple):
+        """ Fetch and cache a base vector unless the circuit is open
+
+            Failures are logged and return an empty vector.
+        """
+
+        if not self.breaker.allow():
+            logging.warning("Rate service unavailable, not fetching rates"
+                            " on %s", given_date)
+            return {}
+        try:
+            fetched = self.fetch_base_vector(given_date, wanted)
+        except Exception as error:
+            self.breaker.record_failure()
+            logging.warning("Fetching rates on %s failed: %r",
+                            given_date, error)
+            return {}
+        self.breaker.record_success()
+        fetched.pop(self.pivot, None)
+        if fetched:
+            self.rate_cache.put_vector(given_date, self.pivot, fetched)
+        return fetched
+
+    def _fetch_shared(self, given_date: date, wanted: tuple):
+        """
+        Fetch the base vector of a date once for all concurrent callers of
+        the same provider and pivot. A caller wanting currencies the fetch
+        in flight does not ask for fetches those once it is done
+        """
+
+        key = (self.provider, self.pivot, given_date)
+        vector = {}
+        while True:
+            with self._lock:
+                inflight = self._inflight.get(key)
+                # a finished fetch may not be removed yet: fetch anew
+                if inflight is None or inflight[0].done():
+                    future = Future()
+                    self._inflight[key] = (future, wanted)
+                    break
+            shared, shared_wanted = inflight
+            vector.update(shared.result())
+            wanted = tuple(curr for curr in wanted
+                           if curr not in shared_wanted)
+            if not wanted:
+                return vector
+
+        try:
+            fetched = self._fetch_guarded(given_date, wanted)
+            future.set_result(fetched)
+        except BaseException as error:
+            future.set_exception(error)
+            raise
+        finally:
+            with self._lock:
+                if self._inflight.get(key, (None,))[0] is future:
+                    del self._inflight[key]
+        vector.update(fetched)
+        return vector
+
+    def get_base_vector(self, given_date: date, wanted: tuple = None):
+        """ Get rates from the pivot currency, fetching only what is missing """
+
+        if wanted is None:
+            wanted = self.currencies + self.crypto
+        vector = self.rate_cache.get_vector(given_date, self.pivot)
+        vector[self.pivot] = 1.0
+        if all(curr in vector for curr in wanted):
+            return vector
+
+        # fetch the whole vector so that the next pairs are cached too
+        missing = tuple(dict.fromkeys(
+            curr for curr in self.currencies + self.crypto + tuple(wanted)
+            if curr not in vector))
+
+        if self.stale_while_revalidate:
+            stale = self.rate_cache.get_vector(given_date, self.pivot,
+                                               stale=True)
+            stale[self.pivot] = 1.0
+            if all(curr in stale for curr in wanted):
+                logging.debug("Serving stale rates on %s", given_date)
+                self._get_executor().submit(self._fetch_shared, given_date,
+                                            missing)
+                return stale
+
+        logging.debug("Fetching %s rates on %s", str(missing), given_date)
+        vector.update(self._fetch_shared(given_date, missing))
+        return vector
+
+    def get_rate(self, given_date: date, from_currency: str, to_currency: str):
+        """ Get exchange rate between any two supported currencies """
+
+        for table in self.tables:
+            rate = table.rate(given_date, from_currency, to_currency)
+            if rate is not None and not table.expired():
+                return rate
+
+        vector = self.get_base_vector(given_date,
+                                      (from_currency, to_currency))
+        if from_currency not in vector or to_currency not in vector:
+            logging.warning("Rate %s/%s not available on %s",
+                            from_currency, to_currency, given_date)
+            return None
+        return vector[to_currency] / vector[from_currency]
+
+    def get_rates(self, keys):
+        """
+        Get exchange rates for several (date, from_currency, to_currency)
+        keys. Base vectors of distinct dates are fetched concurrently
+        """
+
+        rates = {}
+        wanted_by_date = {}
+        for key in keys:
+            given_date, from_currency, to_currency = key
+            for table in self.tables:
+                rates[key] = table.rate(given_date, from_currency, to_currency)
+                if rates[key] is not None and not table.expired():
+                    break
+                rates[key] = None
+            else:
+                wanted_by_date.setdefault(given_date, set()).update(
+                    (from_currency, to_currency))
+
+        dates = list(wanted_by_date)
+        if len(dates) > 1:
+            vectors = self._get_executor().map(
+                lambda given_date: self.get_base_vector(
+                    given_date, tuple(wanted_by_date[given_date])), dates)
+        else:
+            vectors = [self.get_base_vector(given_date,
+                                            tuple(wanted_by_date[given_date]))
+                       for given_date in dates]
+        vectors = dict(zip(dates, vectors))
+
+        for key in keys:
+            given_date, from_currency, to_currency = key
+            if rates.get(key) is not None:
+                continue
+            vector = vectors[given_date]
+            if from_currency in vector and to_currency in vector:
+                rates[key] = vector[to_currency] / vector[from_currency]
+            else:
+                logging.warning("Rate %s/%s not available on %s",
+                                from_currency, to_currency, given_date)
+                rates[key] = None
+        return rates
+
+
+_rate_engine = None
+
+
+def get_rate_engine():
+    """ Get the RateEngine used by get_exchange_rate """
+
+    global _rate_engine
+    if _rate_engine is None:
+        from src.utils import Portfolio
+        _rate_engine = RateEngine(currencies=Portfolio.CURRENCIES,
+                                  crypto=Portfolio.CRYPTO)
+    return _rate_engine
+
+
+def set_rate_engine(rate_engine: RateEngine):
+    """ Replace the RateEngine used by get_exchange_rate """
+
+    global _rate_engine
+    _rate_engine = rate_engine
+    return _rate_engine
+
+
+def set_rate_provider(provider: RateProvider):
+    """ Replace the RateProvider of the RateEngine used by get_exchange_rate """
+
+    rate_engine = get_rate_engine()
+    rate_engine.provider = provider
+    return provider
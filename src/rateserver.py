@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+""" Local stand-in rate server, serving the rates of a provider over HTTP
+
+    Usage: python3 -m src.rateserver recording.json [port]
+"""
+
+import sys
+import json
+import logging
+import threading
+from datetime import date
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.providers import RateProvider, RecordedRateProvider
+from src.utils import Portfolio
+
+# cfr. http.server https://docs.python.org/3/library/http.server.html
+
+# currencies served when a request names none
+SYMBOLS = Portfolio.CURRENCIES + Portfolio.CRYPTO
+
+
+class RateRequestHandler(BaseHTTPRequestHandler):
+    """ Request handler of the stand-in rate server """
+
+    def do_GET(self):
+        """ Serve /latest, /<YYYY-MM-DD> and /timeseries """
+
+        url = urlparse(self.path)
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        pivot = params.get('base', 'EUR')
+        wanted = tuple(curr for curr in params.get('symbols', '').split(',')
+                       if curr)
+        provider = self.server.provider
+        if not wanted:
+            wanted = self.server.symbols
+        path = url.path.strip('/')
+        try:
+            if path == 'timeseries':
+                start = date.fromisoformat(params['start_date'])
+                end = date.fromisoformat(params['end_date'])
+                days = [date.fromordinal(ordinal) for ordinal in
+                        range(start.toordinal(), end.toordinal() + 1)]
+                vectors = provider.fetch_range(days, pivot, wanted)
+                reply = {'base': pivot, 'rates': {
+                    day.isoformat(): vector
+                    for day, vector in vectors.items() if vector}}
+            else:
+                given_date = date.today() if path == 'latest' \
+                    else date.fromisoformat(path)
+                vector = provider.fetch(given_date, pivot, wanted)
+                if not vector:
+                    self.send_error(404, 'Rates not available')
+                    return
+                reply = {'base': pivot, 'date': given_date.isoformat(),
+                         'rates': vector}
+        except (KeyError, ValueError):
+            self.send_error(400, 'Bad request')
+            return
+
+        body = json.dumps(reply).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug("Stand-in rate server: " + format, *args)
+
+
+def serve_rates(provider: RateProvider, host: str = '127.0.0.1',
+                port: int = 0, symbols: tuple = None):
+    """ Start the stand-in rate server in a background thread
+
+        Any RateProvider can be served, e.g. a RecordedRateProvider.
+        symbols are the currencies served when a request names none, every
+        supported currency by default. Returns the server, its URL is
+        http://host:server.server_port. Call server.shutdown() to stop it.
+    """
+
+    server = ThreadingHTTPServer((host, port), RateRequestHandler)
+    server.daemon_threads = True
+    server.provider = provider
+    server.symbols = symbols or SYMBOLS
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    logging.info("Stand-in rate server listening on %s:%s",
+                 host, server.server_port)
+    return server
+
+
+def main():
+    """ Usage: python3 -m src.rateserver recording.json [port] """
+
+    provider = RecordedRateProvider(sys.argv[1])
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8000
+    server = ThreadingHTTPServer(('127.0.0.1', port), RateRequestHandler)
+    server.provider = provider
+    server.symbols = SYMBOLS
+    print(f"Serving {sys.argv[1]} on http://127.0.0.1:{port}")
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
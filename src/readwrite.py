@@ -1,13 +1,60 @@
 #!/usr/bin/env python3
 
+import os
+import uuid
 import logging
 import json
+from functools import partial
 
-import tkinter as tk
-from tkinter import filedialog
 from datetime import date, datetime
 
-from src.utils import Portfolio
+from src.utils import Portfolio, LazyStr
+from src.jsonstream import JsonStream
+from src.snapshots import get_snapshot_cache
+from src.npzformat import is_npz_file, portfolio_from_npz, \
+    save_portfolio_npz
+
+
+# attributes of an Item, saved before its ledger
+ITEM_KEYS = ['category', 'subcategory', 'currency', 'name', 'description']
+
+# sidecar file with the changes made after a Portfolio file was saved
+JOURNAL_SUFFIX = '.journal'
+
+# opened when no file is chosen, never journaled as the tests read it
+FALLBACK_PATH = './tests/fixtures.json'
+
+
+def add_item_from_dict(portfolio_object, i, sample):
+    """ Add to a Portfolio an Item without its ledger from a dict """
+
+    logging.info("Adding Item 'sample%02d' to Portfolio '%s'...\n%s",
+                 i, portfolio_object.name, sample)
+    unique_id = sample.get('unique_id')
+    item_object = portfolio_object.add_item(
+        category=sample['category'],
+        subcategory=sample['subcategory'],
+        currency=sample['currency'],
+        name=sample['name'],
+        description=sample['description'],
+        unique_id=uuid.UUID(unique_id) if unique_id else None)
+    if item_object is not None:
+        logging.info('Success')
+        logging.debug("Printing 'sample%02d' :\n\n %s",
+                      i, LazyStr(item_object.display))
+    return item_object
+
+
+# transactions of a streamed ledger loaded at once
+LEDGER_BATCH = 10000
+
+
+def feed_prices_from_list(item_object, prices):
+    """ Feed to an Item closing prices saved as [[date, close], ...] """
+
+    if prices:
+        dates, closes = zip(*prices)
+        item_object.feed_prices(dates, closes)
 
 
 def portfolio_from_dict(portfolio_dict):
@@ -17,51 +64,139 @@ def portfolio_from_dict(portfolio_dict):
         name=portfolio_dict['name'],
         currency=portfolio_dict['currency'],
         description=portfolio_dict['description'])
+    portfolio_object.journal_seq = portfolio_dict.get('journal_seq', 0)
 
     item_list = portfolio_dict['item_list']
 
     for i, sample in enumerate(item_list):
-        item_name = 'sample'+str(i).zfill(2)
-        logging.info("Adding Item '%s' to Portfolio '%s'...\n%s",
-                     item_name, portfolio_object.name, sample)
-        item_object = portfolio_object.add_item(
-            category=sample['category'],
-            subcategory=sample['subcategory'],
-            currency=sample['currency'],
-            name=sample['name'],
-            description=sample['description'])
-        if item_object in portfolio_object.item_list:
-            logging.info('Success')
-            logging.debug("Printing '%s' :\n\n %s",
-                          item_name, item_object.display())
-
-        if 'ledger' in sample:
-            ledger = sample['ledger']
-            for j, transaction in enumerate(ledger):
-                transaction_name = 'transaction'+str(j).zfill(3)
-                logging.info("Applying transaction '%s' to Item '%s'...\n%s",
-                             transaction_name, item_object.name, transaction)
-                transaction_type, transaction_data = transaction
-                if transaction_type == 'purchase':
-                    item_object.purchase(
-                        when=transaction_data['when'],
-                        units_purchased=transaction_data['units_purchased'],
-                        unit_price=transaction_data['unit_price'],
-                        fees=transaction_data['fees'],
-                    )
-                else:
-                    debug.warning("Unsupported transaction of type %s",
-                                  transaction_type)
+        item_object = add_item_from_dict(portfolio_object, i, sample)
+        if item_object is None:
+            continue
+        item_object.load_ledger(sample.get('ledger', []))
+        feed_prices_from_list(item_object, sample.get('prices'))
 
     return portfolio_object
 
 
+def read_json_span(json_file_path: str, start: int, end: int):
+    """ Decode the value between two byte offsets of a JSON file """
+
+    with open(json_file_path, 'rb') as json_file:
+        json_file.seek(start)
+        text = json_file.read(end - start).decode('utf-8')
+    return json.loads(text, object_hook=deserialize_date)
+
+
+def load_ledger_stream(item_object, stream):
+    """ Load in batches the transactions of the ledger a JsonStream is at """
+
+    batch = []
+    for _ in stream.array_items():
+        batch.append(stream.value())
+        if len(batch) == LEDGER_BATCH:
+            item_object.load_ledger(batch)
+            batch = []
+    item_object.load_ledger(batch)
+
+
+def load_ledger_span(item_object, json_file_path: str, start: int):
+    """ Load in batches the ledger at a byte offset of a JSON file """
+
+    with open(json_file_path, encoding='utf-8', newline='') as json_file:
+        json_file.seek(start)
+        load_ledger_stream(item_object,
+                           JsonStream(json_file, object_hook=deserialize_date))
+
+
+def item_from_stream(portfolio_object, i, stream, lazy_path=None,
+                     json_path=None):
+    """
+    Add to a Portfolio the next Item of a JsonStream. Transactions are
+    loaded in batches as they are parsed when the Item attributes come
+    before the ledger, as save_portfolio_to_file writes them. Given
+    json_path, the file the stream reads, a ledger coming first, as in
+    files saved with sorted keys, is skipped and streamed from the file
+    after the attributes; otherwise it is kept in memory.
+    Given lazy_path, the ledger is skipped and the Item is a stub that
+    reads it from the file when first used
+    """
+
+    sample = {}
+    item_object = None
+    ledger = []  # only kept when the ledger comes before the attributes
+    ledger_span = None
+    for key in stream.object_items():
+        attributes_read = all(item_key in sample for item_key in ITEM_KEYS)
+        if key == 'ledger' and (lazy_path is not None or (
+                json_path is not None and item_object is None and
+                not attributes_read)):
+            start = stream.offset()
+            stream.skip()
+            ledger_span = (start, stream.offset())
+            continue
+        if key == 'ledger' and item_object is None and attributes_read:
+            item_object = add_item_from_dict(portfolio_object, i, sample)
+            if item_object is None:
+                stream.value()  # skip the ledger of an invalid Item
+                return None
+        if key == 'ledger' and item_object is not None:
+            load_ledger_stream(item_object, stream)
+        elif key == 'ledger':
+            ledger = stream.value()
+        else:
+            sample[key] = stream.value()
+
+    if item_object is None:
+        item_object = add_item_from_dict(portfolio_object, i, sample)
+        if item_object is None:
+            return None
+        if ledger_span is None:
+            item_object.load_ledger(ledger)
+    if ledger_span is not None and lazy_path is not None:
+        item_object.defer_ledger(partial(read_json_span, lazy_path,
+                                         *ledger_span))
+    elif ledger_span is not None:
+        load_ledger_span(item_object, json_path, ledger_span[0])
+    feed_prices_from_list(item_object, sample.get('prices'))
+    return item_object
+
+
+def portfolio_from_stream(json_file, lazy=False):
+    """
+    Generate a Portfolio from a JSON file read as a stream, so each Item
+    and transaction is replayed as soon as it is parsed. A file opened by
+    name with encoding='utf-8' and newline='' streams ledgers in any key
+    order, others keep in memory the ledgers saved before the attributes.
+    lazy flag = True skips the ledgers, leaving stub Items that load theirs
+    when first used. It needs such a file, which must not change while
+    the Portfolio is in use
+    """
+
+    json_path = getattr(json_file, 'name', None)
+    if not isinstance(json_path, str) or not os.path.isfile(json_path) or \
+            getattr(json_file, 'encoding', None) != 'utf-8':
+        json_path = None
+    lazy_path = json_file.name if lazy else None
+    stream = JsonStream(json_file, object_hook=deserialize_date)
+    # attributes may come after item_list in files saved with sorted keys
+    portfolio_object = Portfolio(name='', description='', currency='EUR')
+    for key in stream.object_items():
+        if key == 'item_list':
+            for i in stream.array_items():
+                item_from_stream(portfolio_object, i, stream, lazy_path,
+                                 json_path)
+        elif key in ('name', 'description', 'currency', 'journal_seq'):
+            setattr(portfolio_object, key, stream.value())
+        else:
+            stream.value()
+    return portfolio_object
+
+
 def dict_from_portfolio(portfolio):
     """ Basic method to generate a dict from a Portfolio """
 
     portfolio_dict = {}
     portfolio_keys = ['name', 'description', 'currency']
-    item_keys = ['category', 'subcategory', 'currency', 'name', 'description']
     # ::bug:: these are not hist_pt properties they are parameters for purchase
     transaction_keys = ['when', 'units_purchased', 'unit_price', 'fees']
 
@@ -71,14 +206,18 @@ def dict_from_portfolio(portfolio):
         else:
             portfolio_dict[portfolio_key] = None
 
+    if getattr(portfolio, 'journal_seq', 0):
+        portfolio_dict['journal_seq'] = portfolio.journal_seq
+
     # scan and retrieve item_list
     item_list_dict = []
 
     if hasattr(portfolio, 'item_list'):
         for item in portfolio.item_list:
-            item_dict = {}
+            # unique_id identifies the Item in the journal
+            item_dict = {'unique_id': str(item.unique_id)}
             # retrieve keys
-            for item_key in item_keys:
+            for item_key in ITEM_KEYS:
                 if hasattr(item, item_key):
                     item_dict[item_key] = getattr(item, item_key)
                 else:
@@ -90,6 +229,12 @@ def dict_from_portfolio(portfolio):
                 for transaction in item.ledger:
                     ledger_dict.append(transaction)
 
+            # closing prices, only for Items that have them
+            if len(getattr(item, 'prices', ())):
+                item_dict['prices'] = [
+                    [when, close] for when, close in
+                    zip(item.prices.dates, item.prices.columns()[1].tolist())]
+
             item_dict['ledger'] = ledger_dict[:]
             item_list_dict.append(item_dict)
 
@@ -115,48 +260,115 @@ def deserialize_date(obj):
     return obj
 
 
-def read_portfolio_from_file(json_file_path=False):
-    """ Read Portfolio from a JSON file """
+def open_file_dialog():
+    """
+    Get tkinter filedialog, with its root window hidden. tkinter is only
+    imported here, headless scripts never need it
+    """
 
-    if not json_file_path:
-        root = tk.Tk()
-        root.withdraw()
+    import tkinter as tk
+    from tkinter import filedialog
+
+    root = tk.Tk()
+    root.withdraw()
+    return filedialog
+
+
+def read_portfolio_from_file(json_file_path=False, journaled=False,
+                             lazy=False, snapshots=True):
+    """
+    Read Portfolio from a JSON or .npz file, detected by its content, and
+    replay its journal if there is one. journaled flag = True records every
+    later change in the journal, so saving the Portfolio costs O(change),
+    unless no file is chosen and FALLBACK_PATH is read.
+    lazy flag = True reads Items first and each ledger when first used.
+    snapshots flag = True loads the Portfolio built from the same content
+    earlier, if still in the SnapshotCache, and saves it there otherwise.
+    Not for lazy Portfolios
+    """
 
+    if not json_file_path:
+        filedialog = open_file_dialog()
         json_file_path = filedialog.askopenfilename(
             initialdir='./tests/',
             title="Select a file",
-            filetypes=(("JSON files", "*.json"), ("all files", "*.*"))
+            filetypes=(("JSON files", "*.json"), ("NumPy files", "*.npz"),
+                       ("all files", "*.*"))
         )
 
     if not len(json_file_path):
-        json_file_path = "./tests/fixtures.json"
-
-    with open(json_file_path) as json_file:
-        portfolio_dict = json.load(
-            json_file, object_hook=deserialize_date)
-    portfolio = portfolio_from_dict(portfolio_dict)
+        json_file_path = FALLBACK_PATH
+        journaled = False
+
+    # stub Items need the file, so lazy Portfolios skip the snapshots
+    snapshot_cache = get_snapshot_cache() if snapshots and not lazy else None
+    portfolio = None
+    if snapshot_cache is not None:
+        snapshot_key = snapshot_cache.key(json_file_path)
+        portfolio = snapshot_cache.get(snapshot_key)
+
+    if portfolio is not None:
+        logging.info("Portfolio of %s loaded from a snapshot",
+                     json_file_path)
+    else:
+        if is_npz_file(json_file_path):
+            portfolio = portfolio_from_npz(json_file_path, lazy=lazy)
+        else:
+            with open(json_file_path, encoding='utf-8',
+                      newline='') as json_file:
+                portfolio = portfolio_from_stream(json_file, lazy=lazy)
+        if snapshot_cache is not None:
+            snapshot_cache.put(snapshot_key, portfolio)
+
+    entries = replay_journal(portfolio, json_file_path + JOURNAL_SUFFIX)
+    if journaled:
+        portfolio.journal = Journal(json_file_path, seq=portfolio.journal_seq,
+                                    entries=entries)
     return portfolio
 
 
+def write_portfolio_file(portfolio, file_path: str):
+    """ Write a whole Portfolio to a .npz file, or JSON otherwise """
+
+    if file_path.endswith('.npz'):
+        save_portfolio_npz(portfolio, file_path)
+    else:
+        portfolio_dict = dict_from_portfolio(portfolio)
+        with open(file_path, 'w', encoding='utf-8') as json_file:
+            # keys in insertion order: the attributes of the Portfolio and
+            # of each Item come before item_list and ledger, so the file
+            # can be read as a stream
+            json.dump(portfolio_dict, json_file, default=serialize_date,
+                      ensure_ascii=False, indent=4)
+
+
 def save_portfolio_to_file(portfolio, json_file_path=None):
-    """ Save Portfolio to a JSON file """
+    """
+    Save Portfolio to a JSON file, or a .npz file by its extension.
+    A journaled Portfolio is already saved in its journal, which is only
+    folded into the file once it holds Journal.COMPACT_AFTER entries
+    """
 
     saved = False
-    portfolio_dict = dict_from_portfolio(portfolio)
+    journal = getattr(portfolio, 'journal', None)
+    if json_file_path is None and journal is not None:
+        json_file_path = journal.base_path
+    if journal is not None and json_file_path == journal.base_path:
+        if journal.entries < Journal.COMPACT_AFTER:
+            return True
+        return compact_journal(portfolio)
+
     if json_file_path is None:
-        root = tk.Tk()
-        root.withdraw()
+        filedialog = open_file_dialog()
         json_file_path = filedialog.asksaveasfilename(
             initialdir='./tests/',
             title='Choose filename',
             defaultextension='.json',
-            filetypes=[("JSON files", "*.json")],
+            filetypes=[("JSON files", "*.json"), ("NumPy files", "*.npz")],
         )
 
     try:
-        with open(json_file_path, 'w', encoding='utf-8') as json_file:
-            json.dump(portfolio_dict, json_file, default=serialize_date,
-                      ensure_ascii=False, indent=4, sort_keys=True)
+        write_portfolio_file(portfolio, json_file_path)
         saved = True
     except Exception as error_msg:
         print("Saving failed because: ", error_msg)
@@ -164,6 +376,133 @@ def save_portfolio_to_file(portfolio, json_file_path=None):
         return saved
 
 
+class Journal:
+    """
+    Append-only sidecar of a Portfolio file, one JSON line per change.
+    Entries are numbered, and the file records the number of the last
+    entry folded into it, so an entry is never replayed twice
+    """
+
+    # entries that trigger compaction when the Portfolio is saved
+    COMPACT_AFTER = 1000
+
+    def __init__(self, base_path: str, seq: int = 0, entries: int = 0):
+        """ Journal constructor """
+
+        self.base_path = base_path
+        self.path = base_path + JOURNAL_SUFFIX
+        self.seq = seq  # number of the last entry
+        self.entries = entries  # entries not folded into the file yet
+
+    def append(self, entry: dict):
+        """ Append a change to the journal, returns its number """
+
+        self.seq += 1
+        line = json.dumps({'seq': self.seq, **entry}, default=serialize_date,
+                          ensure_ascii=False)
+        with open(self.path, 'a', encoding='utf-8') as journal_file:
+            journal_file.write(line + '\n')
+        self.entries += 1
+        return self.seq
+
+    def discard(self):
+        """ Drop the changes not folded into the file yet """
+
+        open(self.path, 'w').close()
+        self.entries = 0
+
+
+def read_journal(journal_path: str):
+    """ Get the entries of a journal file, skipping a truncated last line """
+
+    entries = []
+    with open(journal_path, encoding='utf-8') as journal_file:
+        for line in journal_file:
+            try:
+                entries.append(json.loads(line, object_hook=deserialize_date))
+            except json.JSONDecodeError:
+                logging.warning("Skipping unreadable journal entry in %s: %s",
+                                journal_path, line)
+    return entries
+
+
+def apply_journal_entry(portfolio, entry: dict):
+    """ Apply to a Portfolio a change read from its journal """
+
+    operation = entry['op']
+    item = None
+    if 'item' in entry:
+        item = portfolio.get_item(uuid.UUID(entry['item']))
+        if item is None and operation != 'add_item':
+            logging.warning("Journal entry %s refers to a missing Item %s",
+                            entry['seq'], entry['item'])
+            return
+    if operation == 'add_item':
+        portfolio.add_item(**entry['attributes'],
+                           unique_id=uuid.UUID(entry['item']))
+    elif operation == 'remove_item':
+        portfolio.remove_item(item)
+    elif operation == 'edit_item':
+        item.edit(**entry['attributes'])
+    elif operation == 'edit_portfolio':
+        portfolio.edit(**entry['attributes'])
+    elif operation == 'ledger':
+        item.load_ledger(entry['transactions'])
+    elif operation == 'prices':
+        item.feed_prices(entry['dates'], entry['closes'])
+    else:
+        logging.warning("Unsupported journal entry of type %s", operation)
+
+
+def replay_journal(portfolio, journal_path: str):
+    """
+    Apply the journal entries not folded into the Portfolio file yet.
+    Returns the number of entries applied
+    """
+
+    if not os.path.exists(journal_path):
+        return 0
+    journal, portfolio.journal = portfolio.journal, None
+    applied = 0
+    for entry in read_journal(journal_path):
+        if entry['seq'] <= portfolio.journal_seq:
+            continue
+        apply_journal_entry(portfolio, entry)
+        portfolio.journal_seq = entry['seq']
+        applied += 1
+    portfolio.journal = journal
+    return applied
+
+
+def compact_journal(portfolio):
+    """ Fold the journal of a Portfolio into its file and empty it """
+
+    journal = portfolio.journal
+    root, extension = os.path.splitext(journal.base_path)
+    compacting_path = root + '.compacting' + extension
+    try:
+        write_portfolio_file(portfolio, compacting_path)
+        os.replace(compacting_path, journal.base_path)
+    except Exception as error_msg:
+        print("Compaction failed because: ", error_msg)
+        return False
+    # the file now records the last entry: emptying the journal can fail
+    # without entries being applied twice
+    open(journal.path, 'w').close()
+    journal.entries = 0
+    return True
+
+
+def convert_portfolio_file(source_path: str, target_path: str):
+    """
+    Convert a Portfolio file between JSON and .npz, the format of the
+    target is given by its extension
+    """
+
+    return save_portfolio_to_file(read_portfolio_from_file(source_path),
+                                  target_path)
+
+
 if __name__ == '__main__':
 
     from tests.fixtures import sample_portfolio_dict
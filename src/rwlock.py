@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+""" Reader/writer lock for Portfolios shared between threads """
+
+import threading
+import functools
+from contextlib import contextmanager
+
+# cfr. threading https://docs.python.org/3/library/threading.html
+
+
+class ReadWriteLock:
+    """ Lock held by many readers or by one writer
+
+        Writers go first: once a writer waits, new readers wait for it,
+        so a steady flow of valuations cannot starve purchases. Both
+        sides are reentrant, and the writer may also read, but a reader
+        cannot become a writer, as two of them would wait for each other.
+    """
+
+    def __init__(self):
+        """ ReadWriteLock constructor """
+
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0  # threads reading
+        self._writers_waiting = 0
+        self._writer = None  # ident of the thread writing
+        self._writer_depth = 0
+        self._local = threading.local()  # depth of reading of each thread
+
+    def __reduce__(self):
+        # a pickled Portfolio gets a new lock, nobody holds it yet
+        return ReadWriteLock, ()
+
+    def acquire_read(self):
+        """ Wait until no writer holds or waits for the lock """
+
+        if self._writer == threading.get_ident():
+            self._writer_depth += 1
+            return
+        depth = getattr(self._local, 'depth', 0)
+        if not depth:
+            with self._condition:
+                while self._writer is not None or self._writers_waiting:
+                    self._condition.wait()
+                self._readers += 1
+        self._local.depth = depth + 1
+
+    def release_read(self):
+        """ Release a read, the last reader lets writers in """
+
+        if self._writer == threading.get_ident():
+            self._writer_depth -= 1
+            return
+        self._local.depth -= 1
+        if not self._local.depth:
+            with self._condition:
+                self._readers -= 1
+                # readers only ever wait for writers
+                if not self._readers and self._writers_waiting:
+                    self._condition.notify_all()
+
+    def acquire_write(self):
+        """ Wait until no other thread holds the lock """
+
+        me = threading.get_ident()
+        if self._writer == me:
+            self._writer_depth += 1
+            return
+        if getattr(self._local, 'depth', 0):
+            raise RuntimeError("A thread reading cannot start writing")
+        with self._condition:
+            self._writers_waiting += 1
+            try:
+                while self._writer is not None or self._readers:
+                    self._condition.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = me
+            self._writer_depth = 1
+
+    def release_write(self):
+        """ Release a write, the last one lets readers and writers in """
+
+        with self._condition:
+            self._writer_depth -= 1
+            if not self._writer_depth:
+                self._writer = None
+                self._condition.notify_all()
+
+    @contextmanager
+    def reading(self):
+        """ with lock.reading(): ... """
+
+        self.acquire_read()
+        try:
+            yield self
+        finally:
+            self.release_read()
+
+    @contextmanager
+    def writing(self):
+        """ with lock.writing(): ... """
+
+        self.acquire_write()
+        try:
+            yield self
+        finally:
+            self.release_write()
+
+
+def read_locked(method):
+    """
+    Decorate a method that reads an object with a lock attribute, which
+    is None unless the object is shared between threads
+    """
+
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        lock = self.lock
+        if lock is None:
+            return method(self, *args, **kwargs)
+        lock.acquire_read()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            lock.release_read()
+    return locked
+
+
+def write_locked(method):
+    """ Decorate a method that changes an object, see read_locked """
+
+    @functools.wraps(method)
+    def locked(self, *args, **kwargs):
+        lock = self.lock
+        if lock is None:
+            return method(self, *args, **kwargs)
+        lock.acquire_write()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            lock.release_write()
+    return locked
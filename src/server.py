@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+
+""" JSON HTTP API serving the valuation of Portfolios kept in memory
+
+    GET /portfolios                          loaded Portfolios
+    GET /portfolios/<id>/balance?date=       balance on a date
+    GET /portfolios/<id>/piechart?date=      % by subcategory on a date
+    GET /portfolios/<id>/series?start=&end=[&freq=D|W|M][&by=field]
+                                             balance series
+    Dates are YYYY-MM-DD, today by default. <id> is the file name of the
+    Portfolio without its extension.
+
+    Valuations run in worker threads, so the event loop keeps serving
+    while rates are fetched, and identical queries in flight share one
+    valuation. With several workers the Portfolios are made concurrent.
+
+    Usage: python3 -m src.server portfolio.json [...] [--host H] [--port P]
+           [--workers N] [--log-level ERROR]
+"""
+
+import os
+import sys
+import json
+import asyncio
+import logging
+import argparse
+from datetime import date
+from urllib.parse import urlsplit, parse_qsl
+from concurrent.futures import ThreadPoolExecutor
+
+from src.rates import RateNotAvailableError
+from src.readwrite import read_portfolio_from_file
+
+# cfr. asyncio streams https://docs.python.org/3/library/asyncio-stream.html
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 500: 'Internal Server Error',
+           503: 'Service Unavailable'}
+
+# longest request head accepted
+MAX_HEAD = 16 * 1024
+
+
+class HttpError(Exception):
+    """ Error answered to the client with an HTTP status """
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_date(params: dict, name: str, default: date = None):
+    """ Date query parameter, HttpError 400 if malformed """
+
+    if name not in params:
+        if default is None:
+            raise HttpError(400, f"Missing parameter '{name}'")
+        return default
+    try:
+        return date.fromisoformat(params[name])
+    except ValueError:
+        raise HttpError(400, f"Parameter '{name}' is not a YYYY-MM-DD date")
+
+
+class PortfolioServer:
+    """ Valuation queries over Portfolios kept in memory
+
+        query() coalesces identical queries: while one is being valued,
+        the same query waits for its result instead of valuing again.
+    """
+
+    def __init__(self, portfolios: dict, workers: int = 1):
+        """ PortfolioServer constructor from a dict {id: Portfolio} """
+
+        self.portfolios = portfolios
+        if workers > 1:
+            # valued by several threads at once
+            for portfolio in portfolios.values():
+                portfolio.concurrent = True
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix='valuation')
+        self.pending = {}  # {query key: future of its valuation}
+        self.requests = 0
+        self.coalesced = 0
+
+    async def query(self, key: tuple, function, *args):
+        """ Run function(*args) in the valuation thread, once per key """
+
+        future = self.pending.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().run_in_executor(
+                self.executor, function, *args)
+            self.pending[key] = future
+            future.add_done_callback(lambda _: self.pending.pop(key, None))
+        else:
+            self.coalesced += 1
+        # a client that goes away must not cancel the others' valuation
+        return await asyncio.shield(future)
+
+    def get_portfolio(self, portfolio_id: str):
+        """ Portfolio by id, HttpError 404 if not loaded """
+
+        if portfolio_id not in self.portfolios:
+            raise HttpError(404, f"No Portfolio '{portfolio_id}'")
+        return self.portfolios[portfolio_id]
+
+    async def dispatch(self, method: str, target: str):
+        """ Answer a request, returns (status, JSON-able payload) """
+
+        if method != 'GET':
+            raise HttpError(405, f"Method {method} not allowed")
+        url = urlsplit(target)
+        params = dict(parse_qsl(url.query))
+        parts = [part for part in url.path.split('/') if part]
+
+        if parts == ['portfolios']:
+            return [{'id': portfolio_id, 'name': portfolio.name,
+                     'currency': portfolio.currency,
+                     'items': len(portfolio.items)}
+                    for portfolio_id, portfolio in self.portfolios.items()]
+        if len(parts) != 3 or parts[0] != 'portfolios':
+            raise HttpError(404, f"No resource {url.path}")
+        portfolio_id, resource = parts[1], parts[2]
+        portfolio = self.get_portfolio(portfolio_id)
+
+        if resource in ('balance', 'piechart'):
+            given_date = parse_date(params, 'date', date.today())
+            function = value_balance if resource == 'balance' \
+                else value_piechart
+            return await self.query((portfolio_id, resource, given_date),
+                                    function, portfolio, given_date)
+        if resource == 'series':
+            start = parse_date(params, 'start')
+            end = parse_date(params, 'end', date.today())
+            freq, by = params.get('freq', 'D'), params.get('by')
+            return await self.query(
+                (portfolio_id, resource, start, end, freq, by),
+                value_series, portfolio, start, end, freq, by)
+        raise HttpError(404, f"No resource {url.path}")
+
+    async def respond(self, method: str, target: str):
+        """ (status, body bytes) of a request """
+
+        self.requests += 1
+        try:
+            status, payload = 200, await self.dispatch(method, target)
+        except HttpError as error:
+            status, payload = error.status, {'error': str(error)}
+        except ValueError as error:
+            status, payload = 400, {'error': str(error)}
+        except RateNotAvailableError as error:
+            status, payload = 503, {'error': str(error)}
+        except Exception as error:
+            logging.exception("Request %s %s failed", method, target)
+            status, payload = 500, {'error': f"{type(error).__name__}:"
+                                             f" {error}"}
+        return status, json.dumps(payload).encode('utf-8')
+
+    async def handle_connection(self, reader, writer):
+        """ Serve the requests of a connection, kept alive until closed """
+
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except asyncio.IncompleteReadError:
+                    break  # client closed the connection
+                except asyncio.LimitOverrunError:
+                    writer.write(response(400, b'{"error": "Head too long"}',
+                                          keep_alive=False))
+                    break
+                request_line, *header_lines = \
+                    head.decode('latin-1').split('\r\n')
+                try:
+                    method, target, version = request_line.split(' ')
+                except ValueError:
+                    writer.write(response(400, b'{"error": "Bad request"}',
+                                          keep_alive=False))
+                    break
+                headers = dict(line.lower().split(':', 1)
+                               for line in header_lines if ':' in line)
+                try:
+                    length = int(headers.get('content-length', 0))
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    writer.write(response(
+                        400, b'{"error": "Bad Content-Length"}',
+                        keep_alive=False))
+                    break
+                if length:
+                    await reader.readexactly(length)  # bodies are ignored
+                connection = headers.get('connection', '').strip()
+                keep_alive = connection != 'close' if version == 'HTTP/1.1' \
+                    else connection == 'keep-alive'
+
+                status, body = await self.respond(method, target)
+                writer.write(response(status, body, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0):
+        """ Start listening, returns the asyncio Server """
+
+        return await asyncio.start_server(self.handle_connection, host, port,
+                                          limit=MAX_HEAD)
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+def response(status: int, body: bytes, keep_alive: bool = True):
+    """ HTTP response with a JSON body """
+
+    return (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n"
+            "\r\n").encode('latin-1') + body
+
+
+def value_balance(portfolio, given_date: date):
+    """ Balance payload, run in the valuation thread """
+
+    return {'date': given_date.isoformat(), 'currency': portfolio.currency,
+            'balance': portfolio.get_portfolio_balance(given_date)}
+
+
+def value_piechart(portfolio, given_date: date):
+    """ Piechart payload, run in the valuation thread """
+
+    return {'date': given_date.isoformat(), 'currency': portfolio.currency,
+            'piechart': portfolio.get_portfolio_piechart(given_date)}
+
+
+def value_series(portfolio, start: date, end: date, freq: str, by: str):
+    """ Balance series payload, run in the valuation thread """
+
+    dates, balances = portfolio.get_portfolio_balance_series(start, end,
+                                                             freq, by=by)
+    if by is None:
+        balances = balances.tolist()
+    else:
+        balances = {str(group): values.tolist()
+                    for group, values in balances.items()}
+    return {'currency': portfolio.currency,
+            'dates': [str(day) for day in dates], 'balances': balances}
+
+
+def load_portfolios(paths: list):
+    """ Read Portfolio files into a dict {file name: Portfolio} """
+
+    portfolios = {}
+    for path in paths:
+        portfolio_id = os.path.splitext(os.path.basename(path))[0]
+        portfolios[portfolio_id] = read_portfolio_from_file(path)
+    return portfolios
+
+
+async def serve(paths: list, host: str = '127.0.0.1', port: int = 8080,
+                workers: int = 1):
+    """ Load the files and serve them until cancelled """
+
+    portfolio_server = PortfolioServer(load_portfolios(paths), workers)
+    server = await portfolio_server.start(host, port)
+    port = server.sockets[0].getsockname()[1]
+    print(f"Serving {len(portfolio_server.portfolios)} Portfolios on"
+          f" http://{host}:{port}", flush=True)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        portfolio_server.close()
+
+
+def main(argv=None):
+    """ Command line entry point """
+
+    parser = argparse.ArgumentParser(
+        prog='python3 -m src.server',
+        description="Serve the valuation of Portfolio files as JSON.")
+    parser.add_argument('paths', nargs='+', metavar='PATH',
+                        help="Portfolio files, JSON or .npz")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080,
+                        help="0 picks a free port")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="valuation threads, 1 by default")
+    parser.add_argument('--log-level', default='WARNING',
+                        choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'))
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=args.log_level)
+    try:
+        asyncio.run(serve(args.paths, args.host, args.port,
+                          args.workers))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
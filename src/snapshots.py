@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+""" Cache of built Portfolios keyed by the content of their files """
+
+import gc
+import os
+import time
+import pickle
+import hashlib
+import logging
+
+# cfr. pickle https://docs.python.org/3/library/pickle.html
+
+DEFAULT_CACHE_PATH = os.path.join(
+    os.path.expanduser('~'), '.networth', 'snapshots')
+
+# bump whenever the classes pickled in a snapshot change, 2 adds the lock
+# of concurrent Portfolios, 3 the hydration lock of Items
+SNAPSHOT_SCHEMA = 3
+
+# total size and age over which the least recently used snapshots go
+MAX_BYTES = 256 * 1024 * 1024
+MAX_AGE = 30 * 24 * 3600
+
+SUFFIX = '.pickle'
+
+
+class SnapshotCache:
+    """ Folder of pickled Portfolios, one per file content and schema
+
+        A snapshot is found by the SHA-256 of the file it was built from,
+        so a changed file simply misses. Snapshots are only written and
+        read by this program, in a folder of the user: pickles must never
+        come from elsewhere.
+    """
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH,
+                 max_bytes: int = MAX_BYTES, max_age: float = MAX_AGE):
+        """ SnapshotCache constructor """
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(file_path: str):
+        """ Key of the snapshot of a file: its content hash and the schema """
+
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as source_file:
+            for chunk in iter(lambda: source_file.read(1 << 20), b''):
+                digest.update(chunk)
+        return f"{digest.hexdigest()}-{SNAPSHOT_SCHEMA}"
+
+    def _snapshot_path(self, key: str):
+        return os.path.join(self.path, key + SUFFIX)
+
+    def get(self, key: str):
+        """ Get the Portfolio of a snapshot, None if there is none """
+
+        snapshot_path = self._snapshot_path(key)
+        # the collector would walk the objects over and over as they are
+        # unpickled, for no garbage
+        gc_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            with open(snapshot_path, 'rb') as snapshot_file:
+                portfolio = pickle.load(snapshot_file)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as error_msg:
+            logging.warning("Discarding unreadable snapshot %s: %s",
+                            snapshot_path, error_msg)
+            self._remove(snapshot_path)
+            self.misses += 1
+            return None
+        finally:
+            if gc_enabled:
+                gc.enable()
+        # mark as recently used, eviction goes by modification time
+        try:
+            os.utime(snapshot_path)
+        except OSError:
+            pass  # evicted by another process since, the Portfolio is read
+        self.hits += 1
+        return portfolio
+
+    def put(self, key: str, portfolio):
+        """ Save the snapshot of a Portfolio, then evict old ones """
+
+        snapshot_path = self._snapshot_path(key)
+        partial_path = f"{snapshot_path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(partial_path, 'wb') as snapshot_file:
+                pickle.dump(portfolio, snapshot_file,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(partial_path, snapshot_path)
+        except Exception as error_msg:
+            logging.warning("Snapshot %s not saved: %s", snapshot_path,
+                            error_msg)
+            self._remove(partial_path)
+            return False
+        self.evict()
+        return True
+
+    def evict(self, now=None):
+        """
+        Remove snapshots not used for max_age seconds, then the least
+        recently used ones until they take max_bytes at most
+        """
+
+        now = time.time() if now is None else now
+        snapshots = []
+        for entry in os.scandir(self.path):
+            if not entry.name.endswith(SUFFIX):
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue  # removed by another process since
+            if now - stat.st_mtime > self.max_age:
+                self._remove(entry.path)
+            else:
+                snapshots.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in snapshots)
+        for _, size, snapshot_path in sorted(snapshots):
+            if total <= self.max_bytes:
+                break
+            self._remove(snapshot_path)
+            total -= size
+
+    def clear(self):
+        """ Remove every snapshot """
+
+        if os.path.isdir(self.path):
+            for entry in os.scandir(self.path):
+                if entry.name.endswith(SUFFIX):
+                    self._remove(entry.path)
+
+    @staticmethod
+    def _remove(file_path: str):
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+
+
+_snapshot_cache = None
+
+
+def get_snapshot_cache():
+    """ Get the SnapshotCache used by read_portfolio_from_file
+
+        Location can be configured with the NETWORTH_SNAPSHOT_CACHE
+        environment variable, and set to an empty string to disable it.
+    """
+
+    global _snapshot_cache
+    if _snapshot_cache is None:
+        path = os.environ.get('NETWORTH_SNAPSHOT_CACHE', DEFAULT_CACHE_PATH)
+        if not path:
+            return None
+        logging.debug("Opening snapshot cache %s", path)
+        _snapshot_cache = SnapshotCache(path=path)
+    return _snapshot_cache
+
+
+def set_snapshot_cache(snapshot_cache: SnapshotCache):
+    """ Replace the SnapshotCache used by read_portfolio_from_file """
+
+    global _snapshot_cache
+    _snapshot_cache = snapshot_cache
+    return _snapshot_cache
@@ -9,6 +9,7 @@ from datetime import datetime, date
 import logging
 
 from src.utils import plot_piechart, Portfolio
+from src.rates import RateNotAvailableError
 from src.readwrite import read_portfolio_from_file, save_portfolio_to_file
 
 style = style_from_dict({
@@ -68,23 +69,38 @@ def get_item_list_in_text(portfolio):
 
 
 def save_open_portfolio(open_portfolio):
+    """
+    Offer to save the open Portfolio. The changes of a journaled one are
+    already in its journal: they are kept, or discarded from the journal
+    """
+
     saved = False
-    if open_portfolio is not None:
-        questions = [
-            {
-                'type': 'confirm',
-                'name': 'confirmed',
-                'message':
-                    'The open Portfolio will be lost. Do you want to save it?',
-                'default': True
-            },
-        ]
+    if open_portfolio is None:
+        return saved
+    journal = getattr(open_portfolio, 'journal', None)
+    if journal is not None and not journal.entries:
+        return True  # nothing to keep nor discard
+    if journal is not None:
+        message = (f'Changes to {journal.base_path} are kept in its journal.'
+                   ' Do you want to keep them?')
+    else:
+        message = 'The open Portfolio will be lost. Do you want to save it?'
+    questions = [
+        {
+            'type': 'confirm',
+            'name': 'confirmed',
+            'message': message,
+            'default': True
+        },
+    ]
 
-        user_selection = prompt(questions, style=style)
-        if user_selection['confirmed']:
-            print('Saving...')
-            save_portfolio_to_file(open_portfolio)
-            saved = True
+    user_selection = prompt(questions, style=style)
+    if user_selection['confirmed']:
+        print('Saving...')
+        saved = save_portfolio_to_file(open_portfolio)
+    elif journal is not None:
+        print('Discarding changes...')
+        journal.discard()
 
     return saved
 
@@ -95,7 +111,10 @@ def ui_open_portfolio(target):
     save_open_portfolio(target)
 
     print('Opening Portfolio...')
-    portfolio = read_portfolio_from_file()
+    # changes are saved to a journal next to the file as they are made,
+    # unless no file is chosen, and the ledger of each Item is only read
+    # when the Item is used
+    portfolio = read_portfolio_from_file(journaled=True, lazy=True)
 
     return portfolio
 
@@ -215,7 +234,11 @@ def ui_analyze_portfolio(target):
     """ Menu option - plot piechart of Portfolio"""
 
     print('Analyzing Portfolio...')
-    piechart = target.get_portfolio_piechart(date.today())
+    try:
+        piechart = target.get_portfolio_piechart(date.today())
+    except RateNotAvailableError as error_msg:
+        print("Analysis failed because: ", error_msg)
+        return True
     plot_piechart(piechart)
     return True
 
@@ -258,8 +281,9 @@ def ui_edit_portfolio(target):
 
     user_selection = prompt(questions, style=style)
     if user_selection['confirmed']:
-        target.name = user_selection['name']
-        target.description = user_selection['description']
+        target.edit(name=user_selection['name'],
+                    description=user_selection['description'],
+                    currency=user_selection['currency'])
 
     return True
 
@@ -338,8 +362,8 @@ def ui_edit_item(target):
 
     user_selection = prompt(questions, style=style)
     if user_selection['confirmed']:
-        target.name = user_selection['name']
-        target.description = user_selection['description']
+        target.edit(name=user_selection['name'],
+                    description=user_selection['description'])
 
     return True
 
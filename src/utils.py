@@ -3,81 +3,255 @@
 """ Basic Classes Portfolio, Item, HistoryPoint and methods"""
 
 import uuid
+import time
 import logging
-import bisect
-from datetime import date
-from forex_python.bitcoin import BtcConverter
-from forex_python.converter import CurrencyRates
+import threading
+from datetime import date, timedelta
 
-import matplotlib.pyplot as plt
+import numpy as np
+
+from src.rates import get_rate_engine, RateNotAvailableError
+from src.history import PointHistory, ColumnarHistory, PriceSeries
+from src.rwlock import ReadWriteLock, read_locked, write_locked
 
 # cfr. Classes https://docs.python.org/3/tutorial/classes.html
 # cfr. logging https://docs.python.org/3/howto/logging.html
 
+# serializes changes to memos, filled by every reader of a Portfolio
+_memo_lock = threading.Lock()
+
+
+class LazyStr:
+    """
+    Log message argument rendered only if the message is emitted, e.g.
+    logging.debug("Item:%s", LazyStr(item.display))
+    """
+
+    def __init__(self, function, *args):
+        self.function = function
+        self.args = args
+
+    def __str__(self):
+        return str(self.function(*self.args))
+
+
+class ValuationMemo:
+    """
+    Valuations keyed by (date, currency, ...) valid for one version of the
+    Portfolio or Item that owns them. Valuations of today expire after the
+    rate cache TTL, as today's rates are provisional
+    """
+
+    MAX_ENTRIES = 4096
+
+    def __init__(self):
+        self.version = 0
+        self._entries = {}  # {key: (expires_at, valuation)}
+
+    def get(self, key: tuple, version: int):
+        """ Get a memoized valuation, None if missing or outdated """
+
+        if version != self.version:
+            return None
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, valuation = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            self._entries.pop(key, None)
+            return None
+        return valuation
+
+    def put(self, key: tuple, version: int, valuation):
+        """ Memoize a valuation, key starts with the date valued """
+
+        expires_at = None
+        if key[0] >= date.today():
+            expires_at = time.monotonic() + \
+                get_rate_engine().rate_cache.today_ttl
+        with _memo_lock:
+            if version != self.version:
+                self._entries.clear()
+                self.version = version
+            if len(self._entries) >= ValuationMemo.MAX_ENTRIES:
+                # evict the oldest entry
+                del self._entries[next(iter(self._entries))]
+            self._entries[key] = (expires_at, valuation)
+
+
+class IndexedAttribute:
+    """
+    Attribute of an Item that its Portfolio keeps an index of. Setting it
+    calls item.attribute_changed(field, old_value, new_value), holding the
+    lock of a concurrent Portfolio for writing
+    """
+
+    def __set_name__(self, owner, name):
+        self.field = name
+        self.private_name = '_' + name
+
+    def __get__(self, item, owner=None):
+        if item is None:
+            return self
+        return getattr(item, self.private_name)
+
+    def __set__(self, item, value):
+        lock = item.lock
+        if lock is None:
+            self._set(item, value)
+            return
+        with lock.writing():
+            self._set(item, value)
+
+    def _set(self, item, value):
+        old_value = getattr(item, self.private_name, None)
+        setattr(item, self.private_name, value)
+        item.attribute_changed(self.field, old_value, value)
+
+
+class HydratedAttribute:
+    """
+    Attribute of an Item that a stub Item loads on first access, see
+    Item.defer_ledger()
+    """
+
+    def __set_name__(self, owner, name):
+        self.private_name = '_' + name
+
+    def __get__(self, item, owner=None):
+        if item is None:
+            return self
+        if item.loader is not None:
+            item.hydrate()
+        return getattr(item, self.private_name)
+
+    def __set__(self, item, value):
+        setattr(item, self.private_name, value)
+
 
 def generate_unique_id():
     """ Wrapper function that generates unique IDs via an external service """
     return uuid.uuid4()
 
 
-def get_exchange_rate(given_date: date, from_currency: str, to_currency: str):
-    """ Get exchange rates on a given date for USD EUR PLN GBP BTC """
+def get_exchange_rates(keys):
+    """
+    Get exchange rates for several (date, from_currency, to_currency) keys
+    Returns a dict {key: rate}. Distinct dates are fetched concurrently
+    """
 
-    rate = None
+    rates = {}
+    pending = []
     today = date.today()
-    # check date is valid
-    if given_date > today:
-        logging.warning("%s is a date in the future", given_date.isoformat())
-    else:
+    supported_all = Portfolio.CURRENCIES + Portfolio.CRYPTO
+    for key in set(keys):
+        given_date, from_currency, to_currency = key
+        rates[key] = None
+        # check date is valid
+        if given_date > today:
+            logging.warning("%s is a date in the future", given_date)
+            continue
         # check input currencies are valid
-        supported_all = Portfolio.CURRENCIES + Portfolio.CRYPTO
         curr_not_supported = {curr for curr in
                               [from_currency, to_currency]
                               if curr not in supported_all}
         if bool(curr_not_supported):
             logging.warning('%s currency not supported',
-                            str(curr_not_supported))
-        elif all(curr in Portfolio.CURRENCIES
-                 for curr in [from_currency, to_currency]):
-            # all currencies are forex
-            # if not bool(c): # initialize only if needed
-            forex_handler = CurrencyRates()
-            if given_date == today:
-                rate = forex_handler.get_rate(from_currency, to_currency)
-            else:
-                rate = forex_handler.get_rate(from_currency, to_currency,
-                                              given_date)
+                            curr_not_supported)
+        elif from_currency == to_currency:
+            rates[key] = 1
         else:
-            # at least one of the rates is BTC
-            # if both rates are BTC -> return 1
-            if from_currency == 'BTC' and to_currency == 'BTC':
-                rate = 1
+            pending.append(key)
+    rates.update(get_rate_engine().get_rates(pending))
+    return rates
+
+
+def get_exchange_rate(given_date: date, from_currency: str, to_currency: str):
+    """
+    Get exchange rates on a given date for USD EUR PLN GBP BTC
+    Rates are derived from the base vector of the day, served from the
+    persistent rate cache when available and fetched otherwise
+    """
+
+    key = (given_date, from_currency, to_currency)
+    return get_exchange_rates([key])[key]
+
+
+def prefetch_rates(start: date, end: date, currencies):
+    """
+    Load in one go the exchange rates between some currencies from start
+    to end into a RateTable, see RateEngine.prefetch. A table prefetched
+    before with all those rates is reused
+    """
+
+    supported = tuple(curr for curr in Portfolio.CURRENCIES + Portfolio.CRYPTO
+                      if curr in currencies)
+    rate_engine = get_rate_engine()
+    table = rate_engine.find_table(start, end, supported)
+    if table is None:
+        table = rate_engine.prefetch(start, end, supported)
+    return table
+
+
+def convert_value_series(values: dict, to_currency: str, ordinals,
+                         table=None):
+    """
+    Convert values on day ordinals, {(group, currency): (values, owned)}
+    as given by Portfolio.get_value_series, to a currency with the rates
+    of a RateTable covering those days. Returns {group: values}
+    """
+
+    groups = {}
+    for (group, currency), (currency_values, owned) in values.items():
+        if currency == to_currency:
+            converted = currency_values
+        else:
+            if table is not None and currency in table.columns and \
+                    to_currency in table.columns:
+                exchange_rates = table.rates(currency, to_currency)[
+                    ordinals - table.start.toordinal()]
             else:
-                # one of the rates is BTC
-                # if not bool(b): # initialize only if needed
-                crypto_handler = BtcConverter()
-                if from_currency == 'BTC':
-                    if given_date == today:
-                        rate = crypto_handler.get_latest_price(to_currency)
-                    else:
-                        # given_date < today
-                        rate = crypto_handler.get_previous_price(to_currency,
-                                                                 given_date)
-                elif to_currency == 'BTC':
-                    if given_date == today:
-                        rate = 1/crypto_handler.get_latest_price(from_currency)
-                    else:
-                        # given_date < today
-                        rate = 1/crypto_handler.get_previous_price(
-                            from_currency, given_date)
-                else:
-                    logging.warning("get_exchange_rate failed unexpectedly")
-    return rate
+                exchange_rates = np.full(len(ordinals), np.nan)
+            missing = owned & np.isnan(exchange_rates)
+            if missing.any():
+                missing_date = date.fromordinal(
+                    int(ordinals[int(np.argmax(missing))]))
+                raise RateNotAvailableError(
+                    f"No {currency}/{to_currency} exchange rate on"
+                    f" {missing_date.isoformat()}")
+            converted = np.where(owned, exchange_rates * currency_values,
+                                 0.0)
+        if group in groups:
+            groups[group] = groups[group] + converted
+        else:
+            groups[group] = np.zeros(len(ordinals)) + converted
+    return groups
+
+
+def get_series_dates(start: date, end: date, freq: str = 'D'):
+    """
+    Get the dates of a series between start and end, inclusive
+    freq 'D' is every day, 'W' every 7 days from start and 'M' the last day
+    of every month
+    """
+
+    if freq not in ('D', 'W', 'M'):
+        raise ValueError(f"Frequency '{freq}' not supported, use D, W or M")
+    days = [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    if freq == 'W':
+        days = days[::7]
+    elif freq == 'M':
+        days = [day for day in days
+                if (day + timedelta(days=1)).month != day.month]
+    return days
 
 
 def plot_piechart(piechart_dict):
     """ Plot piechart with the slices ordered counter-clockwise. """
 
+    # imported here, matplotlib takes longer to import than the rest
+    import matplotlib.pyplot as plt
+
     labels = piechart_dict.keys()
     sizes = piechart_dict.values()
     fig1, ax1 = plt.subplots()
@@ -89,35 +263,157 @@ def plot_piechart(piechart_dict):
 
 
 class Portfolio:
-    """ Portfolio: List of Items (Assets and Liabilities) """
+    """ Portfolio: List of Items (Assets and Liabilities)
+
+        A concurrent Portfolio can be shared between threads: its methods
+        read under a ReadWriteLock, so many threads value it in parallel,
+        while changes wait for them and are seen whole. Direct use of
+        attributes, e.g. item.ledger, needs "with portfolio.lock.reading():"
+    """
 
     CATEGORIES = ('asset', 'liability')
     SUBCATEGORIES = ('account', 'fund', 'stock', 'real_state')
     CURRENCIES = ('EUR', 'USD', 'GBP', 'PLN')
     CRYPTO = ('BTC',)
+    # Item attributes with an index {value: {unique_id: Item}}
+    INDEXES = ('name', 'category', 'subcategory', 'currency')
 
-    def __init__(self, name: str, description: str, currency: str):
+    def __init__(self, name: str, description: str, currency: str,
+                 columnar: bool = False, concurrent: bool = False):
         """ Portfolio constructor"""
 
+        self.lock = ReadWriteLock() if concurrent else None
         self.unique_id = generate_unique_id()
+        self.version = 0  # bumped by any change that alters valuations
+        self.valuations = ValuationMemo()
         self.name = name
         self.description = description
         self.currency = currency
-        self.item_list = []  # creates a new empty list of Items
+        self.columnar = columnar  # history backend of new Items
+        self.journal = None  # receives every change when set, see record
+        self.journal_seq = 0  # last journal entry folded into the file
+        self.items = {}  # {unique_id: Item} in the order they were added
+        self._indexes = {field: {} for field in Portfolio.INDEXES}
+
+    @property
+    def currency(self):
+        """ Currency the Portfolio is valued in """
+        return self._currency
+
+    @currency.setter
+    @write_locked
+    def currency(self, currency: str):
+        self._currency = currency
+        self.bump_version()
+
+    @property
+    def concurrent(self):
+        """ True if the Portfolio can be shared between threads """
+        return self.lock is not None
+
+    @concurrent.setter
+    def concurrent(self, concurrent: bool):
+        # only while a single thread uses the Portfolio, e.g. once loaded
+        if concurrent != self.concurrent:
+            self.lock = ReadWriteLock() if concurrent else None
+
+    @property
+    @read_locked
+    def item_list(self):
+        """ List of Items in the order they were added """
+        return list(self.items.values())
+
+    def bump_version(self):
+        """ Invalidate memoized valuations of the Portfolio """
+
+        self.version += 1
+
+    def record(self, operation: str, **data):
+        """ Append a change to the journal of the Portfolio, if any """
+
+        if self.journal is not None:
+            self.journal_seq = self.journal.append({'op': operation, **data})
+
+    @write_locked
+    def edit(self, **attributes):
+        """ Edit name, description or currency of the Portfolio """
+
+        for attribute, value in attributes.items():
+            if attribute not in ('name', 'description', 'currency'):
+                raise ValueError(f"Portfolio attribute '{attribute}'"
+                                 " cannot be edited")
+            setattr(self, attribute, value)
+        self.record('edit_portfolio', attributes=attributes)
+
+    def _index_item(self, item):
+        """ Add Item to every index """
+
+        for field in Portfolio.INDEXES:
+            self._indexes[field].setdefault(
+                getattr(item, field), {})[item.unique_id] = item
+
+    def _unindex_item(self, item, field: str, value):
+        """ Remove Item from the index of a field """
+
+        bucket = self._indexes[field].get(value, {})
+        bucket.pop(item.unique_id, None)
+        if not bucket:
+            self._indexes[field].pop(value, None)
+
+    def reindex_item(self, item, field: str, old_value, new_value):
+        """ Move Item in the index of a field after an edit """
+
+        if field not in Portfolio.INDEXES or \
+                self.items.get(item.unique_id) is not item:
+            return
+        self._unindex_item(item, field, old_value)
+        self._indexes[field].setdefault(
+            new_value, {})[item.unique_id] = item
+
+    @read_locked
+    def get_item(self, unique_id):
+        """ Get Item by unique_id, None if not in the Portfolio """
+
+        return self.items.get(unique_id)
+
+    @read_locked
+    def get_items(self, **criteria):
+        """
+        Get Items matching every criterion on name, category, subcategory or
+        currency, e.g. get_items(subcategory='stock', currency='USD').
+        Cost is proportional to the smallest matching index bucket
+        """
 
+        buckets = []
+        for field, value in criteria.items():
+            if field not in Portfolio.INDEXES:
+                raise ValueError(f"Items are not indexed by '{field}'")
+            buckets.append(self._indexes[field].get(value, {}))
+        if not buckets:
+            return self.item_list
+        smallest = min(buckets, key=len)
+        return [item for unique_id, item in smallest.items()
+                if all(unique_id in bucket for bucket in buckets)]
+
+    @write_locked
     def remove_item(self, removed_item):
         """ Remove Item from Portfolio """
 
-        if removed_item in self.item_list:
-            self.item_list.remove(removed_item)
+        if self.items.get(removed_item.unique_id) is removed_item:
+            del self.items[removed_item.unique_id]
+            for field in Portfolio.INDEXES:
+                self._unindex_item(removed_item, field,
+                                   getattr(removed_item, field))
+            self.bump_version()
+            self.record('remove_item', item=str(removed_item.unique_id))
 
-        if removed_item not in self.item_list:
-            logging.debug("Item removed")
-            return True
+        logging.debug("Item removed")
+        return True
 
+    @write_locked
     def add_item(self, category: str, subcategory: str, currency: str,
-                 name: str, description: str):
-        """ Add Item to Portfolio """
+                 name: str, description: str, unique_id=None):
+        """ Add Item to Portfolio, unique_id is given when read from a file """
 
         logging.debug("Adding Item '%s' to Portfolio '%s'...",
                       name, self.name)
@@ -141,36 +437,112 @@ class Portfolio:
 
         new_item = Item(category=category, subcategory=subcategory,
                         currency=currency, name=name,
-                        description=description, portfolio=self)
-
-        self.item_list.append(new_item)
-
-        if new_item in self.item_list:
-            logging.debug("Success")
+                        description=description, portfolio=self,
+                        columnar=self.columnar, unique_id=unique_id)
+
+        self.items[new_item.unique_id] = new_item
+        self._index_item(new_item)
+        self.bump_version()
+        self.record('add_item', item=str(new_item.unique_id),
+                    attributes={'category': category,
+                                'subcategory': subcategory,
+                                'currency': currency, 'name': name,
+                                'description': description})
+
+        logging.debug("Success")
         return new_item
 
+    @read_locked
+    def get_item_balances(self, given_date: date, items: list = None):
+        """
+        Get (item, closest_balance, closest_date) for every Item, or the
+        given items, on a given date in the Portfolio currency. The exchange
+        rates needed are collected first and fetched concurrently before
+        adding up. Balances are memoized per Item until the Item changes
+        """
+
+        key = (given_date, self.currency)
+        whole_portfolio = items is None
+        if whole_portfolio:
+            balances = self.valuations.get(key, self.version)
+            if balances is not None:
+                return balances
+            items = self.item_list
+
+        memoized = {}
+        hist_pts = {}
+        for item in items:
+            balance = item.valuations.get(key, item.version)
+            if balance is None:
+                hist_pts[item] = item.get_hist_pt_by_date(given_date)
+            else:
+                memoized[item] = balance
+        exchange_rates = get_exchange_rates(
+            {(given_date, item.currency, self.currency)
+             for item, hist_pt in hist_pts.items() if hist_pt is not None})
+
+        for item, hist_pt in hist_pts.items():
+            if hist_pt is None:
+                balance = (0, given_date)
+            else:
+                exchange_rate = exchange_rates[
+                    (given_date, item.currency, self.currency)]
+                if exchange_rate is None:
+                    raise RateNotAvailableError(
+                        f"No {item.currency}/{self.currency} exchange rate"
+                        f" on {given_date.isoformat()} to value '{item.name}'")
+                balance = (exchange_rate *
+                           item.get_asset_value(given_date, hist_pt),
+                           hist_pt.when)
+            item.valuations.put(key, item.version, balance)
+            memoized[item] = balance
+
+        balances = [(item, *memoized[item]) for item in items]
+        if whole_portfolio:
+            self.valuations.put(key, self.version, balances)
+        return balances
+
+    @read_locked
     def get_portfolio_balance(self, given_date: date):
         """ Get Portfolio balance on a given date in the Portfolio currency"""
 
+        key = (given_date, self.currency, 'balance')
+        portfolio_balance = self.valuations.get(key, self.version)
+        if portfolio_balance is not None:
+            return portfolio_balance
+
         portfolio_balance = 0
-        for item in self.item_list:
-            closest_balance, _ = item.get_item_balance(
-                self.currency, given_date)
+        for _, closest_balance, _ in self.get_item_balances(given_date):
             # would be good to return closest_date to give transparency
             portfolio_balance += closest_balance
 
+        self.valuations.put(key, self.version, portfolio_balance)
         return portfolio_balance
 
+    @read_locked
+    def get_items_balance(self, given_date: date, **criteria):
+        """
+        Get balance of the Items matching criteria (see get_items) on a
+        given date in the Portfolio currency
+        """
+
+        return sum(balance for _, balance, _ in self.get_item_balances(
+            given_date, self.get_items(**criteria)))
+
+    @read_locked
     def get_portfolio_piechart(self, given_date: date):
         """
         Get Portfolio piechart by subcategories on a given date
         in the Portfolio currency
         """
 
+        key = (given_date, self.currency, 'piechart')
+        piechart = self.valuations.get(key, self.version)
+        if piechart is not None:
+            return dict(piechart)
+
         piechart = {'portfolio_balance': 0}
-        for item in self.item_list:
-            closest_balance, _ = item.get_item_balance(
-                self.currency, given_date)
+        for item, closest_balance, _ in self.get_item_balances(given_date):
             # would be good to return closest_date to give transparency
             piechart['portfolio_balance'] += closest_balance
             if item.subcategory in piechart:
@@ -178,10 +550,69 @@ class Portfolio:
             else:
                 piechart[item.subcategory] = closest_balance
         balance = piechart.pop('portfolio_balance')
-        for key, value in piechart.items():
-            piechart[key] = 100 * value/balance
+        for subcategory, value in piechart.items():
+            piechart[subcategory] = 100 * value/balance
+        self.valuations.put(key, self.version, dict(piechart))
         return piechart
 
+    @read_locked
+    def get_portfolio_balance_series(self, start: date, end: date,
+                                     freq: str = 'D', by: str = None):
+        """
+        Get Portfolio balance between two dates in the Portfolio currency
+        in one vectorized pass. Returns NumPy arrays (dates, balances),
+        with dates as datetime64[D] (see get_series_dates for freq).
+        Given by, an indexed field (see get_items), balances is a dict
+        {value of the field: balances of its Items} instead
+        """
+
+        end = min(end, date.today())
+        days = get_series_dates(start, end, freq)
+        dates = np.array(days, dtype='datetime64[D]')
+        ordinals = np.array([day.toordinal() for day in days], dtype=np.int64)
+
+        values = self.get_value_series(ordinals, by)
+        table = None
+        if any(currency != self.currency for _, currency in values):
+            table = self.prefetch_rates(start, end)
+        groups = convert_value_series(values, self.currency, ordinals, table)
+        if by is None:
+            return dates, groups.get(None, np.zeros(len(days)))
+        return dates, groups
+
+    @read_locked
+    def get_value_series(self, ordinals, by: str = None):
+        """
+        Get values of the Items on an array of day ordinals, added up in
+        their own currency by the value of an indexed field (None without
+        by) and currency. Returns {(group, currency): (values, owned)}
+        """
+
+        if by is not None and by not in Portfolio.INDEXES:
+            raise ValueError(f"Items are not indexed by '{by}'")
+        values = {}
+        for item in self.item_list:
+            item_values, owned = item.get_value_series(ordinals)
+            if not owned.any():
+                continue  # no history before the end of the series
+            key = (getattr(item, by) if by else None, item.currency)
+            if key in values:
+                values[key][0] += item_values
+                values[key][1] |= owned
+            else:
+                values[key] = [item_values, owned]
+        return {key: tuple(series) for key, series in values.items()}
+
+    def prefetch_rates(self, start: date, end: date):
+        """
+        Load in one go the exchange rates needed to value the Portfolio
+        between two dates, so later valuations need no remote calls
+        """
+
+        currencies = {self.currency}
+        currencies.update(item.currency for item in self.item_list)
+        return prefetch_rates(start, end, currencies)
+
     def get_portfolio_currency(self):
         """ Get currency of a Portfolio"""
 
@@ -207,49 +638,104 @@ class Item:
     """Item: Asset or Liability"""
 
     def __init__(self, category: str, subcategory: str, currency: str,
-                 name: str, description: str, portfolio: Portfolio):
-        """Item constructor"""
+                 name: str, description: str, portfolio: Portfolio,
+                 columnar: bool = False, unique_id=None):
+        """
+        Item constructor
+        columnar flag = True keeps the history in NumPy arrays instead of
+        HistoryPoint objects, to save memory on long histories
+        """
 
+        self.unique_id = unique_id or generate_unique_id()
+        self.loader = None  # loads the ledger of a stub Item
+        # serializes its hydration, which several readers may start
+        self.hydration_lock = None
+        self.version = 0  # bumped by any change that alters valuations
+        self.valuations = ValuationMemo()
+        self.portfolio = portfolio  # initialize Item in portfolio
         self.name = name
         self.description = description
         self.category = category
         self.subcategory = subcategory
         self.currency = currency
 
-        self.unique_id = generate_unique_id()
         self.deleted = False
-        self.portfolio = portfolio  # initialize Item in portfolio
-        self.history = []  # creates a new empty list of HistoryPt
+        if columnar:
+            self.history = ColumnarHistory(self._make_hist_pt_view)
+        else:
+            self.history = PointHistory(self._make_hist_pt)
         self.ledger = []  # creates a new empty ledger for transactions
+        self.prices = PriceSeries()  # closing prices, apart from the ledger
+
+    name = IndexedAttribute()
+    category = IndexedAttribute()
+    subcategory = IndexedAttribute()
+    currency = IndexedAttribute()
+    history = HydratedAttribute()
+    ledger = HydratedAttribute()
+
+    @property
+    def lock(self):
+        """ ReadWriteLock of the Portfolio, None unless concurrent """
+        return self.portfolio.lock if self.portfolio is not None else None
+
+    @write_locked
+    def attribute_changed(self, field: str, old_value, new_value):
+        """ Keep Portfolio indexes and valuations in step with an edit """
+
+        if field == 'currency':
+            self.bump_version()
+        elif self.portfolio is not None and old_value != new_value:
+            # the Item is valued the same, but grouped elsewhere, e.g. in
+            # the piechart by subcategory
+            self.portfolio.bump_version()
+        if self.portfolio is not None:
+            self.portfolio.reindex_item(self, field, old_value, new_value)
+
+    def record(self, operation: str, **data):
+        """ Append a change of the Item to the journal of its Portfolio """
+
+        if self.portfolio is not None:
+            self.portfolio.record(operation, item=str(self.unique_id), **data)
+
+    @write_locked
+    def edit(self, **attributes):
+        """ Edit name or description of the Item """
+
+        for attribute, value in attributes.items():
+            if attribute not in ('name', 'description'):
+                raise ValueError(f"Item attribute '{attribute}'"
+                                 " cannot be edited")
+            setattr(self, attribute, value)
+        self.record('edit_item', attributes=attributes)
+
+    def bump_version(self):
+        """ Invalidate memoized valuations of the Item and its Portfolio """
+
+        self.version += 1
+        if self.portfolio is not None:
+            self.portfolio.bump_version()
+
+    def validate_purchase(self, when: date, units_purchased: float,
+                          unit_price: float, fees: float, today: date = None):
+        """ Get why a purchase is not valid, empty string if it is """
 
-    def purchase(self, when: date, units_purchased: float,
-                 unit_price: float, fees: float):
-        """ Purchase units of an Item"""
-
-        # 1) input validation
-        # Given transaction inputs :
-        # date, units_purchased, unit_price, fees paid
-
-        valid_input = True
         failed_because = ""
+        if today is None:
+            today = date.today()
 
         # When date is valid date
-        if not isinstance(when, date) or when >= date.today():
-            valid_input = False
+        if not isinstance(when, date) or when >= today:
             failed_because += f"invalid date {when.isoformat()}"
 
         # And unit_price, fees are floats
-        if isinstance(unit_price, float) and isinstance(fees, float):
-            pass
-        else:
-            valid_input = False
+        if not (isinstance(unit_price, float) and isinstance(fees, float)):
             failed_because += "units_price or fees are"\
                 " not of type float as expected"
 
         if self.subcategory in ['account', 'fund']:
             # And for account, fund assets : units_purchased is always 1
             if units_purchased != 1:
-                valid_input = False
                 failed_because += \
                     f"# of units != 1 as expected for {self.subcategory}"\
                     " items"
@@ -258,7 +744,6 @@ class Item:
             # And for assets of subcategory stock:
             # units_ purchased is an integer
             if not isinstance(units_purchased, int):
-                valid_input = False
                 failed_because += "# of units not an int as expected "\
                     f"for {self.subcategory} items."
 
@@ -268,54 +753,65 @@ class Item:
             # (representing % of ownership)
             if isinstance(units_purchased, float):
                 if units_purchased < 0 or units_purchased > 1:
-                    valid_input = False
                     failed_because += "units_purchased is out of out range"\
                         f" [0, 1] expected for {self.subcategory} items."
             else:
-                valid_input = False
                 failed_because += "units_purchased is not of "\
                     f"type float as expected for {self.subcategory} items."
         else:
-            valid_input = False
             failed_because += f"{self.subcategory} items are not supported."
 
+        return failed_because
+
+    @write_locked
+    def purchase(self, when: date, units_purchased: float,
+                 unit_price: float, fees: float):
+        """ Purchase units of an Item"""
+
+        # 1) input validation
+        # Given transaction inputs :
+        # date, units_purchased, unit_price, fees paid
+
+        failed_because = self.validate_purchase(when, units_purchased,
+                                                unit_price, fees)
+        valid_input = not failed_because
+
         if valid_input:
             # 2) get asset status prior to purchase
-            prior_hist_pt = self.get_hist_pt_by_date(given_date=when)
-            if prior_hist_pt is None:
-                cost = 0
-                units = 0
-                value = 0
-            else:
-                cost = prior_hist_pt.cost_of_purchase
-                units = prior_hist_pt.units_owned
-                value = prior_hist_pt.value_of_asset
+            # (including earlier purchases on the same date)
+            units, cost, value = self.get_totals(when)
             logging.info("PRE-PURCHASE cost: %s units: %s value: %s",
-                         str(cost), str(units), str(value))
-            # 3) compute asset status post purchase
+                         cost, units, value)
+            # 3) compute changes caused by the purchase
 
             # in what currency?
-            cost += (units_purchased * unit_price + fees)
-            value += units_purchased * unit_price
+            delta_cost = units_purchased * unit_price + fees
+            delta_value = units_purchased * unit_price
             if self.subcategory in ['stock', 'real_state']:
+                delta_units = units_purchased
                 units += units_purchased
             else:
+                delta_units = 0  # units is always 1
                 units = 1
 
             logging.info("POST-PURCHASE cost: %s units: %s value: %s",
-                         str(cost), str(units), str(value))
+                         cost + delta_cost, units, value + delta_value)
 
             # date, amount_invested, fees paid, new_value
             # cost + = amount invested(unit_price) + fees
             # value = new value(after investment)
 
-            # 4) call update_history method to save new hist_pt
-            self.update_history(when=when, units_owned=units,
-                                cost_of_purchase=cost, value_of_asset=value)
+            # 4) insert new hist_pt, a back-dated purchase also updates
+            # every later hist_pt through the running totals
+            self.insert_history_point(when=when, delta_units=delta_units,
+                                      delta_cost=delta_cost,
+                                      delta_value=delta_value)
             # 4) call update_ledger method to save new purchase transaction
-            self.update_ledger(
-                ('purchase', {'when': when, 'units_purchased': units_purchased,
-                              'unit_price': unit_price, 'fees': fees}))
+            transaction = ('purchase', {
+                'when': when, 'units_purchased': units_purchased,
+                'unit_price': unit_price, 'fees': fees})
+            self.update_ledger(transaction)
+            self.record('ledger', transactions=[transaction])
             success = True
         else:
             success = valid_input
@@ -325,16 +821,236 @@ class Item:
 
         return success
 
+    def defer_ledger(self, loader):
+        """
+        Make the Item a stub, whose ledger and history are only loaded the
+        first time they are used, from the transactions returned by loader()
+        """
+
+        self.hydration_lock = threading.Lock()
+        self.loader = loader
+
+    @property
+    def hydrated(self):
+        """ False for a stub Item whose ledger is not loaded yet """
+        return self.loader is None
+
+    def hydrate(self):
+        """ Load the ledger and build the history of a stub Item """
+
+        lock = self.hydration_lock
+        if lock is None:
+            return  # hydrated already
+        with lock:
+            if self.loader is None:
+                return
+            # no bump_version: the Item is unchanged, just no longer a stub
+            self._extend_ledger(self._validate_ledger(self.loader()))
+            # other threads use the history only once it is built
+            self.loader = None
+            # a hydrated Item can be pickled
+            self.hydration_lock = None
+
+    @write_locked
+    def load_ledger(self, transactions):
+        """
+        Load ledger transactions in bulk, e.g. when reading a file. Every
+        transaction is validated up front, then the history is built in one
+        sorted pass instead of one purchase() per transaction.
+        Returns the number of transactions loaded
+        """
+
+        self.hydrate()
+        valid = self._validate_ledger(transactions)
+        if not valid:
+            return 0
+        self._extend_ledger(valid)
+        self.bump_version()
+        self.record('ledger', transactions=valid)
+        logging.info("Loaded %s transactions to Item '%s'", len(valid),
+                     self.name)
+        return len(valid)
+
+    def _validate_ledger(self, transactions):
+        """ Get the valid transactions, warning of the others """
+
+        valid = []
+        failures = []
+        today = date.today()
+        for transaction in transactions:
+            transaction_type, transaction_data = transaction
+            if transaction_type != 'purchase':
+                failures.append(f"unsupported transaction {transaction_type}")
+                continue
+            failed_because = self.validate_purchase(
+                transaction_data['when'], transaction_data['units_purchased'],
+                transaction_data['unit_price'], transaction_data['fees'],
+                today)
+            if failed_because:
+                failures.append(failed_because)
+            else:
+                valid.append(transaction)
+        if failures:
+            logging.warning("%s transactions not loaded to Item '%s'"
+                            " because of %s", len(failures), self.name,
+                            '; '.join(failures[:3]))
+        return valid
+
+    def _extend_ledger(self, valid):
+        """ Add valid transactions to the ledger and the history """
+
+        if not valid:
+            return
+        ordinals = np.array([data['when'].toordinal() for _, data in valid],
+                            dtype=np.int64)
+        units = np.array([data['units_purchased'] for _, data in valid],
+                         dtype=float)
+        unit_price = np.array([data['unit_price'] for _, data in valid])
+        fees = np.array([data['fees'] for _, data in valid])
+        # stable sort keeps transactions of the same date in ledger order
+        order = np.argsort(ordinals, kind='stable')
+        delta_value = (units * unit_price)[order]
+        delta_cost = delta_value + fees[order]
+        if self.subcategory in ['stock', 'real_state']:
+            delta_units = units[order]
+        else:
+            delta_units = np.zeros(len(valid))  # units is always 1
+        # not self.history, which would hydrate a stub being hydrated
+        self._history.extend(ordinals[order], delta_units, delta_cost,
+                             delta_value)
+        self._ledger.extend(valid)
+
+    @write_locked
     def update_history(self, when: date, units_owned: float,
                        cost_of_purchase: float, value_of_asset: float):
-        """ Add to Item a HistoryPoint: historic valuation to an Item"""
+        """
+        Add to Item a HistoryPoint: historic valuation to an Item
+        Later HistoryPoints shift by the same change in units, cost and value
+        """
 
-        hist_pt = HistoryPoint(when=when, units_owned=units_owned,
-                               cost_of_purchase=cost_of_purchase,
-                               value_of_asset=value_of_asset)
-        self.history.append(hist_pt)
+        units, cost, value = self.get_totals(when)
+        if self.subcategory in ['stock', 'real_state']:
+            delta_units = units_owned - units
+        else:
+            delta_units = 0  # units is always 1
+        self.insert_history_point(when=when, delta_units=delta_units,
+                                  delta_cost=cost_of_purchase - cost,
+                                  delta_value=value_of_asset - value)
+
+    @write_locked
+    def insert_history_point(self, when: date, delta_units: float,
+                             delta_cost: float, delta_value: float):
+        """
+        Insert in the history a HistoryPoint for the changes in units, cost
+        and value on a given date, after any other of the same date
+        """
+
+        self.history.insert(when, delta_units, delta_cost, delta_value)
+        self.bump_version()
+
+    def _make_hist_pt(self, when: date):
+        """ New HistoryPoint of this Item, stored by PointHistory """
+
+        hist_pt = HistoryPoint(when=when, units_owned=None,
+                               cost_of_purchase=None, value_of_asset=None)
         hist_pt.item = self  # to access properties of parent item
+        return hist_pt
+
+    def _make_hist_pt_view(self, when: date):
+        """ HistoryPoint view of this Item, built by ColumnarHistory """
+
+        return HistoryPointView(item=self, when=when)
+
+    @property
+    @read_locked
+    def history_dates(self):
+        """ Dates of the history, sorted """
 
+        return self.history.dates
+
+    @read_locked
+    def get_totals(self, given_date: date):
+        """ Get (units_owned, cost_of_purchase, value_of_asset) on a date """
+
+        units, cost, value = self.history.totals(given_date)
+        if self.subcategory not in ['stock', 'real_state']:
+            # account and fund items always count as 1 unit
+            first_date = self.history.first_date
+            owned = first_date is not None and first_date <= given_date
+            units = 1 if owned else 0
+        return units, cost, value
+
+    @read_locked
+    def get_history_columns(self, start: date = None, end: date = None):
+        """
+        Get the history as NumPy arrays (ordinals, units, cost, value),
+        optionally limited to the dates between start and end, inclusive
+        """
+
+        if start is None and end is None:
+            ordinals, units, cost, value = self.history.columns()
+        else:
+            ordinals, units, cost, value = self.history.range(
+                start or date.min, end or date.max)
+        if self.subcategory not in ['stock', 'real_state']:
+            # account and fund items always count as 1 unit
+            units = np.ones_like(units)
+        return ordinals, units, cost, value
+
+    @write_locked
+    def feed_prices(self, dates, closes):
+        """
+        Add closing prices in bulk, e.g. feed_prices(dates, closes) with a
+        list of dates and a list or array of closes of the same length
+        """
+
+        dates = list(dates)
+        self.prices.feed(dates, closes)
+        if not dates:
+            return
+        self.bump_version()
+        if self.portfolio is not None and self.portfolio.journal is not None:
+            self.record('prices', dates=list(dates),
+                        closes=np.asarray(closes, dtype=float).tolist())
+
+    @read_locked
+    def get_asset_value(self, given_date: date, hist_pt=None):
+        """
+        Get value of the Item on a given date: units owned times the close
+        price when there is one, value of the HistoryPoint otherwise
+        """
+
+        if hist_pt is None:
+            hist_pt = self.get_hist_pt_by_date(given_date)
+            if hist_pt is None:
+                return 0
+        price = self.prices.price(given_date)
+        if price is None:
+            return hist_pt.value_of_asset
+        units, _, _ = self.get_totals(given_date)
+        return units * price
+
+    @read_locked
+    def get_value_series(self, ordinals):
+        """
+        Get values of the Item on an array of day ordinals in one pass,
+        joining the units step function with the close prices
+        Returns arrays (values, owned)
+        """
+
+        item_ordinals, units, _, values = self.get_history_columns()
+        index = np.searchsorted(item_ordinals, ordinals, side='right') - 1
+        owned = index >= 0
+        if not owned.any():
+            return np.zeros(len(ordinals)), owned
+        values = np.where(owned, values[index], 0.0)
+        if len(self.prices):
+            prices = self.prices.prices(ordinals)
+            marked = owned & ~np.isnan(prices)
+            values[marked] = units[index[marked]] * prices[marked]
+        return values, owned
+
+    @write_locked
     def update_ledger(self, purchase_transaction):
         """ Write a purchase transaction to the Item ledger """
 
@@ -344,6 +1060,7 @@ class Item:
         finally:
             return False
 
+    @read_locked
     def get_hist_pt_by_date(self, given_date: date,
                             force_exact_match: bool = False):
         """
@@ -355,69 +1072,66 @@ class Item:
         """
 
         logging.debug("get_hist_pt_by_date() called for date=%s", given_date)
-        msg = "and for the following Item:\n"+self.display()
-        logging.debug(msg)
 
         if bool(self.history):
-            tmp_list = [(hist_pt.when,
-                         hist_pt.unique_id)
-                        for hist_pt in self.history]
-            logging.debug("tmp list %s", str(tmp_list))
-
-            sorted_by_date = sorted(tmp_list, key=lambda tup: tup[0])
-            logging.debug("sorted list %s", str(sorted_by_date))
-
-            sorted_dates = [elem[0] for elem in sorted_by_date]
-            logging.debug("sorted_dates %s", sorted_dates)
-
-            index_closest_match = bisect.bisect(sorted_dates, given_date)-1
+            # history is sorted by date: a single bisect finds the match
+            index_closest_match = self.history.index_at(given_date)
 
             if index_closest_match >= 0:
-                closest_match = sorted_by_date[index_closest_match]
-                logging.debug("i: %s tuple: %s",
-                              str(index_closest_match), str(closest_match))
-                closest_match_date, closest_match_uid = closest_match
-
-                closest_hist_pt = next((hist_pt for hist_pt in self.history if
-                                        hist_pt.unique_id == closest_match_uid
-                                        ), None)
+                closest_hist_pt = self.history[index_closest_match]
+                logging.debug("i: %s date: %s", index_closest_match,
+                              closest_hist_pt.when)
                 if force_exact_match:
-                    if closest_match_date != given_date:
+                    if closest_hist_pt.when != given_date:
                         closest_hist_pt = None
 
             else:
                 logging.warning(
                     "get_hist_pt_by_date() returns None because"
                     " no history prior to %s in Item: %s ('%s')",
-                    given_date.isoformat(),
-                    str(self.unique_id), self.name)
+                    given_date, self.unique_id, self.name)
                 closest_hist_pt = None
 
         else:  # empty list
             logging.warning(
                 "get_hist_pt_by_date() returns None for Item"
                 " with empty History: %s ('%s')",
-                str(self.unique_id), self.name)
+                self.unique_id, self.name)
             closest_hist_pt = None
 
         return closest_hist_pt
 
+    @read_locked
     def get_item_balance(self, currency: str, given_date: date):
         """ Get Item balance in a given currency and on a given date """
 
+        key = (given_date, currency)
+        balance = self.valuations.get(key, self.version)
+        if balance is not None:
+            return balance
+
         hist_pt = self.get_hist_pt_by_date(given_date)
 
         if hist_pt is None:
+            self.valuations.put(key, self.version, (0, given_date))
             return 0, given_date
 
         exchange_rate = get_exchange_rate(given_date,
                                           from_currency=self.currency,
                                           to_currency=currency)
-        closest_balance = (exchange_rate * hist_pt.value_of_asset)
+        if exchange_rate is None:
+            raise RateNotAvailableError(
+                f"No {self.currency}/{currency} exchange rate on"
+                f" {given_date.isoformat()} to value '{self.name}'")
+        closest_balance = (exchange_rate *
+                           self.get_asset_value(given_date, hist_pt))
         closest_date = hist_pt.when
 
+        self.valuations.put(key, self.version,
+                            (closest_balance, closest_date))
         return closest_balance, closest_date
 
+    @read_locked
     def display(self):
         """ Display Item as text"""
 
@@ -443,35 +1157,83 @@ class Item:
 
 
 class HistoryPoint:
-    """ HistoryPoint: historic valuation of Item"""
+    """
+    HistoryPoint: historic valuation of Item
+    Once in an Item, its figures are the running totals of the Item on its
+    date, so they stay up to date when back-dated purchases are inserted
+    """
 
     def __init__(self, when: date, units_owned: float,
                  cost_of_purchase: float, value_of_asset: float):
-        self.unique_id = generate_unique_id()
+        self._unique_id = None  # minted on first use, loading is faster
         self.when = when
-        self.units_owned = units_owned
-        self.cost_of_purchase = cost_of_purchase
-        self.value_of_asset = value_of_asset
+        self._figures = (units_owned, cost_of_purchase, value_of_asset)
         self.item = None  # initializes HistoryPoint as orphan
 
+    @property
+    def unique_id(self):
+        """ Unique ID of the HistoryPoint """
+
+        if self._unique_id is None:
+            self._unique_id = generate_unique_id()
+        return self._unique_id
+
+    def _get_figures(self):
+        """ Get (units_owned, cost_of_purchase, value_of_asset) """
+
+        if self.item is None:
+            return self._figures
+        return self.item.get_totals(self.when)
+
+    @property
+    def units_owned(self):
+        """ Units owned on the date of the HistoryPoint """
+        return self._get_figures()[0]
+
+    @property
+    def cost_of_purchase(self):
+        """ Accumulated cost on the date of the HistoryPoint """
+        return self._get_figures()[1]
+
+    @property
+    def value_of_asset(self):
+        """ Value of the Item on the date of the HistoryPoint """
+        return self._get_figures()[2]
+
     def display(self):
         """ Display HistoryPoint as text"""
 
+        units_owned, cost_of_purchase, value_of_asset = self._get_figures()
         msgs = []
         msgs.append("\n        |")
         msgs.append("{0:^15}".format(
             self.when.isoformat())+'|')  # date
         msgs.append("{0:^15}".format(
-            f'{self.units_owned:.2f}')+'|')  # units
+            f'{units_owned:.2f}')+'|')  # units
         msgs.append("{0:^15}".format(
-            f'{self.cost_of_purchase:.2f}')+'|')  # cost
+            f'{cost_of_purchase:.2f}')+'|')  # cost
         msgs.append("{0:^15}".format(
-            f'{self.value_of_asset:.2f}')+'|')  # value
+            f'{value_of_asset:.2f}')+'|')  # value
 
         msg = ''.join(msgs)
         return msg
 
 
+class HistoryPointView(HistoryPoint):
+    """
+    HistoryPoint read on demand from a columnar history. Built when the
+    history is iterated or indexed, it is not stored anywhere
+    """
+
+    # no unique_id: a view is not an object of the Portfolio
+    unique_id = None
+
+    def __init__(self, item: Item, when: date):
+        self.when = when
+        self._figures = None
+        self.item = item
+
+
 def main():
     """ This runs if utils.py is run as script """
 
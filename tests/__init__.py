@@ -0,0 +1,7 @@
+""" Tests of NetWorth """
+
+import os
+
+# keep the suite off the snapshot cache of the user, tests that need one
+# set their own with set_snapshot_cache
+os.environ['NETWORTH_SNAPSHOT_CACHE'] = ''
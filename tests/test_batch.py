@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+# tests/test_batch.py
+
+""" Tests for the headless batch valuation of Portfolio files """
+
+import io
+import os
+import csv
+import sys
+import json
+import tempfile
+import unittest
+from unittest import mock
+import subprocess
+from datetime import date
+
+from src import rates, batch
+from src.rates import RateCache, RateEngine
+from src.providers import RecordedRateProvider
+from src.utils import Portfolio
+from src.batch import value_portfolio_files, aggregate_portfolio_files, \
+    write_csv, write_household_csv, main
+from src.readwrite import read_portfolio_from_file, save_portfolio_to_file
+from tests.test_imports import DEFERRED_MODULES
+
+
+class TestBatch(unittest.TestCase):
+
+    """ Class to test valuing Portfolio files without prompts """
+
+    def setUp(self):
+        """ Fixtures saved as JSON and .npz in a temporary folder """
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.portfolio = read_portfolio_from_file('./tests/fixtures.json')
+        self.paths = []
+        for extension in ('.json', '.npz'):
+            path = os.path.join(self.tmp_dir.name, 'portfolio' + extension)
+            save_portfolio_to_file(self.portfolio, path)
+            self.paths.append(path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_reports(self):
+        """ Files valued in parallel match the Portfolio, in order """
+
+        start, end = date(2021, 2, 1), date(2021, 5, 13)
+        reports = value_portfolio_files(
+            self.paths + ['./tests/missing.json'], start, end, 'W',
+            workers=2)
+        self.assertEqual([report['file'] for report in reports],
+                         self.paths + ['./tests/missing.json'])
+        self.assertIn('error', reports[-1])
+        _, balances = self.portfolio.get_portfolio_balance_series(
+            start, end, 'W')
+        for report in reports[:-1]:
+            self.assertEqual(report['balances'], balances.tolist())
+            self.assertEqual([sum(values) for values in
+                              zip(*report['breakdown'].values())],
+                             report['balances'])
+            self.assertAlmostEqual(
+                report['balances'][-1],
+                self.portfolio.get_portfolio_balance(
+                    date.fromisoformat(report['dates'][-1])))
+
+    def test_csv(self):
+        """ One CSV row per file and date, one column per subcategory """
+
+        reports = value_portfolio_files(self.paths[:1], date(2021, 5, 13),
+                                        date(2021, 5, 13), workers=1)
+        output = io.StringIO()
+        write_csv(reports, output)
+        rows = list(csv.DictReader(io.StringIO(output.getvalue())))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(float(rows[0]['balance']), 150000.0)
+        self.assertEqual(float(rows[0]['subcategory:fund']) +
+                         float(rows[0]['subcategory:stock']), 150000.0)
+
+    def test_main(self):
+        """ The command writes the report and fails on a missing file """
+
+        report_path = os.path.join(self.tmp_dir.name, 'report.json')
+        self.assertEqual(main(self.paths + ['--date', '2021-05-13',
+                                            '--by', 'category',
+                                            '--output', report_path]), 0)
+        with open(report_path) as report_file:
+            reports = json.load(report_file)
+        self.assertEqual([report['breakdown'] for report in reports],
+                         [{'asset': [150000.0]}] * 2)
+        with mock_stderr():
+            self.assertEqual(main(['./tests/missing.json',
+                                   '--output', report_path]), 1)
+
+    def test_headless(self):
+        """ A batch run loads no prompt, GUI or plotting module """
+
+        code = ("import sys, json\n"
+                "from src.batch import main\n"
+                f"main([{self.paths[0]!r}, '--date', '2021-05-13',"
+                f" '--output', {os.devnull!r}])\n"
+                "print(json.dumps(sorted(sys.modules)))")
+        output = subprocess.run([sys.executable, '-c', code], check=True,
+                                capture_output=True, text=True).stdout
+        loaded = json.loads(output)
+        self.assertEqual([module for module in DEFERRED_MODULES +
+                          ('PyInquirer', 'prompt_toolkit')
+                          if module in loaded], [])
+
+
+class TestHousehold(unittest.TestCase):
+
+    """ Class to test adding up Portfolio files in a reporting currency """
+
+    def setUp(self):
+        """ Fixtures in EUR and a copy in USD, and recorded rates """
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.provider = RecordedRateProvider('./tests/fixtures_rates.json')
+        self.previous_engine = rates.get_rate_engine()
+        self.engine = rates.set_rate_engine(RateEngine(
+            currencies=Portfolio.CURRENCIES, crypto=Portfolio.CRYPTO,
+            rate_cache=RateCache(path=':memory:'), provider=self.provider))
+        self.portfolios = []
+        self.paths = []
+        for currency in ('EUR', 'USD'):
+            portfolio = read_portfolio_from_file('./tests/fixtures.json')
+            for item in portfolio.item_list:
+                item.currency = currency
+            path = os.path.join(self.tmp_dir.name, currency + '.json')
+            save_portfolio_to_file(portfolio, path)
+            self.portfolios.append(portfolio)
+            self.paths.append(path)
+        self.day = date(2021, 8, 27)
+
+    def tearDown(self):
+        self.engine.rate_cache.close()
+        rates.set_rate_engine(self.previous_engine)
+        self.tmp_dir.cleanup()
+
+    def test_net_worth(self):
+        """ Net worth and breakdown add up every file, converted """
+
+        for workers in (1, 2):
+            household = aggregate_portfolio_files(
+                self.paths, self.day, self.day, currency='GBP',
+                workers=workers)
+            usd_gbp = self.engine.get_rate(self.day, 'USD', 'GBP')
+            eur_gbp = self.engine.get_rate(self.day, 'EUR', 'GBP')
+            self.assertAlmostEqual(household['net_worth'][0],
+                                   150000.0 * (usd_gbp + eur_gbp))
+            self.assertAlmostEqual(household['breakdown']['stock'][0],
+                                   50000.0 * (usd_gbp + eur_gbp))
+            for report, rate in zip(household['portfolios'],
+                                    (eur_gbp, usd_gbp)):
+                self.assertAlmostEqual(report['net_worth'][0], 150000 * rate)
+
+    def test_rates_fetched_once(self):
+        """ Rates are prefetched once for all files, by the caller """
+
+        with mock.patch('src.batch.prefetch_rates',
+                        wraps=batch.prefetch_rates) as prefetch_rates:
+            aggregate_portfolio_files(self.paths * 4, date(2021, 8, 26),
+                                      self.day, currency='GBP', workers=2)
+        prefetch_rates.assert_called_once()
+
+    def test_csv(self):
+        """ One CSV row per date, a column per subcategory and file """
+
+        household = aggregate_portfolio_files(
+            self.paths, self.day, self.day, currency='EUR', workers=1)
+        output = io.StringIO()
+        write_household_csv(household, output)
+        header, row = csv.reader(io.StringIO(output.getvalue()))
+        self.assertEqual(header, ['date', 'net_worth (EUR)',
+                                  'subcategory:fund', 'subcategory:stock'] +
+                         self.paths)
+        self.assertEqual(float(row[1]), float(row[2]) + float(row[3]))
+        self.assertEqual(float(row[1]), float(row[4]) + float(row[5]))
+
+
+def mock_stderr():
+    """ Silence the errors printed by a failing run """
+
+    return mock.patch.object(sys, 'stderr', io.StringIO())
+
+
+if __name__ == '__main__':
+    unittest.main()
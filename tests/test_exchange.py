@@ -8,10 +8,10 @@ import unittest
 
 from datetime import date, timedelta
 
-from forex_python.converter import CurrencyRates
-from forex_python.bitcoin import BtcConverter
-
-from src.utils import get_exchange_rate
+from src import rates
+from src.rates import RateCache, RateEngine
+from src.providers import RecordedRateProvider
+from src.utils import get_exchange_rate, Portfolio
 
 
 class TestExchangeRates(unittest.TestCase):
@@ -19,13 +19,18 @@ class TestExchangeRates(unittest.TestCase):
     """ Class to test interface with exchange rate service """
 
     def setUp(self):
+        """ Serve rates offline from the recorded rates fixture """
 
-        btc_handler = BtcConverter()
-        btc_eur = btc_handler.get_latest_price('EUR')
-        usd_btc = 1 / btc_handler.get_latest_price('USD')
+        provider = RecordedRateProvider('./tests/fixtures_rates.json')
+        self.previous_engine = rates.get_rate_engine()
+        rates.set_rate_engine(RateEngine(
+            currencies=Portfolio.CURRENCIES, crypto=Portfolio.CRYPTO,
+            rate_cache=RateCache(path=':memory:'), provider=provider))
 
-        currency_handler = CurrencyRates()
-        usd_eur = currency_handler.get_rate('USD', 'EUR')
+        latest = provider.fetch(date.today(), 'EUR', ('USD', 'BTC'))
+        btc_eur = 1 / latest['BTC']
+        usd_btc = latest['BTC'] / latest['USD']
+        usd_eur = 1 / latest['USD']
 
         date_26_8 = date(2021, 8, 26)
         date_today = date.today()
@@ -63,6 +68,10 @@ class TestExchangeRates(unittest.TestCase):
             (date_holiday2, 'BTC', 'EUR', 'holiday', None),  # future BTC a
         ]
 
+    def tearDown(self):
+        rates.get_rate_engine().rate_cache.close()
+        rates.set_rate_engine(self.previous_engine)
+
     def test_1_valid_cases(self):
         """ Retrieving valid past exchange rates from service """
 
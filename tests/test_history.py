@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+
+# tests/test_history.py
+
+""" Tests for the history backends and closing prices of an Item """
+
+import os
+import random
+import tempfile
+import unittest
+from datetime import date, timedelta
+
+from src.history import ColumnarHistory, PriceSeries
+from src.utils import Portfolio, HistoryPointView
+from src.readwrite import save_portfolio_to_file, read_portfolio_from_file
+
+
+class TestColumnarHistory(unittest.TestCase):
+
+    """ Class to test the columnar history against the HistoryPoint one """
+
+    def setUp(self):
+        """ Same purchases, in random order, on a point and columnar Item """
+
+        self.portfolio = Portfolio(name='Histories', description='Histories',
+                                   currency='EUR')
+        self.items = []
+        for columnar in (False, True):
+            self.portfolio.columnar = columnar
+            self.items.append(self.portfolio.add_item(
+                category='asset', subcategory='stock', currency='USD',
+                name='Stock', description='Stock'))
+        self.point_item, self.columnar_item = self.items
+
+        randomizer = random.Random(5)
+        self.start = date(2020, 1, 1)
+        for _ in range(200):
+            when = self.start + timedelta(days=randomizer.randrange(365))
+            units = randomizer.randrange(1, 10)
+            price = float(randomizer.randrange(10, 100))
+            for item in self.items:
+                item.purchase(when=when, units_purchased=units,
+                              unit_price=price, fees=1.0)
+
+    def test_backend(self):
+        """ Item and Portfolio option selects the columnar backend """
+
+        self.assertIsInstance(self.columnar_item.history, ColumnarHistory)
+        self.assertNotIsInstance(self.point_item.history, ColumnarHistory)
+        hist_pt = self.columnar_item.history[0]
+        self.assertIsInstance(hist_pt, HistoryPointView)
+        self.assertIs(hist_pt.item, self.columnar_item)
+
+    def test_same_history(self):
+        """ Both backends give the same points, totals and display """
+
+        self.assertEqual(self.point_item.history_dates,
+                         self.columnar_item.history_dates)
+        for day in range(-1, 367):
+            given_date = self.start + timedelta(days=day)
+            for expected, got in zip(self.point_item.get_totals(given_date),
+                                     self.columnar_item.get_totals(
+                                         given_date)):
+                self.assertAlmostEqual(expected, got, places=6)
+        self.assertEqual(
+            [hist_pt.display() for hist_pt in self.point_item.history],
+            [hist_pt.display() for hist_pt in self.columnar_item.history])
+
+    def test_range(self):
+        """ Vectorized range query of the history columns """
+
+        start, end = date(2020, 3, 1), date(2020, 3, 31)
+        ordinals, units, cost, value = \
+            self.columnar_item.get_history_columns(start, end)
+        expected = [hist_pt for hist_pt in self.point_item.history
+                    if start <= hist_pt.when <= end]
+        self.assertEqual(ordinals.tolist(),
+                         [hist_pt.when.toordinal() for hist_pt in expected])
+        self.assertEqual(units.tolist(),
+                         [hist_pt.units_owned for hist_pt in expected])
+        self.assertEqual(value.tolist(),
+                         [hist_pt.value_of_asset for hist_pt in expected])
+        for columns in (self.point_item.get_history_columns(start, end),
+                        (ordinals, units, cost, value)):
+            self.assertEqual(cost.tolist(), columns[2].tolist())
+
+    def test_memory(self):
+        """ Each point takes a few dozen bytes """
+
+        history = self.columnar_item.history
+        self.assertLessEqual(history.nbytes / len(history), 2 * 28)
+
+
+class TestPriceSeries(unittest.TestCase):
+
+    """ Class to test mark-to-market valuation with closing prices """
+
+    def setUp(self):
+        """ A stock bought twice, with a close every business day """
+
+        self.portfolio = Portfolio(name='Prices', description='Prices',
+                                   currency='EUR')
+        self.stock = self.portfolio.add_item(
+            category='asset', subcategory='stock', currency='EUR',
+            name='Stock', description='Stock')
+        self.stock.purchase(when=date(2021, 3, 1), units_purchased=10,
+                            unit_price=100.0, fees=5.0)
+        self.stock.purchase(when=date(2021, 3, 10), units_purchased=5,
+                            unit_price=120.0, fees=5.0)
+        self.days = [date(2021, 3, 1) + timedelta(days=i) for i in range(31)]
+        self.business_days = [day for day in self.days if day.weekday() < 5]
+        self.closes = [100.0 + i for i in range(len(self.business_days))]
+        self.stock.feed_prices(self.business_days, self.closes)
+
+    def test_feed(self):
+        """ Closes are sorted, forward-filled and replaced by date """
+
+        prices = PriceSeries()
+        prices.feed([date(2021, 3, 3), date(2021, 3, 1)], [3.0, 1.0])
+        prices.feed([date(2021, 3, 3), date(2021, 3, 2)], [30.0, 2.0])
+        self.assertEqual(len(prices), 3)
+        self.assertEqual(prices.dates, [date(2021, 3, 1), date(2021, 3, 2),
+                                        date(2021, 3, 3)])
+        self.assertIsNone(prices.price(date(2021, 2, 28)))
+        self.assertEqual(prices.price(date(2021, 3, 3)), 30.0)
+        self.assertEqual(prices.price(date(2021, 3, 9)), 30.0)
+        with self.assertRaises(ValueError):
+            prices.feed([date(2021, 3, 4)], [1.0, 2.0])
+
+    def test_feed_empty(self):
+        """ Feeding no closes changes nothing """
+
+        PriceSeries().feed([], [])
+        version = self.stock.version
+        self.stock.feed_prices([], [])
+        self.assertEqual(self.stock.version, version)
+        self.assertEqual(len(self.stock.prices), len(self.business_days))
+
+    def test_mark_to_market(self):
+        """ Value is units owned times the close of the day """
+
+        friday, sunday = date(2021, 3, 12), date(2021, 3, 14)
+        close = self.closes[self.business_days.index(friday)]
+        self.assertAlmostEqual(self.portfolio.get_portfolio_balance(friday),
+                               15 * close)
+        self.assertAlmostEqual(self.portfolio.get_portfolio_balance(sunday),
+                               15 * close)
+        # history points keep the value of the purchases
+        self.assertEqual(self.stock.get_hist_pt_by_date(sunday).value_of_asset,
+                         1600.0)
+
+        _, balances = self.portfolio.get_portfolio_balance_series(
+            self.days[0], self.days[-1])
+        self.assertEqual(balances.tolist(),
+                         [self.portfolio.get_portfolio_balance(day)
+                          for day in self.days])
+
+    def test_save_and_read(self):
+        """ Closes are saved apart from the ledger and read back """
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'prices.json')
+            self.assertTrue(save_portfolio_to_file(self.portfolio, path))
+            portfolio = read_portfolio_from_file(path)
+        stock, = portfolio.item_list
+        self.assertEqual(stock.prices.dates, self.business_days)
+        self.assertEqual(stock.prices.columns()[1].tolist(), self.closes)
+
+
+class TestBulkLoad(unittest.TestCase):
+
+    """ Class to test loading a ledger in bulk against replaying it """
+
+    def setUp(self):
+        """ Random ledger, with invalid transactions, for a stock """
+
+        randomizer = random.Random(7)
+        start = date(2019, 1, 1)
+        self.ledger = [
+            ('purchase', {'when': start + timedelta(days=randomizer.randrange(
+                              400)),
+                          'units_purchased': randomizer.randrange(-3, 10),
+                          'unit_price': float(randomizer.randrange(10, 99)),
+                          'fees': 1.0})
+            for _ in range(300)]
+        self.ledger.append(('purchase', {'when': date(2019, 2, 1),
+                                         'units_purchased': 1.5,
+                                         'unit_price': 10.0, 'fees': 0.0}))
+        self.ledger.append(('sale', {}))
+        self.portfolio = Portfolio(name='Bulk', description='Bulk',
+                                   currency='EUR')
+
+    def new_stock(self, columnar: bool):
+        """ Empty stock Item """
+
+        self.portfolio.columnar = columnar
+        return self.portfolio.add_item(
+            category='asset', subcategory='stock', currency='EUR',
+            name='Stock', description='Stock')
+
+    def assert_same_history(self, expected, got):
+        """ Same dates and figures in two Items """
+
+        self.assertEqual(expected.history_dates, got.history_dates)
+        for hist_pt, bulk_pt in zip(expected.history, got.history):
+            self.assertEqual(hist_pt.units_owned, bulk_pt.units_owned)
+            self.assertAlmostEqual(hist_pt.cost_of_purchase,
+                                   bulk_pt.cost_of_purchase, places=6)
+            self.assertAlmostEqual(hist_pt.value_of_asset,
+                                   bulk_pt.value_of_asset, places=6)
+
+    def test_load_ledger(self):
+        """ Bulk load gives the history of replaying every purchase """
+
+        replayed = self.new_stock(columnar=False)
+        for transaction_type, data in self.ledger:
+            if transaction_type == 'purchase':
+                replayed.purchase(**data)
+
+        for columnar in (False, True):
+            loaded = self.new_stock(columnar)
+            self.assertEqual(loaded.load_ledger(self.ledger), 300)
+            self.assert_same_history(replayed, loaded)
+            self.assertEqual(loaded.ledger, replayed.ledger)
+
+    def test_load_in_batches(self):
+        """ Batches merge with the history already loaded """
+
+        replayed = self.new_stock(columnar=False)
+        replayed.load_ledger(self.ledger)
+        for columnar in (False, True):
+            loaded = self.new_stock(columnar)
+            for i in range(0, len(self.ledger), 64):
+                loaded.load_ledger(self.ledger[i:i + 64])
+            self.assert_same_history(replayed, loaded)
+
+
+if __name__ == '__main__':
+    unittest.main()
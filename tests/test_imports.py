@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+# tests/test_imports.py
+
+""" Tests that importing the library stays fast and headless """
+
+import sys
+import json
+import unittest
+import subprocess
+
+# imported by the library only when first needed
+DEFERRED_MODULES = ('matplotlib', 'tkinter', 'forex_python', 'urllib.request',
+                    'http.server')
+
+# modules a headless script or server worker imports
+LIBRARY_MODULES = ('src.utils', 'src.readwrite', 'src.rates',
+                   'src.providers', 'src.npzformat', 'src.snapshots')
+
+
+def imported_modules(modules):
+    """ Modules loaded by a fresh interpreter importing some modules """
+
+    code = ("import sys, json\n" +
+            "".join(f"import {module}\n" for module in modules) +
+            "print(json.dumps(sorted(sys.modules)))")
+    output = subprocess.run([sys.executable, '-c', code], check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+class TestImports(unittest.TestCase):
+
+    """ Class to test that heavy dependencies are imported on demand """
+
+    def test_deferred(self):
+        """ Importing the library loads no GUI, plotting or HTTP module """
+
+        loaded = imported_modules(LIBRARY_MODULES)
+        self.assertEqual([module for module in DEFERRED_MODULES
+                          if module in loaded], [])
+
+    def test_on_demand(self):
+        """ The stand-in rate server still brings its own modules """
+
+        self.assertIn('http.server', imported_modules(['src.rateserver']))
+
+
+if __name__ == '__main__':
+    unittest.main()
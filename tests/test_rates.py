@@ -0,0 +1,608 @@
+#!/usr/bin/env python3
+
+# tests/test_rates.py
+
+""" Tests for the exchange rate cache and cross-rate engine """
+
+import os
+import time
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from concurrent.futures import Future
+from datetime import date, timedelta
+
+from src import rates
+from src.rates import RateCache, RateEngine, CircuitBreaker, \
+    RateNotAvailableError
+from src import providers
+from src.providers import RateProvider, RecordedRateProvider, \
+    HttpRateProvider, FallbackProvider, ForexPythonProvider, serve_rates
+from src.utils import get_exchange_rate, Portfolio
+
+
+class TestRateCache(unittest.TestCase):
+
+    """ Class to test the persistent exchange rate cache """
+
+    def setUp(self):
+        """ Create an empty rate cache in a temporary folder """
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmp_dir.name, 'rates.sqlite3')
+        self.previous_cache = rates.get_rate_cache()
+        self.rate_cache = rates.set_rate_cache(
+            RateCache(path=self.cache_path, today_ttl=60))
+
+    def tearDown(self):
+        self.rate_cache.close()
+        rates.set_rate_cache(self.previous_cache)
+        self.tmp_dir.cleanup()
+
+    def test_past_rates_persist(self):
+        """ Past rates are cached forever and survive reopening the file """
+
+        past = date(2021, 8, 26)
+        self.rate_cache.put(past, 'USD', 'EUR', 0.84983428,
+                            fetched_at=time.time() - 365 * 86400)
+        self.rate_cache.close()
+
+        reopened = RateCache(path=self.cache_path, today_ttl=60)
+        self.assertAlmostEqual(reopened.get(past, 'USD', 'EUR'), 0.84983428)
+        self.assertIsNone(reopened.get(past, 'EUR', 'USD'))
+        self.assertEqual((reopened.hits, reopened.misses), (1, 1))
+        reopened.close()
+
+    def test_today_ttl(self):
+        """ Rates fetched today expire after the configured TTL """
+
+        today = date.today()
+        self.rate_cache.put(today, 'USD', 'EUR', 0.85)
+        self.assertAlmostEqual(self.rate_cache.get(today, 'USD', 'EUR'), 0.85)
+
+        self.rate_cache.put(today, 'USD', 'EUR', 0.85,
+                            fetched_at=time.time() - 120)
+        self.assertIsNone(self.rate_cache.get(today, 'USD', 'EUR'))
+
+    def test_provisional_rates_expire(self):
+        """ Rates fetched on their own day are not final """
+
+        yesterday = date.today() - timedelta(days=1)
+        fetched_at = time.mktime(yesterday.timetuple()) + 3600
+        self.assertFalse(self.rate_cache.is_fresh(yesterday, fetched_at))
+        self.assertTrue(self.rate_cache.is_fresh(
+            yesterday - timedelta(days=1), fetched_at))
+
+    def test_warm_lookup_without_service(self):
+        """ get_exchange_rate serves cached rates with no network call """
+
+        past = date(2021, 8, 26)
+        self.rate_cache.put(past, 'EUR', 'USD', 1.1767,
+                            fetched_at=time.time() - 86400 * 30)
+        fetches = rates.get_rate_engine().fetches
+
+        rate = get_exchange_rate(past, 'EUR', 'USD')
+        self.assertAlmostEqual(rate, 1.1767, places=4)
+        self.assertEqual(get_exchange_rate(past, 'EUR', 'EUR'), 1)
+        self.assertEqual(rates.get_rate_engine().fetches, fetches)
+
+
+class DriftingProvider(RateProvider):
+    """ Provider of a base vector that drifts by 1% a day """
+
+    def __init__(self, base_vector, delay=0):
+        super().__init__(timeout=None)
+        self.base_vector = base_vector
+        self.fetched_dates = []
+        self.delay = delay
+
+    def fetch(self, given_date, pivot, wanted):
+        self.fetched_dates.append(given_date)
+        time.sleep(self.delay)
+        drift = 1 + given_date.toordinal() % 100 / 100
+        return {curr: rate * drift for curr, rate in self.base_vector.items()
+                if curr in wanted}
+
+
+class TestRateEngine(unittest.TestCase):
+
+    """ Class to test cross rates derived from a base vector """
+
+    def setUp(self):
+        """ Create an engine with an in-memory cache """
+
+        self.base_vector = {'USD': 1.1767, 'GBP': 0.8562, 'PLN': 4.5676,
+                            'BTC': 1 / 39848.2899}
+        self.engine = RateEngine(
+            currencies=('EUR', 'USD', 'GBP', 'PLN'), crypto=('BTC',),
+            rate_cache=RateCache(path=':memory:'),
+            provider=DriftingProvider(self.base_vector))
+
+    def tearDown(self):
+        self.engine.rate_cache.close()
+
+    def test_cross_rates(self):
+        """ Every pair is derived from a single fetch per date """
+
+        past = date(2021, 8, 26)
+        currencies = ('EUR', 'USD', 'GBP', 'PLN', 'BTC')
+        for from_curr in currencies:
+            for to_curr in currencies:
+                rate = self.engine.get_rate(past, from_curr, to_curr)
+                inverse = self.engine.get_rate(past, to_curr, from_curr)
+                self.assertAlmostEqual(rate * inverse, 1.0, places=9)
+        self.assertEqual(self.engine.fetches, 1)
+
+        self.assertAlmostEqual(self.engine.get_rate(past, 'USD', 'GBP'),
+                               0.8562 / 1.1767, places=9)
+        self.assertAlmostEqual(self.engine.get_rate(past, 'BTC', 'USD'),
+                               39848.2899 * 1.1767, places=4)
+
+    def test_one_fetch_per_date(self):
+        """ A new date needs exactly one more fetch """
+
+        self.engine.get_rate(date(2021, 8, 26), 'USD', 'GBP')
+        self.engine.get_rate(date(2021, 8, 27), 'GBP', 'USD')
+        self.engine.get_rate(date(2021, 8, 27), 'PLN', 'BTC')
+        self.assertEqual(self.engine.fetches, 2)
+
+    def test_concurrent_dates(self):
+        """ Base vectors of distinct dates are fetched concurrently """
+
+        self.engine.provider.delay = 0.2
+        days = [date(2021, 8, day) for day in range(16, 24)]
+        keys = [(day, 'USD', curr) for day in days
+                for curr in ('EUR', 'GBP', 'BTC')]
+        tic = time.perf_counter()
+        exchange_rates = self.engine.get_rates(keys)
+        self.assertLess(time.perf_counter() - tic, 0.2 * len(days) / 2)
+        self.assertEqual(self.engine.fetches, len(days))
+        for key in keys:
+            self.assertAlmostEqual(exchange_rates[key],
+                                   self.engine.get_rate(*key))
+
+    def test_unavailable_rate(self):
+        """ Currencies missing from the base vector return None """
+
+        del self.base_vector['PLN']
+        self.assertIsNone(self.engine.get_rate(date(2021, 8, 26),
+                                               'PLN', 'EUR'))
+
+
+class TestResilience(unittest.TestCase):
+
+    """ Class to test request coalescing, stale rates and circuit breaker """
+
+    def setUp(self):
+        """ Create an engine with an in-memory cache and a slow provider """
+
+        self.provider = DriftingProvider({'USD': 1.1767, 'GBP': 0.8562},
+                                         delay=0.2)
+        self.engine = RateEngine(
+            currencies=('EUR', 'USD', 'GBP'), crypto=(),
+            rate_cache=RateCache(path=':memory:'), provider=self.provider)
+
+    def tearDown(self):
+        self.engine.rate_cache.close()
+
+    def test_single_flight(self):
+        """ Concurrent lookups of the same date share one request """
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            self.engine.get_rate(date(2021, 8, 26), 'USD', 'GBP')))
+            for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(self.provider.fetched_dates), 1)
+        self.assertEqual(len(set(results)), 1)
+
+    def test_single_flight_keys(self):
+        """ Callers only share fetches of the same provider and currencies """
+
+        day = date(2021, 8, 26)
+        leader = threading.Thread(target=self.engine._fetch_shared,
+                                  args=(day, ('USD',)))
+        leader.start()
+        time.sleep(0.05)
+        vector = self.engine._fetch_shared(day, ('USD', 'GBP'))
+        leader.join()
+        self.assertEqual(sorted(vector), ['GBP', 'USD'])
+        self.assertEqual(len(self.provider.fetched_dates), 2)
+
+        other = DriftingProvider({'USD': 2.0})
+        leader = threading.Thread(target=self.engine._fetch_shared,
+                                  args=(day, ('USD',)))
+        leader.start()
+        time.sleep(0.05)
+        self.engine.provider = other
+        vector = self.engine._fetch_shared(day, ('USD',))
+        leader.join()
+        self.assertEqual(vector, other.fetch(day, 'EUR', ('USD',)))
+
+    def test_single_flight_finished(self):
+        """ A finished fetch not removed yet is not joined again """
+
+        day = date(2021, 8, 26)
+        finished = Future()
+        finished.set_result({'USD': 1.0})
+        key = (self.provider, self.engine.pivot, day)
+        self.engine._inflight[key] = (finished, ('USD',))
+        vector = self.engine._fetch_shared(day, ('USD', 'GBP'))
+        self.assertEqual(sorted(vector), ['GBP', 'USD'])
+        self.assertEqual(self.provider.fetched_dates, [day])
+        self.assertEqual(self.engine._inflight, {})
+
+    def test_stale_while_revalidate(self):
+        """ Expired rates are served at once and refreshed in background """
+
+        today = date.today()
+        self.engine.stale_while_revalidate = True
+        self.engine.rate_cache.put_vector(today, 'EUR', {'USD': 1.0,
+                                                         'GBP': 1.0},
+                                          fetched_at=time.time() - 7200)
+        tic = time.perf_counter()
+        self.assertEqual(self.engine.get_rate(today, 'EUR', 'USD'), 1.0)
+        self.assertLess(time.perf_counter() - tic, 0.1)
+
+        time.sleep(0.5)
+        self.assertEqual(self.provider.fetched_dates, [today])
+        self.assertNotEqual(self.engine.get_rate(today, 'EUR', 'USD'), 1.0)
+
+    def test_circuit_breaker(self):
+        """ A dead service is not called again until the reset timeout """
+
+        failing = FailingProvider()
+        engine = RateEngine(currencies=('EUR', 'USD'), crypto=(),
+                            rate_cache=self.engine.rate_cache,
+                            provider=failing,
+                            breaker=CircuitBreaker(failure_threshold=2,
+                                                   reset_timeout=0.2))
+        for day in range(1, 6):
+            self.assertIsNone(engine.get_rate(date(2021, 8, day),
+                                              'EUR', 'USD'))
+        self.assertEqual(engine.fetches, 2)
+        self.assertEqual(engine.breaker.state, 'open')
+
+        time.sleep(0.3)
+        self.assertEqual(engine.breaker.state, 'half-open')
+        engine.provider = self.provider
+        self.assertIsNotNone(engine.get_rate(date(2021, 8, 6), 'EUR', 'USD'))
+        self.assertEqual(engine.breaker.state, 'closed')
+
+    def test_balance_without_rate(self):
+        """ Valuing with a missing rate raises RateNotAvailableError """
+
+        previous_engine = rates.get_rate_engine()
+        rates.set_rate_engine(RateEngine(
+            currencies=('EUR', 'USD'), crypto=(),
+            rate_cache=self.engine.rate_cache, provider=FailingProvider()))
+        my_portfolio = Portfolio(name='Dollars', description='Dollars',
+                                 currency='EUR')
+        item = my_portfolio.add_item(
+            category='asset', subcategory='account', currency='USD',
+            name='Checking', description='Checking account')
+        item.purchase(when=date(2021, 8, 2), units_purchased=1,
+                      unit_price=100.0, fees=0.0)
+        try:
+            with self.assertRaises(RateNotAvailableError):
+                item.get_item_balance('EUR', date(2021, 8, 26))
+            with self.assertRaises(RateNotAvailableError):
+                my_portfolio.get_portfolio_balance(date(2021, 8, 26))
+        finally:
+            rates.set_rate_engine(previous_engine)
+
+
+class TestRateTable(unittest.TestCase):
+
+    """ Class to test bulk prefetch into a dense RateTable """
+
+    def setUp(self):
+        """ Create an engine with an in-memory cache """
+
+        self.provider = DriftingProvider({'USD': 1.1767, 'GBP': 0.8562})
+        self.engine = RateEngine(
+            currencies=('EUR', 'USD', 'GBP'), crypto=(),
+            rate_cache=RateCache(path=':memory:'), provider=self.provider)
+        self.start = date(2021, 8, 1)  # a Sunday
+        self.end = date(2021, 8, 31)
+
+    def tearDown(self):
+        self.engine.rate_cache.close()
+
+    def test_prefetch(self):
+        """ Only business days are fetched and the rest is forward-filled """
+
+        table = self.engine.prefetch(self.start, self.end)
+        self.assertEqual(len(table), 31)
+        self.assertTrue(all(day.weekday() < 5
+                            for day in self.provider.fetched_dates))
+
+        friday, saturday, sunday = (date(2021, 8, 27), date(2021, 8, 28),
+                                    date(2021, 8, 29))
+        friday_rate = table.rate(friday, 'EUR', 'USD')
+        self.assertNotAlmostEqual(friday_rate,
+                                  table.rate(date(2021, 8, 26), 'EUR', 'USD'))
+        self.assertEqual(table.rate(saturday, 'EUR', 'USD'), friday_rate)
+        self.assertEqual(self.engine.get_rate(sunday, 'EUR', 'USD'),
+                         friday_rate)
+        # the first day is filled from the business day before the range
+        last_friday = date(2021, 7, 30)
+        self.assertAlmostEqual(
+            table.rate(self.start, 'EUR', 'USD'),
+            1.1767 * (1 + last_friday.toordinal() % 100 / 100))
+        self.assertIsNone(table.rate(date(2021, 9, 1), 'EUR', 'USD'))
+
+        rates_array = table.rates('EUR', 'USD')
+        self.assertEqual(rates_array.shape, (31,))
+        self.assertAlmostEqual(rates_array[27], friday_rate)
+
+    def test_prefetch_crypto(self):
+        """ Crypto rates are fetched on weekends too, as get_rate does """
+
+        provider = DriftingProvider({'USD': 1.1767, 'BTC': 1 / 39848.2899})
+        engine = RateEngine(currencies=('EUR', 'USD'), crypto=('BTC',),
+                            rate_cache=self.engine.rate_cache,
+                            provider=provider)
+        table = engine.prefetch(self.start, self.end)
+        saturday, friday = date(2021, 8, 28), date(2021, 8, 27)
+        self.assertIn(saturday, provider.fetched_dates)
+        self.assertEqual(table.rate(saturday, 'EUR', 'USD'),
+                         table.rate(friday, 'EUR', 'USD'))
+        engine.clear_tables()
+        self.assertAlmostEqual(table.rate(saturday, 'EUR', 'BTC'),
+                               engine.get_rate(saturday, 'EUR', 'BTC'))
+
+    def test_prefetch_no_rates(self):
+        """ Days the service has no rate for are not asked again """
+
+        del self.provider.base_vector['GBP']
+        self.engine.prefetch(self.start, self.end)
+        fetched_dates = list(self.provider.fetched_dates)
+        self.engine.clear_tables()
+        table = self.engine.prefetch(self.start, self.end)
+        self.assertEqual(self.provider.fetched_dates, fetched_dates)
+        self.assertIsNone(table.rate(self.end, 'EUR', 'GBP'))
+
+    def test_prefetch_today(self):
+        """ A table ending today expires with today's rates """
+
+        table = self.engine.prefetch(date.today() - timedelta(days=3),
+                                     date.today())
+        self.assertIs(self.engine.find_table(table.start, table.end), table)
+        self.assertIsNone(self.engine.prefetch(self.start, self.end)
+                          .expires_at)
+        table.expires_at = time.monotonic()  # today_ttl later
+        self.assertIsNone(self.engine.find_table(table.start, table.end))
+        fetches = self.engine.fetches
+        self.engine.rate_cache.clear()
+        self.engine.get_rate(date.today(), 'EUR', 'USD')
+        self.assertEqual(self.engine.fetches, fetches + 1)
+        self.engine.prefetch(self.start, self.end)
+        self.assertNotIn(table, self.engine.tables)
+
+    def test_prefetch_from_cache(self):
+        """ A second prefetch of the same range is served by the cache """
+
+        self.engine.prefetch(self.start, self.end)
+        fetches = self.engine.fetches
+        self.engine.clear_tables()
+        self.engine.prefetch(self.start, self.end)
+        self.assertEqual(self.engine.fetches, fetches)
+
+    def test_tables_bounded(self):
+        """ Prefetches replace the tables they contain, up to MAX_TABLES """
+
+        for _ in range(3):
+            self.engine.prefetch(self.start, self.end)
+        self.engine.prefetch(self.start + timedelta(days=7), self.end)
+        self.assertEqual(len(self.engine.tables), 2)
+        table = self.engine.prefetch(self.start - timedelta(days=1), self.end)
+        self.assertEqual(self.engine.tables, [table])
+
+        for i in range(rates.MAX_TABLES + 3):
+            self.engine.prefetch(self.start + timedelta(days=i),
+                                 self.start + timedelta(days=i))
+        self.assertEqual(len(self.engine.tables), rates.MAX_TABLES)
+        self.assertEqual(self.engine.tables[0].start,
+                         self.start + timedelta(days=rates.MAX_TABLES + 2))
+
+    def test_prefetch_future(self):
+        """ A range after today gives an empty table, fetching nothing """
+
+        start = date.today() + timedelta(days=30)
+        table = self.engine.prefetch(start, start + timedelta(days=30))
+        self.assertEqual(len(table), 0)
+        self.assertIsNone(table.rate(start, 'EUR', 'USD'))
+        self.assertEqual((self.engine.fetches, self.engine.tables), (0, []))
+
+        previous_engine = rates.get_rate_engine()
+        rates.set_rate_engine(self.engine)
+        try:
+            portfolio = Portfolio(name='Future', description='Future',
+                                  currency='GBP')
+            item = portfolio.add_item(
+                category='asset', subcategory='stock', currency='USD',
+                name='stock USD', description='Stock')
+            item.purchase(when=self.start, units_purchased=10,
+                          unit_price=100.0, fees=1.0)
+            dates, balances = portfolio.get_portfolio_balance_series(
+                start, start + timedelta(days=30))
+        finally:
+            rates.set_rate_engine(previous_engine)
+        self.assertEqual((len(dates), len(balances)), (0, 0))
+
+    def test_balance_series(self):
+        """ Vectorized series matches valuing one date at a time """
+
+        previous_engine = rates.get_rate_engine()
+        rates.set_rate_engine(self.engine)
+        portfolio = Portfolio(name='Series', description='Series',
+                              currency='GBP')
+        for currency, when in (('USD', date(2021, 8, 10)),
+                               ('EUR', date(2021, 8, 3)),
+                               ('GBP', date(2021, 8, 20))):
+            item = portfolio.add_item(
+                category='asset', subcategory='stock', currency=currency,
+                name=f"stock {currency}", description='Stock')
+            item.purchase(when=when, units_purchased=10, unit_price=100.0,
+                          fees=1.0)
+            item.purchase(when=when + timedelta(days=5), units_purchased=5,
+                          unit_price=110.0, fees=1.0)
+        business_days = [self.start + timedelta(days=i) for i in range(31)
+                         if (self.start + timedelta(days=i)).weekday() < 5]
+        expected = [portfolio.get_portfolio_balance(day)
+                    for day in business_days]
+
+        try:
+            dates, balances = portfolio.get_portfolio_balance_series(
+                self.start, self.end)
+            monthly_dates, _ = portfolio.get_portfolio_balance_series(
+                self.start, date(2021, 10, 31), freq='M')
+        finally:
+            rates.set_rate_engine(previous_engine)
+        self.assertEqual(dates.dtype, 'datetime64[D]')
+        self.assertEqual(dates[0].item(), self.start)
+        self.assertEqual(len(balances), 31)
+        self.assertEqual(balances[0], 0)
+        for day, balance in zip(business_days, expected):
+            self.assertAlmostEqual(balances[(day - self.start).days], balance,
+                                   places=6)
+        self.assertEqual(monthly_dates.tolist(), [date(2021, 8, 31),
+                                                  date(2021, 9, 30),
+                                                  date(2021, 10, 31)])
+
+    def test_series_reuse_table(self):
+        """ Repeated series reuse the table prefetched by the first one """
+
+        previous_engine = rates.get_rate_engine()
+        rates.set_rate_engine(self.engine)
+        portfolio = Portfolio(name='Series', description='Series',
+                              currency='GBP')
+        item = portfolio.add_item(
+            category='asset', subcategory='stock', currency='USD',
+            name='stock USD', description='Stock')
+        item.purchase(when=self.start, units_purchased=10, unit_price=100.0,
+                      fees=1.0)
+        try:
+            with mock.patch.object(self.engine, 'prefetch',
+                                   wraps=self.engine.prefetch) as prefetch:
+                for _ in range(20):
+                    portfolio.get_portfolio_balance_series(self.start,
+                                                           self.end)
+                portfolio.get_portfolio_balance_series(
+                    self.start + timedelta(days=7), self.end, freq='W')
+        finally:
+            rates.set_rate_engine(previous_engine)
+        prefetch.assert_called_once()
+        self.assertEqual(len(self.engine.tables), 1)
+        self.assertTrue(self.engine.tables[0].complete(
+            self.start, self.end, ('EUR', 'USD', 'GBP')))
+        self.assertIsNone(self.engine.find_table(self.start, date(2021, 9, 5)))
+
+
+class FailingProvider(RateProvider):
+    """ Provider of a dead rate service """
+
+    def fetch(self, given_date, pivot, wanted):
+        raise ConnectionError("rate service is down")
+
+
+class TestProviders(unittest.TestCase):
+
+    """ Class to test rate providers and the stand-in rate server """
+
+    def setUp(self):
+        """ Serve the recorded rates fixture from a local server """
+
+        self.recorded = RecordedRateProvider('./tests/fixtures_rates.json')
+        self.server = serve_rates(self.recorded)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_recorded(self):
+        """ Recorded rates can be rebased to another pivot """
+
+        vector = self.recorded.fetch(date(2021, 8, 26), 'USD', ('EUR', 'GBP'))
+        self.assertAlmostEqual(vector['EUR'], 1 / 1.1767)
+        self.assertAlmostEqual(vector['GBP'], 0.8573 / 1.1767)
+        self.assertEqual(self.recorded.fetch(date(2021, 8, 28), 'EUR',
+                                             ('USD',)), {})
+
+    def test_http(self):
+        """ The HTTP provider gets the recorded rates from the server """
+
+        provider = HttpRateProvider(self.url, timeout=5)
+        day = date(2021, 8, 26)
+        self.assertEqual(provider.fetch(day, 'EUR', ('USD', 'BTC')),
+                         self.recorded.fetch(day, 'EUR', ('USD', 'BTC')))
+        self.assertEqual(provider.fetch(date(2021, 8, 28), 'EUR', ('USD',)),
+                         {})
+
+        days = [date(2021, 8, 26), date(2021, 8, 27), date(2021, 8, 28)]
+        vectors = provider.fetch_range(days, 'EUR', ('USD', 'GBP'))
+        self.assertEqual(sorted(vectors), days[:2])
+        self.assertEqual(provider.requests, 3)
+
+    def test_serve_any_provider(self):
+        """ The server serves providers other than recorded rates """
+
+        drifting = DriftingProvider({'USD': 1.1767, 'GBP': 0.8562})
+        server = serve_rates(drifting)
+        try:
+            provider = HttpRateProvider(
+                f"http://127.0.0.1:{server.server_port}", timeout=5)
+            day = date(2021, 8, 26)
+            self.assertEqual(provider.fetch(day, 'EUR', ('USD',)),
+                             drifting.fetch(day, 'EUR', ('USD',)))
+            # no symbols: every supported currency the provider has
+            self.assertEqual(provider._get_json(day.isoformat(),
+                                                {'base': 'EUR'})['rates'],
+                             drifting.fetch(day, 'EUR', ('USD', 'GBP')))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    def test_fallback(self):
+        """ A failing or slow provider falls back to the next one """
+
+        day = date(2021, 8, 27)
+        partial = RecordedRateProvider(rates={day.isoformat(): {'USD': 1.2}})
+        chain = FallbackProvider([FailingProvider(), partial, self.recorded])
+        vector = chain.fetch(day, 'EUR', ('USD', 'GBP'))
+        self.assertEqual(vector, {'USD': 1.2, 'GBP': 0.8571})
+
+        slow = HttpRateProvider('http://10.255.255.1', timeout=0.2)
+        chain = FallbackProvider([slow, self.recorded])
+        tic = time.perf_counter()
+        vectors = chain.fetch_range([day], 'EUR', ('USD',))
+        self.assertLess(time.perf_counter() - tic, 2)
+        self.assertEqual(vectors, {day: {'USD': 1.1794}})
+
+    def test_forex_python_timeout(self):
+        """ forex-python services are called with the provider timeout """
+
+        day = date(2021, 8, 27)
+        forex = mock.Mock(status_code=200)
+        forex.json.return_value = {'rates': {'USD': 1.1794, 'GBP': 0.8571}}
+        btc = mock.Mock(status_code=200)
+        btc.json.return_value = {'bpi': {'2021-08-27': 40000.0}}
+        with mock.patch('requests.get', side_effect=lambda url, **_:
+                        btc if 'coindesk' in url else forex) as get:
+            vector = ForexPythonProvider(timeout=0.5).fetch(
+                day, 'EUR', ('USD', 'BTC'))
+        self.assertEqual(vector, {'USD': 1.1794, 'BTC': 1 / 40000.0})
+        self.assertEqual([call.kwargs['timeout'] for call in get.mock_calls],
+                         [0.5, 0.5])
+        self.assertEqual(providers._executor._max_workers,
+                         providers.MAX_WORKERS)
+
+
+if __name__ == '__main__':
+    unittest.main()
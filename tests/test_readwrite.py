@@ -0,0 +1,546 @@
+#!/usr/bin/env python3
+
+# tests/test_readwrite.py
+
+""" Tests for reading and saving Portfolio files """
+
+import io
+import os
+import json
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from datetime import date, timedelta
+
+from src import snapshots
+from src.jsonstream import JsonStream
+from src.snapshots import SnapshotCache
+from src.utils import Portfolio, Item
+from src.readwrite import portfolio_from_dict, dict_from_portfolio, \
+    read_portfolio_from_file, save_portfolio_to_file, deserialize_date, \
+    serialize_date, portfolio_from_stream, convert_portfolio_file, \
+    LEDGER_BATCH, Journal, JOURNAL_SUFFIX
+
+
+class CountingReader(io.StringIO):
+    """ StringIO that counts the characters read """
+
+    def __init__(self, text):
+        super().__init__(text)
+        self.chars_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.chars_read += len(chunk)
+        return chunk
+
+
+def large_portfolio_dict(transactions: int):
+    """ Portfolio with a stock bought 50 times a day """
+
+    start = date(1940, 1, 1)
+    return {
+        'name': 'Large', 'description': 'Large', 'currency': 'EUR',
+        'item_list': [{
+            'category': 'asset', 'subcategory': 'stock', 'currency': 'EUR',
+            'name': 'Stock', 'description': 'Stock',
+            'ledger': [['purchase', {'when': start + timedelta(days=i // 50),
+                                     'units_purchased': 1,
+                                     'unit_price': 10.0 + i % 7,
+                                     'fees': 0.5}]
+                       for i in range(transactions)]}]}
+
+
+def without_unique_ids(portfolio_dict: dict):
+    """ Portfolio dict without the unique_id minted for each Item """
+
+    for item_dict in portfolio_dict['item_list']:
+        item_dict.pop('unique_id')
+    return portfolio_dict
+
+
+class TestJsonStream(unittest.TestCase):
+
+    """ Class to test the incremental JSON parser """
+
+    def test_walk(self):
+        """ Walking containers in small chunks gives the decoded values """
+
+        data = {'a': [1, 22.5, 'x y', {'b': None}], 'c': {'d': [True, []]},
+                'e': {}, 'when': {'_isoformat': '2021-03-01'}}
+        stream = JsonStream(io.StringIO(json.dumps(data, indent=2)),
+                            object_hook=deserialize_date, chunk_size=3)
+        decoded = {}
+        for key in stream.object_items():
+            if key == 'a':
+                decoded[key] = [stream.value() for _ in stream.array_items()]
+            else:
+                decoded[key] = stream.value()
+        expected = json.loads(json.dumps(data), object_hook=deserialize_date)
+        self.assertEqual(decoded, expected)
+        self.assertEqual(decoded['when'], date(2021, 3, 1))
+
+    def test_skip(self):
+        """ Skipped values leave the stream at the next one, in bytes too """
+
+        data = [{'a': ['] } "', {'b': 'x\\"]'}], 'ñ': [[]]}, 'señal', 3,
+                [{'c': 'ü' * 50}, ['{'] * 20]]
+        text = json.dumps(data, ensure_ascii=False)
+        for chunk_size in (1, 7, 1 << 16):
+            stream = JsonStream(io.StringIO(text), chunk_size=chunk_size)
+            offsets = []
+            for _ in stream.array_items():
+                offsets.append(stream.offset())
+                stream.skip()
+            encoded = text.encode('utf-8')
+            values = [json.loads(encoded[start:end].decode('utf-8')
+                                 .rstrip(', ]'))
+                      for start, end in zip(offsets, offsets[1:])]
+            self.assertEqual(values, data[:-1])
+
+    def test_truncated(self):
+        """ A truncated file raises JSONDecodeError """
+
+        stream = JsonStream(io.StringIO('{"a": [1, 2'), chunk_size=4)
+        with self.assertRaises(json.JSONDecodeError):
+            for key in stream.object_items():
+                for _ in stream.array_items():
+                    stream.value()
+
+
+class TestStreamingLoad(unittest.TestCase):
+
+    """ Class to test that Portfolio files are read as a stream """
+
+    def test_fixtures(self):
+        """ Streamed fixtures match the fixtures loaded whole """
+
+        with open('./tests/fixtures.json') as json_file:
+            expected = dict_from_portfolio(portfolio_from_dict(
+                json.load(json_file, object_hook=deserialize_date)))
+        portfolio = read_portfolio_from_file('./tests/fixtures.json')
+        # fixtures.json predates unique_id, so every read mints new ones
+        self.assertEqual(without_unique_ids(dict_from_portfolio(portfolio)),
+                         without_unique_ids(expected))
+
+    def test_save_and_read(self):
+        """ Saved files put the ledger last and read back the same """
+
+        portfolio = portfolio_from_dict(large_portfolio_dict(50))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'large.json')
+            self.assertTrue(save_portfolio_to_file(portfolio, path))
+            with open(path) as json_file:
+                saved = json.load(json_file)
+            read_back = read_portfolio_from_file(path)
+        self.assertEqual(list(saved)[-1], 'item_list')
+        self.assertEqual(list(saved['item_list'][0])[-1], 'ledger')
+        self.assertEqual(dict_from_portfolio(read_back),
+                         dict_from_portfolio(portfolio))
+
+    def test_incremental(self):
+        """ Transactions are loaded in batches before the file is read """
+
+        text = json.dumps(large_portfolio_dict(3 * LEDGER_BATCH),
+                          default=serialize_date)
+        reader = CountingReader(text)
+        chars_read = []
+        load_ledger = Item.load_ledger
+
+        def counting_load_ledger(item, transactions):
+            chars_read.append(reader.chars_read)
+            return load_ledger(item, transactions)
+
+        with mock.patch.object(Item, 'load_ledger', autospec=True,
+                               side_effect=counting_load_ledger):
+            portfolio = portfolio_from_stream(reader)
+        self.assertLess(chars_read[0], len(text) / 2)
+        self.assertEqual(len(portfolio.item_list[0].history),
+                         3 * LEDGER_BATCH)
+
+    def test_sorted_keys(self):
+        """ Ledgers saved before the attributes are streamed too """
+
+        portfolio_dict = large_portfolio_dict(3 * LEDGER_BATCH)
+        portfolio_dict['item_list'][0]['description'] = 'Stock €'
+        batches = []
+        load_ledger = Item.load_ledger
+
+        def counting_load_ledger(item, transactions):
+            batches.append(len(transactions))
+            return load_ledger(item, transactions)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'sorted.json')
+            with open(path, 'w', encoding='utf-8') as json_file:
+                json.dump(portfolio_dict, json_file, default=serialize_date,
+                          sort_keys=True, ensure_ascii=False)
+            with mock.patch.object(Item, 'load_ledger', autospec=True,
+                                   side_effect=counting_load_ledger):
+                portfolio = read_portfolio_from_file(path, snapshots=False)
+        self.assertLessEqual(max(batches), LEDGER_BATCH)
+        self.assertEqual(portfolio.item_list[0].description, 'Stock €')
+        self.assertEqual(len(portfolio.item_list[0].history),
+                         3 * LEDGER_BATCH)
+        self.assertEqual(dict_from_portfolio(portfolio)['item_list'][0]
+                         ['ledger'][-1][1]['unit_price'], 10.0 + 29999 % 7)
+
+
+class TestLazyLoad(unittest.TestCase):
+
+    """ Class to test stub Items that load their ledger when first used """
+
+    def setUp(self):
+        """ A large Portfolio and the fixtures saved in both formats """
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.paths = []
+        for name, portfolio in (
+                ('large', portfolio_from_dict(large_portfolio_dict(500))),
+                ('fixtures', read_portfolio_from_file(
+                    './tests/fixtures.json'))):
+            for extension in ('.json', '.npz'):
+                path = os.path.join(self.tmp_dir.name, name + extension)
+                save_portfolio_to_file(portfolio, path)
+                self.paths.append(path)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_stubs(self):
+        """ Ledgers are not loaded until an Item is used """
+
+        for path in self.paths:
+            with mock.patch.object(Item, 'load_ledger') as load_ledger:
+                portfolio = read_portfolio_from_file(path, lazy=True)
+            load_ledger.assert_not_called()
+            item, *others = portfolio.item_list
+            self.assertFalse(item.hydrated)
+            self.assertIsNotNone(item.get_hist_pt_by_date(date(2021, 5, 3)))
+            self.assertTrue(item.hydrated)
+            self.assertFalse(any(other.hydrated for other in others))
+
+    def test_hydrate_apart(self):
+        """ A stub Item hydrates while another one is reading its file """
+
+        portfolio = Portfolio(name='Stubs', description='', currency='EUR')
+        slow, fast = [portfolio.add_item(
+            category='asset', subcategory='stock', currency='EUR',
+            name=name, description='') for name in ('Slow', 'Fast')]
+        reading, done = threading.Event(), threading.Event()
+
+        def slow_loader():
+            reading.set()
+            done.wait(5)  # as a large ledger would
+            return []
+
+        slow.defer_ledger(slow_loader)
+        fast.defer_ledger(list)
+        thread = threading.Thread(target=slow.hydrate, daemon=True)
+        thread.start()
+        reading.wait(5)
+        fast.hydrate()
+        self.assertTrue(fast.hydrated)
+        self.assertFalse(slow.hydrated)
+        done.set()
+        thread.join(5)
+        self.assertTrue(slow.hydrated)
+
+    def test_same_as_eager(self):
+        """ Lazy and eager Portfolios have the same Items and balances """
+
+        for path in self.paths:
+            eager = read_portfolio_from_file(path)
+            lazy = read_portfolio_from_file(path, lazy=True)
+            self.assertEqual(lazy.get_portfolio_balance(date(2021, 5, 13)),
+                             eager.get_portfolio_balance(date(2021, 5, 13)))
+            self.assertEqual(dict_from_portfolio(lazy),
+                             dict_from_portfolio(eager))
+
+    def test_purchase(self):
+        """ A purchase on a stub Item keeps the ledger read from file """
+
+        lazy = read_portfolio_from_file(self.paths[0], lazy=True)
+        item = lazy.item_list[0]
+        self.assertTrue(item.purchase(date(2021, 5, 3), 1, 10.0, 0.5))
+        self.assertEqual(len(item.ledger), 501)
+
+
+class TestNpzFormat(unittest.TestCase):
+
+    """ Class to test the columnar .npz Portfolio files """
+
+    def setUp(self):
+        """ Fixtures Portfolio with closing prices, and a temporary folder """
+
+        self.portfolio = read_portfolio_from_file('./tests/fixtures.json')
+        amazon_stock, = self.portfolio.get_items(name='Amazon')
+        amazon_stock.feed_prices([date(2021, 5, 14), date(2021, 5, 17)],
+                                 [3200.5, 3250.0])
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def as_json(self, portfolio):
+        """ Portfolio as JSON text, to compare """
+
+        return json.dumps(dict_from_portfolio(portfolio),
+                          default=serialize_date, sort_keys=True)
+
+    def test_round_trip(self):
+        """ Saved to .npz and read back the Portfolio is the same """
+
+        path = os.path.join(self.tmp_dir.name, 'portfolio.npz')
+        self.assertTrue(save_portfolio_to_file(self.portfolio, path))
+        read_back = read_portfolio_from_file(path)
+        self.assertEqual(self.as_json(read_back), self.as_json(self.portfolio))
+        self.assertEqual(read_back.get_portfolio_balance(date(2021, 5, 13)),
+                         self.portfolio.get_portfolio_balance(
+                             date(2021, 5, 13)))
+
+    def test_convert(self):
+        """ Format is detected by content and converted both ways """
+
+        json_path = os.path.join(self.tmp_dir.name, 'portfolio.json')
+        npz_path = os.path.join(self.tmp_dir.name, 'portfolio.npz')
+        renamed_path = os.path.join(self.tmp_dir.name, 'portfolio.data')
+        save_portfolio_to_file(self.portfolio, json_path)
+        self.assertTrue(convert_portfolio_file(json_path, npz_path))
+        os.rename(npz_path, renamed_path)
+        self.assertTrue(convert_portfolio_file(renamed_path, json_path))
+        self.assertEqual(self.as_json(read_portfolio_from_file(json_path)),
+                         self.as_json(self.portfolio))
+
+    def test_size(self):
+        """ A large ledger takes a fraction of its JSON size """
+
+        portfolio = portfolio_from_dict(large_portfolio_dict(10000))
+        json_path = os.path.join(self.tmp_dir.name, 'large.json')
+        npz_path = os.path.join(self.tmp_dir.name, 'large.npz')
+        save_portfolio_to_file(portfolio, json_path)
+        save_portfolio_to_file(portfolio, npz_path)
+        self.assertLess(10 * os.path.getsize(npz_path),
+                        os.path.getsize(json_path))
+
+
+class TestJournal(unittest.TestCase):
+
+    """ Class to test saving changes to the journal of a Portfolio file """
+
+    def setUp(self):
+        """ Fixtures saved to a temporary folder and opened journaled """
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'portfolio.json')
+        save_portfolio_to_file(
+            read_portfolio_from_file('./tests/fixtures.json'), self.path)
+        self.portfolio = read_portfolio_from_file(self.path, journaled=True)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def as_json(self, portfolio):
+        """ Portfolio as JSON text, to compare """
+
+        return json.dumps(dict_from_portfolio(portfolio),
+                          default=serialize_date)
+
+    def make_changes(self):
+        """ One change of each kind """
+
+        amazon_stock, = self.portfolio.get_items(name='Amazon')
+        amazon_stock.purchase(date(2021, 5, 14), 2, 3200.5, 1.0)
+        amazon_stock.feed_prices([date(2021, 5, 14)], [3210.0])
+        amazon_stock.edit(description='Amazon shares')
+        new_item = self.portfolio.add_item(
+            category='asset', subcategory='stock', currency='USD',
+            name='Apple', description='Apple shares')
+        new_item.purchase(date(2021, 5, 3), 10, 130.0, 1.5)
+        self.portfolio.remove_item(self.portfolio.get_items(name='Bitcoin')[0])
+        self.portfolio.edit(name='Renamed', currency='USD')
+
+    def test_save_appends(self):
+        """ Saving a journaled Portfolio leaves its file untouched """
+
+        with open(self.path) as json_file:
+            before = json_file.read()
+        self.make_changes()
+        self.assertTrue(save_portfolio_to_file(self.portfolio))
+        with open(self.path) as json_file:
+            self.assertEqual(json_file.read(), before)
+        with open(self.path + JOURNAL_SUFFIX) as journal_file:
+            entries = [json.loads(line) for line in journal_file]
+        self.assertEqual([entry['seq'] for entry in entries],
+                         list(range(1, len(entries) + 1)))
+        self.assertEqual(entries[-1]['op'], 'edit_portfolio')
+
+    def test_replay(self):
+        """ Reopened, the file and its journal give the edited Portfolio """
+
+        self.make_changes()
+        read_back = read_portfolio_from_file(self.path)
+        self.assertEqual(self.as_json(read_back),
+                         self.as_json(self.portfolio))
+
+    def test_compaction(self):
+        """ A long journal is folded into the file when saved """
+
+        self.make_changes()
+        with mock.patch.object(Journal, 'COMPACT_AFTER', 5):
+            self.assertTrue(save_portfolio_to_file(self.portfolio))
+        self.assertEqual(os.path.getsize(self.path + JOURNAL_SUFFIX), 0)
+        self.assertEqual(read_portfolio_from_file(self.path).journal_seq,
+                         self.portfolio.journal.seq)
+        self.assertEqual(
+            self.as_json(read_portfolio_from_file(self.path)),
+            self.as_json(self.portfolio))
+
+    def test_discard(self):
+        """ Discarded changes are not replayed """
+
+        before = self.as_json(read_portfolio_from_file(self.path))
+        self.make_changes()
+        self.portfolio.journal.discard()
+        self.assertEqual(self.portfolio.journal.entries, 0)
+        self.assertEqual(self.as_json(read_portfolio_from_file(self.path)),
+                         before)
+
+    def test_fallback_not_journaled(self):
+        """ The fixtures read when no file is chosen are never journaled """
+
+        dialog = mock.Mock()
+        dialog.askopenfilename.return_value = ''
+        with mock.patch('src.readwrite.open_file_dialog',
+                        return_value=dialog):
+            portfolio = read_portfolio_from_file(journaled=True)
+        self.assertIsNone(getattr(portfolio, 'journal', None))
+
+    def test_crash_safety(self):
+        """ Entries folded into the file and a torn last line are skipped """
+
+        self.make_changes()
+        with open(self.path + JOURNAL_SUFFIX) as journal_file:
+            journal = journal_file.read()
+        with mock.patch.object(Journal, 'COMPACT_AFTER', 0):
+            save_portfolio_to_file(self.portfolio)
+        # as if the journal was not emptied after compaction
+        with open(self.path + JOURNAL_SUFFIX, 'w') as journal_file:
+            journal_file.write(journal + '{"seq": 99, "op": "led')
+        read_back = read_portfolio_from_file(self.path)
+        self.assertEqual(self.as_json(read_back),
+                         self.as_json(self.portfolio))
+
+
+class TestSnapshotCache(unittest.TestCase):
+
+    """ Class to test reopening unchanged files from snapshots """
+
+    def setUp(self):
+        """ Snapshot cache and fixtures in a temporary folder """
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'portfolio.json')
+        save_portfolio_to_file(
+            read_portfolio_from_file('./tests/fixtures.json'), self.path)
+        self.snapshot_cache = snapshots.set_snapshot_cache(SnapshotCache(
+            os.path.join(self.tmp_dir.name, 'snapshots')))
+
+    def tearDown(self):
+        snapshots.set_snapshot_cache(None)
+        self.tmp_dir.cleanup()
+
+    def as_json(self, portfolio):
+        """ Portfolio as JSON text, to compare """
+
+        return json.dumps(dict_from_portfolio(portfolio),
+                          default=serialize_date)
+
+    def test_reopen(self):
+        """ An unchanged file is loaded from its snapshot, not replayed """
+
+        portfolio = read_portfolio_from_file(self.path)
+        with mock.patch.object(Item, 'load_ledger') as load_ledger:
+            reopened = read_portfolio_from_file(self.path)
+        load_ledger.assert_not_called()
+        self.assertEqual((self.snapshot_cache.hits,
+                          self.snapshot_cache.misses), (1, 1))
+        self.assertEqual(self.as_json(reopened), self.as_json(portfolio))
+        self.assertEqual(reopened.get_portfolio_balance(date(2021, 5, 13)),
+                         portfolio.get_portfolio_balance(date(2021, 5, 13)))
+
+    def test_changed_file(self):
+        """ Changed content or schema miss the snapshot """
+
+        portfolio = read_portfolio_from_file(self.path)
+        amazon_stock, = portfolio.get_items(name='Amazon')
+        amazon_stock.purchase(date(2021, 5, 14), 2, 3200.5, 1.0)
+        save_portfolio_to_file(portfolio, self.path)
+        self.assertEqual(self.as_json(read_portfolio_from_file(self.path)),
+                         self.as_json(portfolio))
+        with mock.patch.object(snapshots, 'SNAPSHOT_SCHEMA', 0):
+            read_portfolio_from_file(self.path)
+        self.assertEqual((self.snapshot_cache.hits,
+                          self.snapshot_cache.misses), (0, 3))
+
+    def test_journal(self):
+        """ The journal is replayed on top of the snapshot of the file """
+
+        portfolio = read_portfolio_from_file(self.path, journaled=True)
+        portfolio.edit(name='Renamed')
+        self.assertEqual(read_portfolio_from_file(self.path).name, 'Renamed')
+        self.assertEqual(self.snapshot_cache.hits, 1)
+
+    def test_unreadable(self):
+        """ A corrupt snapshot is discarded and rebuilt """
+
+        key = self.snapshot_cache.key(self.path)
+        os.makedirs(self.snapshot_cache.path)
+        with open(os.path.join(self.snapshot_cache.path,
+                               key + snapshots.SUFFIX), 'wb') as broken:
+            broken.write(b'not a pickle')
+        with self.assertLogs(level='WARNING'):
+            read_portfolio_from_file(self.path)
+        self.assertIsNotNone(self.snapshot_cache.get(key))
+
+    def test_eviction(self):
+        """ Snapshots go by age, then least recently used first by size """
+
+        portfolio = read_portfolio_from_file(self.path)
+        self.snapshot_cache.max_age = float('inf')
+        for key in ('a', 'b', 'c'):
+            self.snapshot_cache.put(key, portfolio)
+            os.utime(self.snapshot_cache._snapshot_path(key),
+                     (0, {'a': 100, 'b': 300, 'c': 200}[key]))
+        size = os.path.getsize(self.snapshot_cache._snapshot_path('a'))
+        self.snapshot_cache.max_bytes = 2 * size
+        self.snapshot_cache.evict(now=400)
+        self.assertIsNone(self.snapshot_cache.get('a'))
+        self.snapshot_cache.max_age = 150
+        self.snapshot_cache.evict(now=400)
+        self.assertIsNone(self.snapshot_cache.get('c'))
+        self.assertIsNotNone(self.snapshot_cache.get('b'))
+
+    def test_evicted_meanwhile(self):
+        """ Snapshots another process evicts meanwhile are not errors """
+
+        portfolio = read_portfolio_from_file(self.path)
+        self.snapshot_cache.put('a', portfolio)
+        with mock.patch('os.utime', side_effect=FileNotFoundError):
+            self.assertIsNotNone(self.snapshot_cache.get('a'))
+        scandir = os.scandir
+
+        def evicting_scandir(path):
+            # another process removes the snapshots once listed
+            entries = list(scandir(path))
+            for entry in entries:
+                os.remove(entry.path)
+            return iter(entries)
+
+        with mock.patch('os.scandir', side_effect=evicting_scandir):
+            self.assertTrue(self.snapshot_cache.put('b', portfolio))
+
+
+if __name__ == '__main__':
+    unittest.main()
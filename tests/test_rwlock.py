@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+# tests/test_rwlock.py
+
+""" Tests for the reader/writer lock of concurrent Portfolios """
+
+import pickle
+import threading
+import unittest
+
+from src.rwlock import ReadWriteLock
+
+
+def start(function):
+    """ Run function in a new thread, returns the thread """
+
+    thread = threading.Thread(target=function, daemon=True)
+    thread.start()
+    return thread
+
+
+class TestReadWriteLock(unittest.TestCase):
+
+    """ Class to test ReadWriteLock """
+
+    def setUp(self):
+        self.lock = ReadWriteLock()
+
+    def test_readers_share(self):
+        """ Readers hold the lock at the same time """
+
+        together = threading.Barrier(3, timeout=5)
+
+        def read():
+            with self.lock.reading():
+                together.wait()
+
+        threads = [start(read) for _ in range(3)]
+        for thread in threads:
+            thread.join(5)
+        self.assertFalse(together.broken)
+
+    def test_writer_excludes(self):
+        """ A reader waits for the writer to finish """
+
+        entered = threading.Event()
+
+        def read():
+            with self.lock.reading():
+                entered.set()
+
+        with self.lock.writing():
+            thread = start(read)
+            self.assertFalse(entered.wait(0.1))
+        self.assertTrue(entered.wait(5))
+        thread.join(5)
+
+    def test_writers_first(self):
+        """ Once a writer waits, new readers wait for it """
+
+        order = []
+        writer_waiting = threading.Event()
+
+        def write():
+            writer_waiting.set()
+            with self.lock.writing():
+                order.append('writer')
+
+        def read():
+            with self.lock.reading():
+                order.append('reader')
+
+        with self.lock.reading():
+            writer = start(write)
+            writer_waiting.wait(5)
+            while not self.lock._writers_waiting:
+                pass
+            reader = start(read)
+            self.assertEqual(order, [])
+        writer.join(5)
+        reader.join(5)
+        self.assertEqual(order, ['writer', 'reader'])
+
+    def test_reentrant(self):
+        """ A thread nests reads and writes, but cannot upgrade a read """
+
+        with self.lock.writing():
+            with self.lock.reading():
+                with self.lock.writing():
+                    pass
+        with self.lock.reading():
+            with self.lock.reading():
+                with self.assertRaises(RuntimeError):
+                    self.lock.acquire_write()
+        # released in full: another thread can write
+        thread = start(lambda: (self.lock.acquire_write(),
+                                 self.lock.release_write()))
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+
+    def test_pickle(self):
+        """ A pickled lock comes back released """
+
+        with self.lock.writing():
+            copy = pickle.loads(pickle.dumps(self.lock))
+        self.assertIsInstance(copy, ReadWriteLock)
+        self.assertIsNone(copy._writer)
+
+
+if __name__ == '__main__':
+    unittest.main()
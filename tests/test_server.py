@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+# tests/test_server.py
+
+""" Tests for the JSON HTTP API serving Portfolio valuations """
+
+import json
+import time
+import asyncio
+import unittest
+from unittest import mock
+from datetime import date
+
+from src import rates
+from src.utils import Portfolio
+from src.server import PortfolioServer
+from src.rates import RateEngine, RateCache, RateNotAvailableError
+from src.providers import RecordedRateProvider
+from src.readwrite import read_portfolio_from_file
+
+
+async def get(port: int, target: str, connection=None):
+    """ GET a target, returns (status, decoded JSON body) """
+
+    reader, writer = connection or await asyncio.open_connection(
+        '127.0.0.1', port)
+    writer.write(f"GET {target} HTTP/1.1\r\nHost: test\r\n\r\n".encode())
+    await writer.drain()
+    head = (await reader.readuntil(b'\r\n\r\n')).decode('latin-1')
+    status = int(head.split(' ')[1])
+    length = int(head.lower().split('content-length:')[1].split('\r\n')[0])
+    body = json.loads(await reader.readexactly(length))
+    if connection is None:
+        writer.close()
+    return status, body
+
+
+class TestServer(unittest.IsolatedAsyncioTestCase):
+
+    """ Class to test the valuation server """
+
+    async def asyncSetUp(self):
+        """ Fixtures Portfolio served on a free port """
+
+        self.portfolio = read_portfolio_from_file('./tests/fixtures.json')
+        self.portfolio_server = PortfolioServer({'fixtures': self.portfolio})
+        self.server = await self.portfolio_server.start()
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.server.close()
+        await self.server.wait_closed()
+        self.portfolio_server.close()
+
+    async def test_portfolios(self):
+        """ Loaded Portfolios are listed """
+
+        status, body = await get(self.port, '/portfolios')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, [{'id': 'fixtures',
+                                 'name': self.portfolio.name,
+                                 'currency': 'EUR', 'items': 4}])
+
+    async def test_balance_and_piechart(self):
+        """ Valuations on a date match the Portfolio """
+
+        status, body = await get(
+            self.port, '/portfolios/fixtures/balance?date=2021-05-13')
+        self.assertEqual(status, 200)
+        self.assertEqual(body, {'date': '2021-05-13', 'currency': 'EUR',
+                                'balance': 150000})
+        status, body = await get(
+            self.port, '/portfolios/fixtures/piechart?date=2021-05-13')
+        self.assertEqual(status, 200)
+        self.assertEqual(body['piechart'], self.portfolio.
+                         get_portfolio_piechart(date(2021, 5, 13)))
+
+    async def test_series(self):
+        """ Balance series over a range, also broken down """
+
+        target = '/portfolios/fixtures/series?start=2021-05-11&end=2021-05-13'
+        status, body = await get(self.port, target)
+        self.assertEqual(status, 200)
+        self.assertEqual(body['dates'],
+                         ['2021-05-11', '2021-05-12', '2021-05-13'])
+        self.assertEqual(body['balances'][1:], [150000, 150000])
+        status, body = await get(self.port, target + '&by=subcategory')
+        self.assertEqual(status, 200)
+        self.assertEqual(body['balances']['fund'][1:], [100000, 100000])
+        self.assertEqual(body['balances']['stock'][1:], [50000, 50000])
+
+    async def test_errors(self):
+        """ Bad queries are answered with a status and an error """
+
+        for target, expected in (
+                ('/nothing', 404),
+                ('/portfolios/missing/balance', 404),
+                ('/portfolios/fixtures/balance?date=13/05/2021', 400),
+                ('/portfolios/fixtures/series', 400),
+                ('/portfolios/fixtures/series?start=2021-05-11&by=x', 400)):
+            status, body = await get(self.port, target)
+            self.assertEqual(status, expected, target)
+            self.assertIn('error', body)
+        with mock.patch.object(self.portfolio, 'get_portfolio_balance',
+                               side_effect=RateNotAvailableError('offline')):
+            status, body = await get(self.port,
+                                     '/portfolios/fixtures/balance')
+        self.assertEqual((status, body), (503, {'error': 'offline'}))
+
+    async def test_bad_content_length(self):
+        """ A malformed Content-Length is answered 400 and closed """
+
+        for length in ('abc', '-5'):
+            reader, writer = await asyncio.open_connection('127.0.0.1',
+                                                           self.port)
+            writer.write(f"GET /portfolios HTTP/1.1\r\nHost: test\r\n"
+                         f"Content-Length: {length}\r\n\r\n".encode())
+            await writer.drain()
+            answer = await reader.read()  # until the server closes
+            self.assertTrue(answer.startswith(b'HTTP/1.1 400'), length)
+            self.assertIn(b'Connection: close', answer)
+            writer.close()
+
+    async def test_series_tables(self):
+        """ Repeated series reuse the RateTable of the first one """
+
+        previous_engine = rates.get_rate_engine()
+        engine = rates.set_rate_engine(RateEngine(
+            currencies=Portfolio.CURRENCIES, crypto=Portfolio.CRYPTO,
+            rate_cache=RateCache(path=':memory:'),
+            provider=RecordedRateProvider('./tests/fixtures_rates.json')))
+        try:
+            self.portfolio.currency = 'USD'  # valued with EUR rates
+            target = ('/portfolios/fixtures/series'
+                      '?start=2021-08-26&end=2021-08-27')
+            status, body = await get(self.port, target)
+            self.assertEqual(status, 200)
+            table = engine.tables[0]
+            for _ in range(10):
+                status, body = await get(self.port, target)
+                self.assertEqual(status, 200)
+                # not prefetched again
+                self.assertEqual(engine.tables, [table])
+            self.assertEqual(body['currency'], 'USD')
+        finally:
+            engine.rate_cache.close()
+            rates.set_rate_engine(previous_engine)
+
+    async def test_keep_alive(self):
+        """ Several requests are served over one connection """
+
+        connection = await asyncio.open_connection('127.0.0.1', self.port)
+        for day in ('2021-05-12', '2021-05-13'):
+            status, body = await get(
+                self.port, f'/portfolios/fixtures/balance?date={day}',
+                connection)
+            self.assertEqual((status, body['date']), (200, day))
+        connection[1].close()
+
+    async def test_coalescing(self):
+        """ Identical queries in flight are valued once """
+
+        calls = []
+
+        def slow_balance(given_date):
+            calls.append(given_date)
+            time.sleep(0.1)  # as a remote rate fetch would
+            return 150000
+
+        with mock.patch.object(self.portfolio, 'get_portfolio_balance',
+                               side_effect=slow_balance):
+            results = await asyncio.gather(*[
+                get(self.port, '/portfolios/fixtures/balance?date=2021-05-13')
+                for _ in range(10)])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(self.portfolio_server.coalesced, 9)
+        self.assertEqual({body['balance'] for _, body in results}, {150000})
+        self.assertEqual(self.portfolio_server.pending, {})
+
+    async def test_workers(self):
+        """ Several valuation threads value concurrent Portfolios """
+
+        portfolio_server = PortfolioServer({'fixtures': self.portfolio},
+                                           workers=4)
+        self.assertTrue(self.portfolio.concurrent)
+        server = await portfolio_server.start()
+        port = server.sockets[0].getsockname()[1]
+        results = await asyncio.gather(*[
+            get(port, f'/portfolios/fixtures/balance?date=2021-05-1{day}')
+            for day in range(1, 4) for _ in range(5)])
+        self.assertEqual([body['balance'] for _, body in results],
+                         [self.portfolio.get_portfolio_balance(
+                             date(2021, 5, 10 + day))
+                          for day in range(1, 4) for _ in range(5)])
+        server.close()
+        await server.wait_closed()
+        portfolio_server.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
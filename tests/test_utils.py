@@ -4,10 +4,17 @@
 
 """ Tests for Portfolio class"""
 
+import sys
 import logging
-from unittest import TestCase
+import threading
+from unittest import TestCase, mock
 from datetime import date
 
+from src import rates
+from src.rates import RateCache, RateEngine
+from src.providers import RecordedRateProvider
+from src.utils import Portfolio, Item
+
 
 class TestPortfolio(TestCase):
 
@@ -105,3 +112,274 @@ class TestPortfolio(TestCase):
                      str(balance2))
 
         self.assertAlmostEqual(balance2-balance1, u_price*num_titles, places=4)
+
+    def test_hist_pt_by_date(self):
+        """ History stays sorted when points are added out of order """
+
+        fund = next(item for item in self.my_portfolio.item_list
+                    if item.subcategory == 'fund')
+        fund.update_history(when=date(2021, 1, 15), units_owned=1,
+                            cost_of_purchase=10.0, value_of_asset=10.0)
+        self.assertEqual(fund.history_dates, sorted(fund.history_dates))
+        self.assertEqual([hist_pt.when for hist_pt in fund.history],
+                         fund.history_dates)
+
+        self.assertIsNone(fund.get_hist_pt_by_date(date(2021, 1, 14)))
+        self.assertEqual(fund.get_hist_pt_by_date(date(2021, 1, 31)).when,
+                         date(2021, 1, 15))
+        self.assertEqual(fund.get_hist_pt_by_date(date(2021, 3, 1)).when,
+                         date(2021, 3, 1))
+        self.assertIsNone(fund.get_hist_pt_by_date(
+            date(2021, 3, 2), force_exact_match=True))
+
+    def test_backdated_purchase(self):
+        """ A back-dated purchase updates every later HistoryPoint """
+
+        amazon_stock = next(item for item in self.my_portfolio.item_list
+                            if item.name == "Amazon")
+        amazon_stock.purchase(when=date(2021, 3, 1), units_purchased=2,
+                              unit_price=4000.0, fees=10.0)
+
+        first, last = amazon_stock.history
+        self.assertEqual(first.when, date(2021, 3, 1))
+        self.assertEqual((first.units_owned, first.cost_of_purchase,
+                          first.value_of_asset), (2, 8010.0, 8000.0))
+        self.assertEqual((last.units_owned, last.cost_of_purchase,
+                          last.value_of_asset), (12, 58010.0, 58000.0))
+
+        self.assertAlmostEqual(self.my_portfolio.get_portfolio_balance(
+            given_date=date(2021, 5, 13)), 158000.00, places=4)
+
+        fund = next(item for item in self.my_portfolio.item_list
+                    if item.subcategory == 'fund')
+        fund.purchase(when=date(2021, 1, 4), units_purchased=1,
+                      unit_price=1000.0, fees=0.0)
+        self.assertEqual([(hist_pt.units_owned, hist_pt.value_of_asset)
+                          for hist_pt in fund.history],
+                         [(1, 1000.0), (1, 51000.0), (1, 81000.0),
+                          (1, 101000.0)])
+
+    def test_regroup(self):
+        """ Editing the subcategory of an Item regroups memoized piecharts """
+
+        dat = date(2021, 5, 13)
+        piechart = self.my_portfolio.get_portfolio_piechart(dat)
+        self.assertIn('fund', piechart)
+        fund = self.my_portfolio.get_items(subcategory='fund')[0]
+        fund.subcategory = 'stock'
+        piechart = self.my_portfolio.get_portfolio_piechart(dat)
+        self.assertNotIn('fund', piechart)
+        self.assertEqual(piechart['stock'], 100.0)
+
+    def test_indexes(self):
+        """ Items are found and removed through the Portfolio indexes """
+
+        amazon_stock, = self.my_portfolio.get_items(name='Amazon')
+        self.assertIs(self.my_portfolio.get_item(amazon_stock.unique_id),
+                      amazon_stock)
+        self.assertEqual(len(self.my_portfolio.get_items(currency='EUR')), 3)
+        self.assertEqual(self.my_portfolio.get_items(
+            subcategory='stock', currency='EUR'), [amazon_stock])
+        self.assertEqual(self.my_portfolio.get_items(
+            subcategory='stock', currency='BTC'), [])
+        with self.assertRaises(ValueError):
+            self.my_portfolio.get_items(description='Amazon')
+
+        # editing an Item moves it in the indexes
+        amazon_stock.name = 'AMZN'
+        self.assertEqual(self.my_portfolio.get_items(name='Amazon'), [])
+        self.assertEqual(self.my_portfolio.get_items(name='AMZN'),
+                         [amazon_stock])
+
+        dat = date(2021, 5, 13)
+        self.assertAlmostEqual(self.my_portfolio.get_items_balance(
+            dat, subcategory='stock'), 50000.00, places=4)
+
+        self.assertTrue(self.my_portfolio.remove_item(amazon_stock))
+        self.assertIsNone(self.my_portfolio.get_item(amazon_stock.unique_id))
+        self.assertEqual(self.my_portfolio.get_items(subcategory='stock'), [])
+        self.assertEqual(len(self.my_portfolio.item_list), 3)
+        self.assertAlmostEqual(self.my_portfolio.get_portfolio_balance(dat),
+                               100000.00, places=4)
+
+
+class TestMultiCurrencyPortfolio(TestCase):
+
+    """ Class to test valuation of a Portfolio in several currencies """
+
+    def setUp(self):
+        """ Create a Portfolio of 200 items in 5 currencies """
+
+        self.provider = RecordedRateProvider('./tests/fixtures_rates.json')
+        self.previous_engine = rates.get_rate_engine()
+        self.engine = rates.set_rate_engine(RateEngine(
+            currencies=Portfolio.CURRENCIES, crypto=Portfolio.CRYPTO,
+            rate_cache=RateCache(path=':memory:'), provider=self.provider))
+
+        self.my_portfolio = Portfolio(name='Multi', description='Multi',
+                                      currency='EUR')
+        currencies = Portfolio.CURRENCIES + Portfolio.CRYPTO
+        for i in range(200):
+            item = self.my_portfolio.add_item(
+                category='asset', subcategory='account',
+                currency=currencies[i % len(currencies)],
+                name=f"account{i:03}", description='Account')
+            item.purchase(when=date(2021, 8, 2), units_purchased=1,
+                          unit_price=100.0, fees=0.0)
+
+    def tearDown(self):
+        self.engine.rate_cache.close()
+        rates.set_rate_engine(self.previous_engine)
+
+    def test_balance(self):
+        """ Valuation on one date needs a single base vector """
+
+        dat = date(2021, 8, 26)
+        balance = self.my_portfolio.get_portfolio_balance(given_date=dat)
+        self.assertEqual(self.engine.fetches, 1)
+
+        vector = self.provider.fetch(dat, 'EUR', ('USD', 'GBP', 'PLN', 'BTC'))
+        expected = 40 * 100.0 * (1 + sum(1 / rate for rate in vector.values()))
+        self.assertAlmostEqual(balance, expected, places=4)
+
+        piechart = self.my_portfolio.get_portfolio_piechart(given_date=dat)
+        self.assertAlmostEqual(piechart['account'], 100.0, places=4)
+
+    def test_valuation_memo(self):
+        """ Repeated valuations are memoized until an Item changes """
+
+        dat = date(2021, 8, 26)
+        balance = self.my_portfolio.get_portfolio_balance(given_date=dat)
+        with mock.patch.object(Item, 'get_hist_pt_by_date',
+                               autospec=True,
+                               side_effect=Item.get_hist_pt_by_date) as lookup:
+            self.assertEqual(
+                self.my_portfolio.get_portfolio_balance(given_date=dat),
+                balance)
+            self.my_portfolio.get_portfolio_piechart(given_date=dat)
+            self.assertEqual(lookup.call_count, 0)
+
+            # a purchase only invalidates the Item it touches
+            item = self.my_portfolio.item_list[0]
+            item.purchase(when=date(2021, 8, 3), units_purchased=1,
+                          unit_price=50.0, fees=0.0)
+            self.assertAlmostEqual(
+                self.my_portfolio.get_portfolio_balance(given_date=dat),
+                balance + 50.0, places=4)
+            self.assertEqual(lookup.call_count, 1)
+
+            self.my_portfolio.remove_item(item)
+            self.assertAlmostEqual(
+                self.my_portfolio.get_portfolio_balance(given_date=dat),
+                balance - 100.0, places=4)
+            self.assertEqual(lookup.call_count, 1)
+
+        self.my_portfolio.currency = 'USD'
+        vector = self.provider.fetch(dat, 'EUR', ('USD',))
+        self.assertAlmostEqual(
+            self.my_portfolio.get_portfolio_balance(given_date=dat),
+            (balance - 100.0) * vector['USD'], places=4)
+
+
+class TestConcurrentPortfolio(TestCase):
+
+    """ Class to test a Portfolio shared between threads """
+
+    WRITERS = 4
+    PURCHASES = 150
+    READERS = 4
+
+    def setUp(self):
+        """ Concurrent Portfolio with one stock, 1 unit at 10 a purchase """
+
+        self.my_portfolio = Portfolio(name='Shared', description='Shared',
+                                      currency='EUR', concurrent=True)
+        self.item = self.my_portfolio.add_item(
+            category='asset', subcategory='stock', currency='EUR',
+            name='ACME', description='Stock')
+        # switch threads as often as possible to shake out races
+        self.switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+
+    def tearDown(self):
+        sys.setswitchinterval(self.switch_interval)
+
+    def test_stress(self):
+        """ Valuations never see half a purchase or half an added Item """
+
+        dat = date(2021, 1, 1)
+        errors = []
+        done = threading.Event()
+
+        def buy(writer):
+            try:
+                for i in range(TestConcurrentPortfolio.PURCHASES):
+                    # back-dated purchases shift every later HistoryPoint
+                    when = date(2020, 1 + (i * 7 + writer) % 12, 1 + i % 28)
+                    self.assertTrue(self.item.purchase(
+                        when=when, units_purchased=1, unit_price=10.0,
+                        fees=0.0))
+                    if i % 50 == 0:
+                        self.my_portfolio.add_item(
+                            category='asset', subcategory='account',
+                            currency='EUR', name=f"cash{writer}{i}",
+                            description='Empty account')
+            except Exception as error:
+                errors.append(error)
+
+        def value():
+            try:
+                while not done.is_set():
+                    with self.my_portfolio.lock.reading():
+                        balance = self.my_portfolio.get_portfolio_balance(dat)
+                        purchases = len(self.item.ledger)
+                        units, _, value = self.item.get_totals(dat)
+                        piechart = self.my_portfolio.get_portfolio_piechart(
+                            dat) if purchases else {'stock': 100.0}
+                    self.assertEqual(units, purchases)
+                    self.assertEqual(value, 10.0 * purchases)
+                    self.assertEqual(balance, 10.0 * purchases)
+                    self.assertAlmostEqual(piechart['stock'], 100.0)
+            except Exception as error:
+                errors.append(error)
+
+        readers = [threading.Thread(target=value)
+                   for _ in range(TestConcurrentPortfolio.READERS)]
+        writers = [threading.Thread(target=buy, args=(writer,))
+                   for writer in range(TestConcurrentPortfolio.WRITERS)]
+        for thread in readers + writers:
+            thread.start()
+        for thread in writers:
+            thread.join()
+        done.set()
+        for thread in readers:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        purchases = TestConcurrentPortfolio.WRITERS * \
+            TestConcurrentPortfolio.PURCHASES
+        self.assertEqual(len(self.item.ledger), purchases)
+        self.assertEqual(len(self.my_portfolio.item_list),
+                         1 + TestConcurrentPortfolio.WRITERS * 3)
+        self.assertEqual(self.my_portfolio.get_portfolio_balance(dat),
+                         10.0 * purchases)
+
+    def test_set_attribute(self):
+        """ Setting an indexed attribute waits for the readers """
+
+        renamed = threading.Event()
+
+        def rename():
+            self.item.subcategory = 'fund'
+            renamed.set()
+
+        with self.my_portfolio.lock.reading():
+            thread = threading.Thread(target=rename, daemon=True)
+            thread.start()
+            self.assertFalse(renamed.wait(0.1))
+            self.assertEqual(self.my_portfolio.get_items(
+                subcategory='stock'), [self.item])
+        self.assertTrue(renamed.wait(5))
+        thread.join(5)
+        self.assertEqual(self.my_portfolio.get_items(subcategory='fund'),
+                         [self.item])